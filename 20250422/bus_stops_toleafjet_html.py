@@ -1,5 +1,6 @@
 import json
 import folium
+from cycu11022101.tile_builder import read_bus_info, read_stop_geojson, tile_pyramid
 
 def geojson_to_html(geojson_file, output_html):
     """
@@ -15,8 +16,9 @@ def geojson_to_html(geojson_file, output_html):
     # Create a Folium map
     m = folium.Map(location=[0, 0], zoom_start=2)
 
-    # Add GeoJSON data to the map
-    folium.GeoJson(geojson_data).add_to(m)
+    # Add GeoJSON data to the map and zoom to it
+    layer = folium.GeoJson(geojson_data).add_to(m)
+    m.fit_bounds(layer.get_bounds())
 
     # Save the map to an HTML file
     m.save(output_html)
@@ -25,10 +27,31 @@ def geojson_to_html(geojson_file, output_html):
 # geojson_to_html('bus_stops.geojson', 'bus_stops_map.html')
 
 
+def geojson_to_tiles(geojson_file, output_folder, bus_info_folder=None):
+    """
+    Pre-renders the GeoJSON stops, and the route lines of a BUS_INFO folder if given, into a
+    vector tile pyramid with a viewer (index.html) that loads only the tiles in view.
+
+    :param geojson_file: Path to the input GeoJSON file.
+    :param output_folder: Folder for the {z}/{x}/{y}.pbf tiles, metadata.json and index.html.
+    :param bus_info_folder: Optional folder of bus_route_{rid}_{direction}.csv files.
+    :return: The tile_report of the build.
+    """
+    pyramid = tile_pyramid()
+    if bus_info_folder:
+        pyramid.add_lines('routes', read_bus_info(bus_info_folder)[1])
+    pyramid.add_points('stops', read_stop_geojson(geojson_file), min_zoom=13)
+    return pyramid.build(output_folder, title='Bus Stops')
+
+
 if __name__ == "__main__":
     # 指定輸入的 GeoJSON 檔案和輸出的 PNG 檔案
     inputfile = "20250422/bus_stops.geojson"
     outputfile = "bus_stops.html"
 
     # 繪製並儲存圖形
-    geojson_to_html(inputfile, outputfile)
\ No newline at end of file
+    geojson_to_html(inputfile, outputfile)
+
+    # 站牌多時改用預先切好的向量圖磚：瀏覽器只下載畫面內的圖磚（需以 HTTP 開啟，例如 python -m http.server -d bus_stops_tiles）
+    report = geojson_to_tiles(inputfile, "bus_stops_tiles")
+    print(f"已產生 {report.tiles} 張圖磚（{report.bytes_written / 1024:.0f} KiB）到 {report.output_folder}")
\ No newline at end of file
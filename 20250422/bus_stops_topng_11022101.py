@@ -11,6 +11,11 @@ def draw_geojson_to_png(inputfile: str, outputfile: str):
         print(f"🚫 找不到檔案：{inputfile}")
         return
 
+    # 輸出檔比 GeoJSON 新就不必再以 300 dpi 重畫一次
+    if os.path.exists(outputfile) and os.path.getmtime(outputfile) >= os.path.getmtime(inputfile):
+        print(f"✅ 圖已是最新：{outputfile}")
+        return
+
     # 讀取 GeoJSON 資料
     bus_stops = gpd.read_file(inputfile)
 
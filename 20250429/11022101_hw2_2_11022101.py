@@ -4,6 +4,7 @@ import csv
 import matplotlib.pyplot as plt
 import pandas as pd
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+from cycu11022101.eta import eta_columns, eta_status
 from hw2_2_finals_finsh import BusRouteInfo  # 引入 BusRouteInfo 類別
 
 def plot_route_with_arrival_times_and_icons(routeid: str, direction: str, target_stop_number: str = None):
@@ -39,15 +40,17 @@ def plot_route_with_arrival_times_and_icons(routeid: str, direction: str, target
     else:
         print(f"❌ 找不到小人圖示：{person_icon_path}")
 
+    # 到站時間先一次正規化為狀態與秒數（見 cycu11022101.eta），不再逐列處理字串
+    df = df.join(eta_columns(df['arrival_info']))
+
     # 在地圖上標記每個車站
     for _, row in df.iterrows():
-        arrival_info = row['arrival_info']
         lat, lon = row['latitude'], row['longitude']
         stop_number = row['stop_number']
 
-        if arrival_info.isdigit():  # 如果到達時間是數字
-            plt.text(lon, lat, f"{arrival_info} 分鐘", fontsize=10, color='red', ha='center', va='center')
-        elif arrival_info == "進站中" and bus_icon is not None:  # 如果是「進站中」
+        if row['eta_status'] == eta_status.MINUTES:  # 如果到達時間是分鐘數
+            plt.text(lon, lat, f"{int(row['eta_seconds'] // 60)} 分鐘", fontsize=10, color='red', ha='center', va='center')
+        elif row['eta_status'] == eta_status.ARRIVING and bus_icon is not None:  # 如果是「進站中」
             imagebox = OffsetImage(bus_icon, zoom=0.05)
             ab = AnnotationBbox(imagebox, (lon, lat), frameon=False)
             plt.gca().add_artist(ab)
@@ -3,13 +3,16 @@ import os
 import csv
 from playwright.sync_api import sync_playwright
 from bs4 import BeautifulSoup
-import time
+
+from cycu11022101.ebus_wait import wait_for_stop_list
+from cycu11022101.snapshot_store import get_store
 
 
 class BusRouteInfo:
     def __init__(self, routeid: str, direction: str = 'go'):
         self.rid = routeid
         self.content = None
+        self.wait_report = None
         self.url = f'https://ebus.gov.taipei/Route/StopsOfRoute?routeid={routeid}'
 
         if direction not in ['go', 'come']:
@@ -33,8 +36,9 @@ class BusRouteInfo:
             try:
                 # 等待站點資訊載入完成
                 page.wait_for_selector('.auto-list-stationlist', timeout=10000)  # 最多等待 10 秒
-                # 模擬等待更多時間以確保動態更新完成
-                time.sleep(5)  # 等待 5 秒
+                # 等到站名與到站時間都填好即繼續（最多 10 秒）
+                self.wait_report = wait_for_stop_list(page, self.direction)
+                print(f"等待到站時間 {self.wait_report.elapsed:.2f} 秒 ({self.wait_report.signal})")
                 self.content = page.content()
             except Exception as e:
                 print(f"等待目標元素時發生錯誤: {e}")
@@ -42,10 +46,10 @@ class BusRouteInfo:
             finally:
                 browser.close()
 
-        # 儲存 HTML 內容到檔案（除錯用）
-        os.makedirs("data", exist_ok=True)  # 確保資料夾存在
-        with open(f"data/ebus_taipei_{self.rid}_{self.direction}.html", "w", encoding="utf-8") as file:
-            file.write(self.content or "")
+        # 儲存 HTML 內容到快照庫 data/ebus_snapshots.sqlite3（除錯用）
+        if self.content:
+            os.makedirs("data", exist_ok=True)  # 確保資料夾存在
+            get_store("data").put(self.rid, self.direction, self.content)
 
     def _parse_and_save_to_csv(self):
         # 使用 BeautifulSoup 解析 HTML
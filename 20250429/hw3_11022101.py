@@ -4,6 +4,7 @@ import csv
 import matplotlib.pyplot as plt
 import pandas as pd
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+from cycu11022101.eta import eta_columns, eta_status
 from hw2_2_finals_finsh import BusRouteInfo  # 引入 BusRouteInfo 類別
 
 # 設置支持中文的字體
@@ -44,21 +45,19 @@ def plot_route_with_arrival_times_and_icons(routeid: str, direction: str, target
     else:
         print(f"❌ 找不到小人圖示：{person_icon_path}")
 
+    # 到站時間先一次正規化為狀態與秒數（見 cycu11022101.eta），不再逐列處理字串
+    df = df.join(eta_columns(df['arrival_info']))
+
     # 在地圖上標記每個車站
     for _, row in df.iterrows():
-        arrival_info = row['arrival_info']
         lat, lon = row['latitude'], row['longitude']
         stop_name = row['stop_name']
         stop_number = row['stop_number']
 
-        # 處理到達時間
-        if "分鐘" in arrival_info:
-            arrival_info = arrival_info.replace("分鐘", "").strip()
-
-        if arrival_info.isdigit():  # 如果到達時間是數字
+        if row['eta_status'] == eta_status.MINUTES:  # 如果到達時間是分鐘數
             # 顯示到達時間（例如：4min）
-            plt.text(lon + 0.0001, lat + 0.0001, f"{arrival_info}min", fontsize=10, color='red', ha='left', va='bottom')
-        elif arrival_info == "進站中" and bus_icon is not None:  # 如果是「進站中」
+            plt.text(lon + 0.0001, lat + 0.0001, f"{int(row['eta_seconds'] // 60)}min", fontsize=10, color='red', ha='left', va='bottom')
+        elif row['eta_status'] == eta_status.ARRIVING and bus_icon is not None:  # 如果是「進站中」
             # 顯示公車圖示
             imagebox = OffsetImage(bus_icon, zoom=0.05)
             ab = AnnotationBbox(imagebox, (lon, lat), frameon=False)
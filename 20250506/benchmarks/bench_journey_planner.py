@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks route_graph.plan over random stop pairs.
+
+The network is compiled from data/BUS_INFO (one pattern per route and direction), saved and
+reloaded to time both paths, then queried with the same random pairs for each transfer limit.
+
+Usage:
+    python benchmarks/bench_journey_planner.py [path/to/data/BUS_INFO] [path/to/bus_info_tist.csv] [queries]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from cycu11022101.journey_planner import route_graph
+
+
+def main(bus_info_folder: str = 'data/BUS_INFO', route_names_csv: str = 'data/bus_info_tist.csv',
+         count: int = 2000):
+    started = time.perf_counter()
+    graph = route_graph.from_bus_info_folder(bus_info_folder, route_names_csv)
+    compiled = time.perf_counter() - started
+    if not graph.stop_names:
+        print(f'No route CSVs found in {bus_info_folder}')
+        return
+
+    path = os.path.join(tempfile.mkdtemp(prefix='ebus_bench_'), 'graph.bin')
+    try:
+        graph.save(path)
+        started = time.perf_counter()
+        graph = route_graph.load(path)
+        loaded = time.perf_counter() - started
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+    print(f'{len(graph.stop_names)} stops, {len(graph.pattern_routes)} patterns, {len(graph.pattern_stops)} stop events')
+    print(f'compile {compiled:.2f}s, load {loaded * 1000:.1f}ms, {size / 1024:.0f} KiB on disk')
+
+    rnd = random.Random(42)
+    pairs = [(rnd.choice(graph.stop_names), rnd.choice(graph.stop_names)) for _ in range(int(count))]
+
+    print(f'{"max transfers":<15}{"queries/s":>12}{"us/query":>12}{"found":>9}')
+    for max_transfers in range(4):
+        started = time.perf_counter()
+        results = [graph.plan(origin, destination, max_transfers) for origin, destination in pairs]
+        elapsed = time.perf_counter() - started
+        found = sum(1 for journeys in results if journeys) / len(results)
+        print(f'{max_transfers:<15}{len(pairs) / elapsed:>12.0f}{elapsed / len(pairs) * 1e6:>12.0f}{found:>9.1%}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3], *[int(arg) for arg in sys.argv[3:4]])
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Compares taipei_route_info's 'chunked' and 'regex' parsers on every saved snapshot: whether
+they return the same stops, how long each takes, and how each copes with a stop that is missing
+one of its hidden inputs.
+
+Usage:
+    python benchmarks/bench_route_info_parser.py [path/to/data]
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+
+from cycu11022101.ebus_parse import direction_section
+from cycu11022101.ebus_taipei import taipei_route_info
+
+SNAPSHOT_NAME = re.compile(r'ebus_taipei_(.+)_(go|come)\.html$')
+LONGITUDE_INPUT = re.compile(r'<input[^>]+name="item\.Longitude"[^>]*>')
+
+
+def offline_route_info(route_id: str, direction: str, content: str) -> taipei_route_info:
+    route_info = taipei_route_info.__new__(taipei_route_info)
+    route_info.route_id = route_id
+    route_info.direction = direction
+    route_info.directions = [direction]
+    route_info.content = content
+    route_info.contents = {direction: content}
+    route_info.malformed_stops = []
+    route_info.parse_report = None
+    route_info.fetched_at = time.time()  # Both parsers date scheduled departures from the same moment
+    return route_info
+
+
+def parse(route_info: taipei_route_info, parser: str):
+    try:
+        dataframe = route_info.parse_route_info(parser)
+    except ValueError:
+        dataframe = None
+    return dataframe, route_info.parse_report.elapsed
+
+
+def as_chunked_types(dataframe):
+    dataframe = dataframe.astype({
+        "stop_id": "int64",
+        "stop_number": "int64",
+        "latitude": "float64",
+        "longitude": "float64",
+    })
+    dataframe["arrival_info"] = dataframe["arrival_info"].str.strip()
+    return dataframe
+
+
+def main(data_folder: str = 'data'):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(data_folder, 'ebus_taipei_*_*.html'))):
+        match = SNAPSHOT_NAME.search(os.path.basename(path))
+        content = open(path, encoding='utf-8').read()
+        if match and content:
+            pages.append((match.group(1), match.group(2), content))
+    if not pages:
+        print(f'No snapshots found in {data_folder}')
+        return
+
+    elapsed = {'chunked': 0.0, 'regex': 0.0}
+    differing = 0
+    for route_id, direction, content in pages:
+        route_info = offline_route_info(route_id, direction, content)
+        chunked, elapsed_chunked = parse(route_info, 'chunked')
+        regex, elapsed_regex = parse(route_info, 'regex')
+        elapsed['chunked'] += elapsed_chunked
+        elapsed['regex'] += elapsed_regex
+        if (chunked is None) != (regex is None):
+            differing += 1
+        elif chunked is not None and not chunked.equals(as_chunked_types(regex)):
+            differing += 1
+
+    print(f'{len(pages)} pages, {differing} with differing stops')
+    for parser, seconds in elapsed.items():
+        print(f'{parser:>8}: {seconds:.2f}s ({seconds / len(pages) * 1000:.2f} ms/page)')
+
+    # Drop the first stop's longitude input: the regex pairs that stop with its neighbour's coordinates
+    route_id, direction, content = max(pages, key=lambda page: len(page[2]))
+    broken = LONGITUDE_INPUT.sub('', content, count=1)
+    route_info = offline_route_info(route_id, 'go', broken)
+    chunked, _ = parse(route_info, 'chunked')
+    malformed = route_info.parse_report.malformed
+    regex, _ = parse(route_info, 'regex')
+    print(f'one missing input: chunked flags {malformed} stop(s) and starts at {chunked.iloc[0]["stop_name"]}; '
+          f'regex starts at {regex.iloc[0]["stop_name"]} with longitude {regex.iloc[0]["longitude"]} '
+          f'(the stop after has {chunked.iloc[0]["longitude"]})')
+
+    # No longitude inputs at all: the regex backtracks over every later stop for each <li>
+    items = direction_section(LONGITUDE_INPUT.sub('', content), 'go').split('<li>')
+    for stops in (4, 6, 8):
+        route_info = offline_route_info(route_id, 'go', '<li>'.join(items[:stops + 1]))
+        _, elapsed_chunked = parse(route_info, 'chunked')
+        _, elapsed_regex = parse(route_info, 'regex')
+        print(f'{stops} stops without longitude: chunked {elapsed_chunked * 1000:.2f} ms, '
+              f'regex {elapsed_regex * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks the single-pass stop extractor against the BeautifulSoup version it replaced in
+20250609/final_program.py, and checks both give identical stops, ETAs and warnings on every
+saved snapshot.
+
+The reference is a verbatim copy of the old ``extract_stops_from_soup``. The new
+``extract_stops_from_html`` is loaded from final_program.py without running its Selenium imports.
+
+Usage:
+    python benchmarks/bench_stop_extractor.py [path/to/data] [path/to/final_program.py]
+"""
+
+import ast
+import contextlib
+import glob
+import io
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from cycu11022101 import ebus_parse
+
+
+def extract_stops_from_soup(soup, direction_type, route_id):
+    stops_with_coords = []
+    estimated_times = {}
+
+    if direction_type == "去程":
+        direction_container = soup.find('div', id='GoDirectionRoute')
+    elif direction_type == "返程":
+        direction_container = soup.find('div', id='BackDirectionRoute')
+    else:
+        print(f"錯誤：未知方向類型 '{direction_type}'。")
+        return [], {}
+
+    if not direction_container:
+        print(f"未找到 {direction_type} 方向的內容容器。")
+        return [], {}
+
+    all_stop_list_items = direction_container.find_all('li')
+
+    if not all_stop_list_items:
+        print(f"在 {direction_type} 方向中未找到任何站牌列表項目。")
+        return [], {}
+
+    for item in all_stop_list_items:
+        item_html = str(item)
+
+        stop_name_tag = item.find('span', class_='auto-list-stationlist-place')
+        stop_name = stop_name_tag.get_text().strip() if stop_name_tag else "未知站名"
+
+        stop_id_match = re.search(r'<input[^>]+name="item\.UniStopId"[^>]+value="(\d+)"[^>]*>', item_html)
+        lat_match = re.search(r'<input[^>]+name="item\.Latitude"[^>]+value="([\d\.]+)"[^>]*>', item_html)
+        lon_match = re.search(r'<input[^>]+name="item\.Longitude"[^>]+value="([\d\.]+)"[^>]*>', item_html)
+
+        stop_id = int(stop_id_match.group(1)) if stop_id_match and stop_id_match.group(1).isdigit() else None
+        lat = float(lat_match.group(1)) if lat_match else None
+        lon = float(lon_match.group(1)) if lon_match else None
+
+        if lat is not None and lon is not None:
+            stops_with_coords.append({
+                "name": stop_name,
+                "lat": lat,
+                "lon": lon,
+                "stop_id": stop_id,
+                "direction": direction_type
+            })
+        else:
+            print(f"警告：站點 '{stop_name}' 經緯度無效，已跳過。")
+
+        eta_text = "查無資訊"
+        eta_tag_onroad = item.find('span', class_='eta_onroad')
+        if eta_tag_onroad and eta_tag_onroad.get_text().strip() != '':
+            eta_text = eta_tag_onroad.get_text().strip()
+        else:
+            eta_tag_static = item.find('span', class_='auto-list-stationlist-position-time')
+            if eta_tag_static and eta_tag_static.get_text().strip() != '':
+                eta_text = eta_tag_static.get_text().strip()
+        estimated_times[f"{stop_name}_{direction_type}"] = eta_text
+
+    return stops_with_coords, estimated_times
+
+
+def load_new_extractor(script_path: str):
+    tree = ast.parse(open(script_path, encoding='utf-8').read())
+    wanted = [node for node in tree.body if (
+        isinstance(node, ast.FunctionDef) and node.name in ('extract_stops_from_html', 'stops_from_records')
+        or isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'DIRECTION_KEYS' for t in node.targets)
+    )]
+    namespace = {'direction_section': ebus_parse.direction_section, 'iter_stops': ebus_parse.iter_stops}
+    exec(compile(ast.Module(body=wanted, type_ignores=[]), script_path, 'exec'), namespace)
+    return namespace['extract_stops_from_html']
+
+
+def run(extract, pages: list) -> tuple:
+    results = []
+    log = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        for content in pages:
+            for direction_type in ("去程", "返程"):
+                results.append(extract(content, direction_type))
+    return results, log.getvalue(), time.perf_counter() - started
+
+
+def main(data_folder: str = 'data', script_path: str = '20250609/final_program.py'):
+    paths = sorted(glob.glob(os.path.join(data_folder, 'ebus_taipei_*_*.html')))
+    pages = [open(path, encoding='utf-8').read() for path in paths]
+    pages = [content for content in pages if content]
+    if not pages:
+        print(f'No snapshots found in {data_folder}')
+        return
+
+    new_extract = load_new_extractor(script_path)
+    old_results, old_log, old_time = run(
+        lambda content, direction_type: extract_stops_from_soup(BeautifulSoup(content, 'html.parser'), direction_type, ''),
+        pages,
+    )
+    new_results, new_log, new_time = run(lambda content, direction_type: new_extract(content, direction_type, ''), pages)
+
+    mismatches = sum(1 for old, new in zip(old_results, new_results) if old != new)
+    stops = sum(len(stops) for stops, _ in new_results)
+    print(f'{len(pages)} pages, {len(old_results)} page directions, {stops} stops')
+    print(f'BeautifulSoup: {old_time:.1f}s ({len(pages) / old_time:.1f} pages/s)')
+    print(f'single pass:   {new_time:.2f}s ({len(pages) / new_time:.1f} pages/s), {old_time / new_time:.0f}x faster')
+    print(f'identical output: {mismatches == 0 and old_log == new_log} '
+          f'({mismatches} differing page directions, warnings {"match" if old_log == new_log else "differ"})')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
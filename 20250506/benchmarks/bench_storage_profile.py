@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks stop lookups on data_route_info_busstop before and after the storage profile.
+
+All data/BUS_INFO CSVs are loaded into a temporary database. One copy keeps SQLite's defaults
+and no secondary indexes; the other is opened through ``get_engine(profile='default')``, which
+applies the PRAGMAs and creates the indexes. The tracked hermes_ebus_taipei.sqlite3 is not touched.
+
+Usage:
+    python benchmarks/bench_storage_profile.py [path/to/data/BUS_INFO]
+"""
+
+import csv
+import glob
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from cycu11022101.ebus_db import DB_FILENAME, get_engine
+
+
+QUERIES = {
+    'stop_id': 'SELECT route_id, direction, stop_number FROM data_route_info_busstop WHERE stop_id = :stop_id',
+    'stop_name': 'SELECT route_id, direction, stop_number FROM data_route_info_busstop WHERE stop_name = :stop_name',
+    'route_order': (
+        'SELECT stop_name FROM data_route_info_busstop '
+        'WHERE route_id = :route_id AND direction = :direction ORDER BY stop_number'
+    ),
+    'bbox': (
+        'SELECT stop_id FROM data_route_info_busstop '
+        'WHERE latitude BETWEEN :lat0 AND :lat1 AND longitude BETWEEN :lon0 AND :lon1'
+    ),
+}
+
+
+def load_rows(bus_info_folder: str) -> list:
+    rows = []
+    for path in glob.glob(os.path.join(bus_info_folder, 'bus_route_*_*.csv')):
+        route_id, direction = os.path.basename(path)[len('bus_route_'):-len('.csv')].rsplit('_', 1)
+        with open(path, 'r', encoding='utf-8') as file:
+            for record in csv.DictReader(file):
+                try:
+                    rows.append({
+                        'stop_id': int(record['stop_id']),
+                        'arrival_info': record['arrival_info'],
+                        'stop_number': int(record['stop_number']),
+                        'stop_name': record['stop_name'],
+                        'latitude': float(record['latitude']),
+                        'longitude': float(record['longitude']),
+                        'direction': direction,
+                        'route_id': route_id,
+                    })
+                except (KeyError, ValueError):
+                    continue
+    return rows
+
+
+def build_plain_database(working_directory: str, rows: list):
+    engine = get_engine(working_directory, profile='plain')
+    with engine.begin() as connection:
+        for index in ('ix_busstop_stop_id', 'ix_busstop_stop_name',
+                      'ix_busstop_route_direction_number', 'ix_busstop_lat_lon'):
+            connection.execute(text(f'DROP INDEX IF EXISTS {index}'))
+        connection.execute(text(
+            'INSERT OR REPLACE INTO data_route_info_busstop VALUES '
+            '(:stop_id, :arrival_info, :stop_number, :stop_name, :latitude, :longitude, :direction, :route_id)'
+        ), rows)
+    engine.dispose()
+
+
+def make_params(rows: list, count: int) -> dict:
+    sample = random.Random(42).sample(rows, min(count, len(rows)))
+    return {
+        'stop_id': [{'stop_id': row['stop_id']} for row in sample],
+        'stop_name': [{'stop_name': row['stop_name']} for row in sample],
+        'route_order': [{'route_id': row['route_id'], 'direction': row['direction']} for row in sample],
+        'bbox': [{
+            'lat0': row['latitude'] - 0.002, 'lat1': row['latitude'] + 0.002,
+            'lon0': row['longitude'] - 0.002, 'lon1': row['longitude'] + 0.002,
+        } for row in sample],
+    }
+
+
+def time_queries(engine, params: dict) -> dict:
+    results = {}
+    with engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            stmt = text(sql)
+            started = time.perf_counter()
+            for values in params[name]:
+                connection.execute(stmt, values).fetchall()
+            results[name] = (time.perf_counter() - started) / len(params[name]) * 1e6
+    return results
+
+
+def main(bus_info_folder: str = 'data/BUS_INFO', count: int = 500):
+    rows = load_rows(bus_info_folder)
+    if not rows:
+        print(f'No CSV rows found in {bus_info_folder}')
+        return
+
+    params = make_params(rows, count)
+    workdir = tempfile.mkdtemp(prefix='ebus_bench_')
+    try:
+        plain_dir = os.path.join(workdir, 'plain')
+        tuned_dir = os.path.join(workdir, 'tuned')
+        os.makedirs(plain_dir)
+        os.makedirs(tuned_dir)
+
+        build_plain_database(plain_dir, rows)
+        shutil.copy(os.path.join(plain_dir, DB_FILENAME), os.path.join(tuned_dir, DB_FILENAME))
+
+        before = time_queries(get_engine(plain_dir, profile='plain'), params)
+        after = time_queries(get_engine(tuned_dir, profile='default'), params)
+
+        print(f'{len(rows)} stop rows, {count} lookups per query')
+        print(f'{"query":<12}{"before (us)":>14}{"after (us)":>14}{"speed-up":>10}')
+        for name in QUERIES:
+            print(f'{name:<12}{before[name]:>14.1f}{after[name]:>14.1f}{before[name] / after[name]:>9.1f}x')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+This module keeps a single headless Chromium alive for the Taipei eBus fetchers and hands out
+recycled pages, so a crawl over many routes pays the browser start-up cost only once. Pages skip
+images, fonts, stylesheets and third-party requests unless blocking is turned off.
+"""
+
+from contextlib import contextmanager
+from playwright.sync_api import sync_playwright
+
+from cycu11022101.request_filter import filter_stats, request_filter
+
+
+class ebus_browser_pool:
+    """
+    Long-lived Playwright browser that lends out pages and recycles them between routes.
+
+    The pool is bound to the thread that created it, as the Playwright sync API is.
+    """
+
+    def __init__(self, size: int = 2, headless: bool = True, max_page_uses: int = 50,
+                 block_requests: bool = True):
+        """
+        Initializes the pool without launching the browser; it starts on first use.
+
+        Args:
+            size (int): Maximum number of idle pages kept open for reuse.
+            headless (bool): Whether Chromium runs without a window.
+            max_page_uses (int): Number of loads after which a page and its context are discarded.
+            block_requests (bool): Whether pages abort images, fonts, stylesheets and third-party requests.
+        """
+        self.size = size
+        self.headless = headless
+        self.max_page_uses = max_page_uses
+        self.block_requests = block_requests
+
+        self._playwright = None
+        self._browser = None
+        self._idle = []  # [context, page, uses, filter]
+
+        self.pages_created = 0
+        self.pages_served = 0
+        self.last_page_stats = None
+        self.requests = 0
+        self.blocked = 0
+        self.bytes_loaded = 0
+
+    def start(self):
+        """
+        Launches Chromium if it is not running yet.
+
+        Returns:
+            ebus_browser_pool: The pool itself, for chaining.
+        """
+        if self._browser is None:
+            self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(headless=self.headless)
+        return self
+
+    def _new_entry(self) -> list:
+        context = self._browser.new_context()
+        page = context.new_page()
+        page_filter = request_filter().install(context) if self.block_requests else None
+        self.pages_created += 1
+        return [context, page, 0, page_filter]
+
+    def _measure(self, entry: list):
+        page, page_filter = entry[1], entry[3]
+        if page_filter is None:
+            return
+        try:
+            stats = page_filter.measure(page)
+        except Exception:
+            stats = page_filter.stats()
+        page_filter.reset()
+
+        self.last_page_stats = stats
+        self.requests += stats.requests
+        self.blocked += stats.blocked
+        self.bytes_loaded += stats.bytes_loaded
+
+    def _release(self, entry: list, healthy: bool):
+        context, page, _, _ = entry
+        entry[2] += 1
+
+        if healthy and entry[2] < self.max_page_uses and len(self._idle) < self.size:
+            try:
+                # Drop the previous route's timers and sockets before the page is lent out again
+                page.goto('about:blank')
+                self._idle.append(entry)
+                return
+            except Exception:
+                pass
+
+        try:
+            context.close()
+        except Exception:
+            pass
+
+    def warm(self, count: int = None) -> int:
+        """
+        Opens idle pages ahead of the first request, so the first loads skip context creation.
+
+        Args:
+            count (int): Number of idle pages wanted; the pool size if omitted.
+
+        Returns:
+            int: Number of idle pages.
+        """
+        self.start()
+        count = self.size if count is None else min(count, self.size)
+        while len(self._idle) < count:
+            self._idle.append(self._new_entry())
+        return len(self._idle)
+
+    def acquire(self) -> list:
+        """
+        Takes a page out of the pool for as long as the caller needs it, e.g. to keep a route's tab open.
+
+        Returns:
+            list: The pool entry; its page is ``entry[1]``. Hand it back with ``release``.
+        """
+        self.start()
+        entry = self._idle.pop() if self._idle else self._new_entry()
+        self.pages_served += 1
+        return entry
+
+    def release(self, entry: list, healthy: bool = True):
+        """
+        Hands back a page taken with ``acquire``; it is recycled if healthy, otherwise discarded.
+
+        Args:
+            entry (list): The pool entry returned by ``acquire``.
+            healthy (bool): Whether the page can be lent out again.
+        """
+        self._measure(entry)
+        self._release(entry, healthy)
+
+    @contextmanager
+    def page(self):
+        """
+        Lends out a page for the duration of a ``with`` block and recycles it afterwards.
+
+        A page whose block raised is discarded instead of being returned to the pool. When blocking is on,
+        the page's request counts are left in ``last_page_stats`` after the block.
+
+        Yields:
+            playwright.sync_api.Page: A blank page ready for ``goto``.
+        """
+        entry = self.acquire()
+        healthy = False
+        try:
+            yield entry[1]
+            healthy = True
+        finally:
+            self.release(entry, healthy)
+
+    def stats(self) -> filter_stats:
+        """
+        Returns the request counters of every page load since the pool was created.
+
+        Returns:
+            filter_stats: Requests, blocked requests and bytes loaded; blocked_by_reason is left empty.
+        """
+        return filter_stats(self.requests, self.blocked, self.bytes_loaded, {})
+
+    def close(self):
+        """
+        Closes every pooled page, the browser and the Playwright driver.
+        """
+        for context, _, _, _ in self._idle:
+            try:
+                context.close()
+            except Exception:
+                pass
+        self._idle = []
+
+        if self._browser is not None:
+            self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
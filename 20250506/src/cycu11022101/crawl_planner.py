@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+This module plans incremental crawls of the StopsOfRoute pages. It keeps, per route and direction,
+when the page was last fetched, a hash of its parsed stop list and how many fetches in a row have
+failed (table data_route_fetch). A crawl then fetches only the route directions that are new,
+failed last time or older than the TTL, and rewrites a route's CSV only when its stops changed.
+"""
+
+import csv
+import glob
+import hashlib
+import os
+import time
+from typing import NamedTuple
+
+from sqlalchemy import select
+
+from cycu11022101.ebus_db import get_engine, route_fetch_table, upsert_rows
+from cycu11022101.ebus_merge import BUS_INFO_PATTERN, route_key_from_path
+
+
+DEFAULT_TTL = 24 * 60 * 60
+
+# Columns of a BUS_INFO row that describe the stop itself; arrival_info changes on every fetch
+STOP_KEY_COLUMNS = ('stop_number', 'stop_name', 'stop_id', 'latitude', 'longitude')
+
+
+class crawl_job(NamedTuple):
+    """
+    One route direction due for a fetch.
+
+    Attributes:
+        route_id (str): The ID of the bus route.
+        direction (str): 'go' or 'come'.
+        reason (str): Why it is due: 'new', 'failed' or 'stale'.
+    """
+    route_id: str
+    direction: str
+    reason: str
+
+
+def stops_hash(stops: list) -> str:
+    """
+    Hashes a parsed stop list, ignoring the arrival times.
+
+    Args:
+        stops (list): Rows in BUS_INFO CSV order (arrival_info, stop_number, stop_name, stop_id,
+            latitude, longitude), as returned by the crawlers' parsers.
+
+    Returns:
+        str: SHA-1 hex digest of the stop columns of every row, in order.
+    """
+    digest = hashlib.sha1()
+    for row in stops:
+        digest.update('\x1f'.join(str(value).strip() for value in row[1:]).encode('utf-8'))
+        digest.update(b'\x1e')
+    return digest.hexdigest()
+
+
+class crawl_planner:
+    """
+    Decides which route directions a crawl fetches and records the outcome of every fetch.
+    """
+
+    def __init__(self, working_directory: str = 'data', ttl: float = DEFAULT_TTL):
+        """
+        Initializes the planner and loads the fetch history into memory.
+
+        Args:
+            working_directory (str): Directory holding the database file.
+            ttl (float): Seconds after a successful fetch before a route direction is fetched again.
+        """
+        self.working_directory = working_directory
+        self.ttl = ttl
+        self.engine = get_engine(working_directory)
+        with self.engine.connect() as connection:
+            self.history = {
+                (row['route_id'], row['direction']): dict(row)
+                for row in connection.execute(select(route_fetch_table)).mappings()
+            }
+
+    def _write(self, row: dict):
+        self.history[(row['route_id'], row['direction'])] = row
+        upsert_rows(self.engine, route_fetch_table, [row])
+
+    def seed_from_folder(self, input_folder: str = 'data/BUS_INFO') -> int:
+        """
+        Records CSVs written before the planner existed as successful fetches at their modification time,
+        so a first planned crawl does not refetch everything.
+
+        Args:
+            input_folder (str): Folder holding bus_route_{route_id}_{direction}.csv files.
+
+        Returns:
+            int: Number of route directions seeded.
+        """
+        rows = []
+        for path in glob.glob(os.path.join(input_folder, BUS_INFO_PATTERN)):
+            route_id, direction = route_key_from_path(path)
+            if (route_id, direction) in self.history:
+                continue
+
+            with open(path, newline='', encoding='utf-8-sig') as file:
+                stops = list(csv.reader(file))[1:]
+            fetched_at = os.path.getmtime(path)
+            row = {
+                'route_id': route_id,
+                'direction': direction,
+                'last_attempt_at': fetched_at,
+                'last_success_at': fetched_at,
+                'stops_hash': stops_hash(stops),
+                'stop_count': len(stops),
+                'failure_count': 0,
+                'last_error': None,
+            }
+            self.history[(route_id, direction)] = row
+            rows.append(row)
+
+        upsert_rows(self.engine, route_fetch_table, rows)
+        return len(rows)
+
+    def plan(self, route_ids: list, directions: tuple = ('go', 'come'), now: float = None) -> list:
+        """
+        Lists the route directions due for a fetch, in the order of route_ids.
+
+        A route direction is due if it has never been fetched, if its last fetch failed,
+        or if its last successful fetch is at least ``ttl`` seconds old.
+
+        Args:
+            route_ids (list): Route IDs from the route list.
+            directions (tuple): Directions to consider for every route.
+            now (float): Reference time in seconds since the epoch; the current time if omitted.
+
+        Returns:
+            list: crawl_job tuples.
+        """
+        now = time.time() if now is None else now
+        jobs = []
+        for route_id in route_ids:
+            for direction in directions:
+                row = self.history.get((route_id, direction))
+                if row is None:
+                    jobs.append(crawl_job(route_id, direction, 'new'))
+                elif row['failure_count']:
+                    jobs.append(crawl_job(route_id, direction, 'failed'))
+                elif row['last_success_at'] is None or now - row['last_success_at'] >= self.ttl:
+                    jobs.append(crawl_job(route_id, direction, 'stale'))
+        return jobs
+
+    def record_success(self, route_id: str, direction: str, stops: list) -> bool:
+        """
+        Records a successful fetch and tells whether the stop list differs from the last one.
+
+        Args:
+            route_id (str): The ID of the bus route.
+            direction (str): 'go' or 'come'.
+            stops (list): The parsed stops, in BUS_INFO CSV order.
+
+        Returns:
+            bool: True if the stops changed (or were never recorded) and should be written.
+        """
+        previous = self.history.get((route_id, direction)) or {}
+        digest = stops_hash(stops)
+        now = time.time()
+        self._write({
+            'route_id': route_id,
+            'direction': direction,
+            'last_attempt_at': now,
+            'last_success_at': now,
+            'stops_hash': digest,
+            'stop_count': len(stops),
+            'failure_count': 0,
+            'last_error': None,
+        })
+        return previous.get('stops_hash') != digest
+
+    def record_failure(self, route_id: str, direction: str, error: str = None):
+        """
+        Records a failed fetch; the route direction stays due until a fetch succeeds.
+
+        Args:
+            route_id (str): The ID of the bus route.
+            direction (str): 'go' or 'come'.
+            error (str): What went wrong.
+        """
+        previous = self.history.get((route_id, direction)) or {}
+        self._write({
+            'route_id': route_id,
+            'direction': direction,
+            'last_attempt_at': time.time(),
+            'last_success_at': previous.get('last_success_at'),
+            'stops_hash': previous.get('stops_hash'),
+            'stop_count': previous.get('stop_count'),
+            'failure_count': (previous.get('failure_count') or 0) + 1,
+            'last_error': error,
+        })
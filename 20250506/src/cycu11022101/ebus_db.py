@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+This module holds the SQLite storage shared by the Taipei eBus classes: the table definitions,
+a cached engine per working directory and storage profile, and batched upserts that write many
+rows in one transaction with ``INSERT ... ON CONFLICT DO UPDATE``.
+"""
+
+import atexit
+import re
+from sqlalchemy import (
+    create_engine, event, MetaData, Table, Column, Index, String, Float, Integer, bindparam, update
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+DB_FILENAME = 'hermes_ebus_taipei.sqlite3'
+
+metadata = MetaData()
+
+route_list_table = Table(
+    'data_route_list', metadata,
+    Column('route_id', String, primary_key=True),
+    Column('route_name', String),
+    Column('route_data_updated', Integer, default=0),
+)
+
+route_info_busstop_table = Table(
+    'data_route_info_busstop', metadata,
+    Column('stop_id', Integer),
+    Column('arrival_info', String),
+    Column('stop_number', Integer, primary_key=True),
+    Column('stop_name', String),
+    Column('latitude', Float),
+    Column('longitude', Float),
+    Column('direction', String, primary_key=True),
+    Column('route_id', String, primary_key=True),
+)
+
+# Source files already merged into data_route_info_busstop, for incremental merges
+merge_manifest_table = Table(
+    'data_merge_manifest', metadata,
+    Column('path', String, primary_key=True),
+    Column('route_id', String),
+    Column('direction', String),
+    Column('mtime_ns', Integer),
+    Column('size', Integer),
+    Column('sha1', String),
+    Column('rows', Integer),
+)
+
+# Per route direction fetch history, for incremental crawls
+route_fetch_table = Table(
+    'data_route_fetch', metadata,
+    Column('route_id', String, primary_key=True),
+    Column('direction', String, primary_key=True),
+    Column('last_attempt_at', Float),
+    Column('last_success_at', Float),
+    Column('stops_hash', String),
+    Column('stop_count', Integer),
+    Column('failure_count', Integer, default=0),
+    Column('last_error', String),
+)
+
+# When data_route_list was last refreshed from each source, for the route catalogue's TTL
+route_catalogue_table = Table(
+    'data_route_catalogue', metadata,
+    Column('source', String, primary_key=True),
+    Column('refreshed_at', Float),
+    Column('route_count', Integer),
+)
+
+# Precomputed travel-time quantiles per route segment (from_stop to from_stop + 1) and time-of-day bin;
+# bin_start is the bin's first minute of the day, or -1 for the whole day
+segment_time_table = Table(
+    'data_segment_time', metadata,
+    Column('route_id', String, primary_key=True),
+    Column('direction', String, primary_key=True),
+    Column('from_stop', Integer, primary_key=True),
+    Column('bin_start', Integer, primary_key=True),
+    Column('quantile', Float, primary_key=True),
+    Column('bin_minutes', Integer),
+    Column('samples', Integer),
+    Column('seconds', Float),
+)
+
+# Append-only ETA observations, one table per day (data_eta_YYYYMMDD) so a day is scanned or dropped as a whole.
+# The day tables live in their own MetaData and are created on first write.
+ETA_TABLE_PREFIX = 'data_eta_'
+eta_metadata = MetaData()
+_eta_tables = {}
+
+
+def eta_observation_table(day: str) -> Table:
+    """
+    Returns the ETA observation table of one day.
+
+    Args:
+        day (str): The day as YYYYMMDD, in Taipei time.
+
+    Returns:
+        Table: The table definition; it may not exist in a database yet.
+
+    Raises:
+        ValueError: If the day is not eight digits.
+    """
+    if not re.fullmatch(r'\d{8}', day or ''):
+        raise ValueError(f"Day must be YYYYMMDD, not '{day}'")
+
+    table = _eta_tables.get(day)
+    if table is None:
+        table = Table(
+            f'{ETA_TABLE_PREFIX}{day}', eta_metadata,
+            Column('observed_at', Float),
+            Column('route_id', String),
+            Column('direction', String),
+            Column('stop_number', Integer),
+            Column('stop_id', Integer),
+            Column('status', Integer),
+            Column('seconds', Integer),
+        )
+        _eta_tables[day] = table
+    return table
+
+
+# Secondary indexes for lookups by stop, by route order and by bounding box
+busstop_indexes = [
+    Index('ix_busstop_stop_id', route_info_busstop_table.c.stop_id),
+    Index('ix_busstop_stop_name', route_info_busstop_table.c.stop_name),
+    Index('ix_busstop_route_direction_number', route_info_busstop_table.c.route_id,
+          route_info_busstop_table.c.direction, route_info_busstop_table.c.stop_number),
+    Index('ix_busstop_lat_lon', route_info_busstop_table.c.latitude, route_info_busstop_table.c.longitude),
+]
+
+# PRAGMAs applied to every new connection; 'plain' keeps SQLite's defaults
+STORAGE_PROFILES = {
+    'plain': {},
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative = KiB
+        'temp_store': 'MEMORY',
+    },
+    'bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -256 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+_engines = {}
+
+
+def _apply_pragmas(engine, pragmas: dict):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    event.listen(engine, 'connect', on_connect)
+
+
+def create_indexes(engine):
+    """
+    Creates the secondary indexes on data_route_info_busstop if they do not exist yet.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Target database.
+    """
+    for index in busstop_indexes:
+        index.create(engine, checkfirst=True)
+
+
+def get_engine(working_directory: str = 'data', profile: str = 'default'):
+    """
+    Returns the engine for a working directory's database, creating it, its tables and
+    indexes once per storage profile.
+
+    Args:
+        working_directory (str): Directory holding hermes_ebus_taipei.sqlite3.
+        profile (str): Storage profile from STORAGE_PROFILES. 'default' enables WAL,
+            synchronous=NORMAL, mmap and a 64 MiB page cache; 'bulk' relaxes sync to OFF
+            for one-off loads; 'plain' leaves SQLite's defaults.
+
+    Returns:
+        sqlalchemy.engine.Engine: The cached engine.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile '{profile}'")
+
+    key = (working_directory, profile)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = create_engine(f'sqlite:///{working_directory}/{DB_FILENAME}')
+        _apply_pragmas(engine, STORAGE_PROFILES[profile])
+        metadata.create_all(engine)
+        create_indexes(engine)
+        _engines[key] = engine
+    return engine
+
+
+def upsert_rows(engine, table: Table, rows: list, connection=None) -> int:
+    """
+    Inserts rows, updating the non-key columns of rows whose primary key already exists.
+
+    All rows go through one executemany call inside a single transaction.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Target database.
+        table (Table): Table to write.
+        rows (list): Dicts keyed by column name; every dict must have the same keys.
+        connection (sqlalchemy.engine.Connection): Open connection to join its transaction instead.
+
+    Returns:
+        int: Number of rows written.
+    """
+    if not rows:
+        return 0
+
+    keys = [column.name for column in table.primary_key.columns]
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: stmt.excluded[name] for name in rows[0] if name not in keys},
+    )
+
+    if connection is not None:
+        connection.execute(stmt, rows)
+    else:
+        with engine.begin() as connection:
+            connection.execute(stmt, rows)
+    return len(rows)
+
+
+class route_status_writer:
+    """
+    Buffers route_data_updated changes and writes them in batches instead of one commit per route.
+    """
+
+    def __init__(self, engine, flush_every: int = 50):
+        """
+        Initializes the writer and registers a flush at interpreter exit.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): Database holding data_route_list.
+            flush_every (int): Number of buffered routes that triggers a write.
+        """
+        self.engine = engine
+        self.flush_every = flush_every
+        self.pending = {}
+        self.flushed = 0
+        atexit.register(self.flush)
+
+    def set(self, route_id: str, route_data_updated: int):
+        """
+        Records a route's status; the last value set for a route before a flush wins.
+
+        Args:
+            route_id (str): The ID of the bus route.
+            route_data_updated (int): 0 = not fetched, 1 = updated, 2 = failed.
+        """
+        self.pending[route_id] = route_data_updated
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes every buffered status in one executemany UPDATE.
+
+        Returns:
+            int: Number of routes written.
+        """
+        if not self.pending:
+            return 0
+
+        stmt = (
+            update(route_list_table)
+            .where(route_list_table.c.route_id == bindparam('b_route_id'))
+            .values(route_data_updated=bindparam('b_status'))
+        )
+        rows = [{'b_route_id': route_id, 'b_status': status} for route_id, status in self.pending.items()]
+        with self.engine.begin() as connection:
+            connection.execute(stmt, rows)
+
+        self.flushed += len(rows)
+        self.pending = {}
+        return len(rows)
+
+    def close(self):
+        """
+        Flushes the buffer and drops the exit hook.
+        """
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+This module fetches the Taipei eBus StopsOfRoute page over plain HTTP. The stop IDs and
+coordinates are server-rendered as hidden <input> fields, so static route geometry can be read
+without starting a browser. Saved snapshots can be read through the same helpers for offline use.
+"""
+
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cycu11022101.ebus_parse import direction_section
+from cycu11022101.snapshot_store import get_store, has_store
+
+
+STOPS_OF_ROUTE_URL = 'https://ebus.gov.taipei/Route/StopsOfRoute?routeid={route_id}'
+ROUTE_LIST_URL = 'https://ebus.gov.taipei/ebus?ct=all'
+
+STOP_FIELDS = ('name="item.UniStopId"', 'name="item.Latitude"', 'name="item.Longitude"')
+
+_session = None
+
+
+def get_session(pool_maxsize: int = 8) -> requests.Session:
+    """
+    Returns the module's shared keep-alive session, creating it on first use.
+
+    Args:
+        pool_maxsize (int): Maximum number of pooled connections to the eBus host.
+
+    Returns:
+        requests.Session: Session whose connections are reused across requests.
+    """
+    global _session
+    if _session is None:
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        _session = requests.Session()
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+        _session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) cycu11022101',
+            'Connection': 'keep-alive',
+        })
+    return _session
+
+
+def fetch_stops_of_route(route_id: str, session: requests.Session = None, timeout: float = 10.0) -> str:
+    """
+    Downloads the server-rendered StopsOfRoute HTML for a route.
+
+    Args:
+        route_id (str): The unique identifier of the bus route.
+        session (requests.Session): Session to use; the shared session if omitted.
+        timeout (float): Request timeout in seconds.
+
+    Returns:
+        str: The HTML document.
+
+    Raises:
+        requests.HTTPError: If the server answers with an error status.
+    """
+    session = session or get_session()
+    response = session.get(STOPS_OF_ROUTE_URL.format(route_id=route_id), timeout=timeout)
+    response.raise_for_status()
+    response.encoding = 'utf-8'
+    return response.text
+
+
+def fetch_route_list(session: requests.Session = None, timeout: float = 10.0) -> str:
+    """
+    Downloads the route list page, whose collapsed panels carry every ``javascript:go`` route link.
+
+    Args:
+        session (requests.Session): Session to use; the shared session if omitted.
+        timeout (float): Request timeout in seconds.
+
+    Returns:
+        str: The HTML document.
+
+    Raises:
+        requests.HTTPError: If the server answers with an error status.
+    """
+    session = session or get_session()
+    response = session.get(ROUTE_LIST_URL, timeout=timeout)
+    response.raise_for_status()
+    response.encoding = 'utf-8'
+    return response.text
+
+
+def has_stop_fields(content: str, direction: str) -> bool:
+    """
+    Checks whether a document carries the hidden stop fields for a direction.
+
+    Args:
+        content (str): The HTML document.
+        direction (str): 'go' or 'come'.
+
+    Returns:
+        bool: True if UniStopId, Latitude and Longitude inputs are all present.
+    """
+    if not content:
+        return False
+    # Without the direction's container, look through the whole document
+    section = direction_section(content, direction) or content
+    return all(field in section for field in STOP_FIELDS)
+
+
+def snapshot_path(route_id: str, direction: str, working_directory: str = 'data') -> str:
+    """
+    Returns the path of a saved ``ebus_taipei_{route_id}_{direction}.html`` snapshot.
+    """
+    return os.path.join(working_directory, f'ebus_taipei_{route_id}_{direction}.html')
+
+
+def read_snapshot(route_id: str, direction: str, working_directory: str = 'data') -> str:
+    """
+    Reads a saved snapshot written by the crawlers: the latest page in the working directory's
+    snapshot store, or a loose ebus_taipei_{route_id}_{direction}.html file if the store has none.
+
+    Args:
+        route_id (str): The unique identifier of the bus route.
+        direction (str): 'go' or 'come'.
+        working_directory (str): Directory holding the snapshots.
+
+    Returns:
+        str: The HTML document.
+
+    Raises:
+        FileNotFoundError: If no snapshot exists for the route and direction.
+    """
+    if has_store(working_directory):
+        try:
+            return get_store(working_directory).read(route_id, direction)
+        except FileNotFoundError:
+            pass
+
+    with open(snapshot_path(route_id, direction, working_directory), 'r', encoding='utf-8') as file:
+        return file.read()
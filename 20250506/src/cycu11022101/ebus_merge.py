@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+This module merges the per-route CSVs written by the crawlers (data/BUS_INFO/bus_route_{rid}_{direction}.csv)
+into the data_route_info_busstop table. Every row keeps the route ID and direction taken from its file
+name. A file that repeats a stop_number within its direction (some loop routes do) keeps the first
+row of each number, as the table is keyed on it, and the dropped rows are counted in the report.
+Files are parsed in a process pool and written in batched transactions. A manifest of each
+file's mtime, size and SHA-1, keyed by the file's path relative to the merged folder, lets later
+runs re-read only the files that changed.
+"""
+
+import csv
+import glob
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from sqlalchemy import and_, delete, or_, select
+
+from cycu11022101.ebus_db import get_engine, merge_manifest_table, route_info_busstop_table, upsert_rows
+
+
+BUS_INFO_PATTERN = 'bus_route_*_*.csv'
+
+# Below this many changed files, parsing in-process is cheaper than starting a pool
+POOL_MIN_FILES = 32
+
+
+class merge_report(NamedTuple):
+    """
+    Summary of one merge run.
+
+    Attributes:
+        scanned (int): CSV files found in the folder.
+        merged (int): Files whose rows were (re)written.
+        unchanged (int): Files skipped because their mtime/size or content hash matched the manifest.
+        removed (int): Route directions whose file was deleted since the last merge, and whose rows were dropped.
+        rows (int): Stop rows written.
+        skipped_rows (int): Rows dropped because a field could not be converted.
+        duplicate_rows (int): Rows dropped because an earlier row of the same file had their stop_number.
+        duplicate_files (list): Paths of the files that had such rows.
+        elapsed (float): Seconds spent.
+    """
+    scanned: int
+    merged: int
+    unchanged: int
+    removed: int
+    rows: int
+    skipped_rows: int
+    duplicate_rows: int
+    duplicate_files: list
+    elapsed: float
+
+
+def route_key_from_path(path: str) -> tuple:
+    """
+    Splits ``bus_route_{route_id}_{direction}.csv`` into (route_id, direction).
+    """
+    return tuple(os.path.basename(path)[len('bus_route_'):-len('.csv')].rsplit('_', 1))
+
+
+def manifest_key(path: str, input_folder: str) -> str:
+    """
+    Returns the manifest key of a CSV: its path relative to the merged folder, so the same
+    folder spelled differently ('data/BUS_INFO', './data/BUS_INFO') maps to the same entries.
+    """
+    return os.path.relpath(path, input_folder).replace(os.sep, '/')
+
+
+def read_bus_info_csv(path: str) -> tuple:
+    """
+    Reads and hashes one route CSV. Runs in pool workers, so it only returns plain data.
+
+    Args:
+        path (str): Path of the CSV file.
+
+    Returns:
+        tuple: (path, sha1 hex digest, list of row dicts, number of rows skipped,
+            number of rows dropped for repeating an earlier row's stop_number).
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    route_id, direction = route_key_from_path(path)
+    rows = []
+    seen = set()
+    skipped = duplicates = 0
+    for record in csv.DictReader(io.StringIO(data.decode('utf-8-sig'))):
+        try:
+            row = {
+                'stop_id': int(record['stop_id']),
+                'arrival_info': record['arrival_info'],
+                'stop_number': int(record['stop_number']),
+                'stop_name': record['stop_name'],
+                'latitude': float(record['latitude']),
+                'longitude': float(record['longitude']),
+                'direction': direction,
+                'route_id': route_id,
+            }
+        except (KeyError, TypeError, ValueError):
+            skipped += 1
+            continue
+
+        # The upsert would let a later row with the same key overwrite this one
+        if row['stop_number'] in seen:
+            duplicates += 1
+            continue
+        seen.add(row['stop_number'])
+        rows.append(row)
+
+    return path, hashlib.sha1(data).hexdigest(), rows, skipped, duplicates
+
+
+def _write_batch(engine, batch: list, stats: dict):
+    replaced = [item for item in batch if item['rows'] is not None]
+    with engine.begin() as connection:
+        if replaced:
+            # Drop the old rows first so stops removed from a route do not linger
+            connection.execute(delete(route_info_busstop_table).where(or_(*[
+                and_(route_info_busstop_table.c.route_id == item['route_id'],
+                     route_info_busstop_table.c.direction == item['direction'])
+                for item in replaced
+            ])))
+            rows = [row for item in replaced for row in item['rows']]
+            stats['rows'] += upsert_rows(engine, route_info_busstop_table, rows, connection=connection)
+
+        upsert_rows(engine, merge_manifest_table, [{
+            'path': item['path'],
+            'route_id': item['route_id'],
+            'direction': item['direction'],
+            'mtime_ns': item['mtime_ns'],
+            'size': item['size'],
+            'sha1': item['sha1'],
+            'rows': item['row_count'],
+        } for item in batch], connection=connection)
+
+
+def merge_bus_info_folder(input_folder: str = 'data/BUS_INFO', working_directory: str = 'data',
+                          workers: int = None, batch_files: int = 100, full: bool = False) -> merge_report:
+    """
+    Merges the route CSVs of a folder into data_route_info_busstop.
+
+    Args:
+        input_folder (str): Folder holding bus_route_{rid}_{direction}.csv files.
+        working_directory (str): Directory holding the database file.
+        workers (int): Worker processes; defaults to the CPU count. 1 parses in-process.
+        batch_files (int): Files written per transaction.
+        full (bool): Re-read every file, ignoring the manifest.
+
+    Returns:
+        merge_report: What was merged.
+    """
+    started = time.perf_counter()
+    engine = get_engine(working_directory, profile='bulk')
+
+    paths = sorted(glob.glob(os.path.join(input_folder, BUS_INFO_PATTERN)))
+    with engine.connect() as connection:
+        manifest = {row.path: row for row in connection.execute(select(merge_manifest_table))}
+
+    # Files whose mtime and size match the manifest are skipped without being read
+    pending = {}
+    for path in paths:
+        stat = os.stat(path)
+        known = manifest.get(manifest_key(path, input_folder))
+        if full or known is None or known.mtime_ns != stat.st_mtime_ns or known.size != stat.st_size:
+            pending[path] = stat
+
+    stats = {'merged': 0, 'rows': 0, 'skipped_rows': 0, 'duplicate_rows': 0, 'duplicate_files': []}
+    unchanged = len(paths) - len(pending)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(pending) >= POOL_MIN_FILES else None
+    try:
+        results = (executor.map(read_bus_info_csv, pending, chunksize=16) if executor
+                   else map(read_bus_info_csv, pending))
+
+        batch = []
+        for path, sha1, rows, skipped, duplicates in results:
+            route_id, direction = route_key_from_path(path)
+            key = manifest_key(path, input_folder)
+            known = manifest.get(key)
+            content_changed = full or known is None or known.sha1 != sha1
+            batch.append({
+                'path': key,
+                'route_id': route_id,
+                'direction': direction,
+                'mtime_ns': pending[path].st_mtime_ns,
+                'size': pending[path].st_size,
+                'sha1': sha1,
+                # Touched but identical files only refresh their manifest entry
+                'rows': rows if content_changed else None,
+                'row_count': len(rows),
+            })
+            if content_changed:
+                stats['merged'] += 1
+                stats['skipped_rows'] += skipped
+                if duplicates:
+                    stats['duplicate_rows'] += duplicates
+                    stats['duplicate_files'].append(path)
+            else:
+                unchanged += 1
+
+            if len(batch) >= batch_files:
+                _write_batch(engine, batch, stats)
+                batch = []
+        if batch:
+            _write_batch(engine, batch, stats)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    # Files that disappeared since the last merge take their rows with them. A stale entry whose
+    # route direction is still in this scan (e.g. one recorded under an older path spelling) only
+    # loses its manifest entry, never the rows this run just wrote.
+    present = {manifest_key(path, input_folder) for path in paths}
+    scanned = {route_key_from_path(path) for path in paths}
+    stale = [row for key, row in manifest.items() if key not in present]
+    removed = {(row.route_id, row.direction) for row in stale} - scanned
+    if stale:
+        with engine.begin() as connection:
+            for route_id, direction in removed:
+                connection.execute(delete(route_info_busstop_table).where(and_(
+                    route_info_busstop_table.c.route_id == route_id,
+                    route_info_busstop_table.c.direction == direction,
+                )))
+            connection.execute(delete(merge_manifest_table).where(
+                merge_manifest_table.c.path.in_([row.path for row in stale])
+            ))
+
+    return merge_report(
+        scanned=len(paths),
+        merged=stats['merged'],
+        unchanged=unchanged,
+        removed=len(removed),
+        rows=stats['rows'],
+        skipped_rows=stats['skipped_rows'],
+        duplicate_rows=stats['duplicate_rows'],
+        duplicate_files=stats['duplicate_files'],
+        elapsed=time.perf_counter() - started,
+    )
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+This module extracts bus stops from StopsOfRoute pages without building a DOM.
+
+The direction's container is split into one chunk per <li>. A chunk laid out the way the site
+renders a stop is read with a single anchored pattern; any other chunk is scanned field by field
+with one regular expression that yields every classed leaf <span> and hidden stop <input>.
+Every pattern is bounded by a tag or attribute, so parsing is linear in the page size, and a
+stop missing a field is reported as such rather than paired with a neighbour's value.
+
+Only the standard library is used, so clients that merely read stop records need not import
+requests or SQLAlchemy.
+"""
+
+import html
+import re
+from typing import Iterator, NamedTuple
+
+
+DIRECTION_CONTAINER_IDS = {
+    'go': 'GoDirectionRoute',
+    'come': 'BackDirectionRoute',
+}
+
+_LI_RE = re.compile(r'<li[\s>]')
+_STOP_RE = re.compile(
+    r'[^<]*<a [^>]*>\s*<span class="[^"]*">\s*'
+    r'<span class="auto-list-stationlist-position((?:\s[^"]*)?)">([^<]*)</span>\s*'
+    r'<span class="auto-list-stationlist-number">([^<]*)</span>\s*'
+    r'<span class="auto-list-stationlist-place">([^<]*)</span>\s*'
+    r'<input[^>]+name="item\.UniStopId"[^>]+value="([^"]*)"[^>]*>\s*'
+    r'<input[^>]+name="item\.Latitude"[^>]+value="([^"]*)"[^>]*>\s*'
+    r'<input[^>]+name="item\.Longitude"[^>]+value="([^"]*)"'
+)
+_FIELD_RE = re.compile(
+    r'<(?:'
+    r'span class="([^"]*)"[^>]*>([^<]*)</span>'
+    r'|input[^>]+name="item\.(UniStopId|Latitude|Longitude)"[^>]+value="([^"]*)"'
+    r')'
+)
+_DECIMAL_RE = re.compile(r'[\d.]+')
+
+POSITION_CLASS = 'auto-list-stationlist-position'
+
+REQUIRED_FIELDS = ('name', 'number', 'stop_id', 'latitude', 'longitude')
+
+
+class stop_record(NamedTuple):
+    """
+    One stop as listed on a StopsOfRoute page.
+
+    Attributes:
+        name (str): Stop name, or None if the item has no name span.
+        number (int): Sequence number along the route, or None.
+        stop_id (int): UniStopId, or None if missing or not numeric.
+        latitude (float): Latitude, or None if missing or not numeric.
+        longitude (float): Longitude, or None if missing or not numeric.
+        arrival_info (str): Text of the position span ('' if empty or missing), e.g. '5分鐘' or '進站中'.
+        arrival_kind (str): The position span's modifier class: 'time', 'now', 'none' or ''.
+        eta_onroad (str): Text of a span.eta_onroad, if the page has one ('' otherwise).
+    """
+    name: str
+    number: int
+    stop_id: int
+    latitude: float
+    longitude: float
+    arrival_info: str
+    arrival_kind: str
+    eta_onroad: str
+
+
+class parse_report(NamedTuple):
+    """
+    Outcome of parsing one page: a single route direction, or with ``direction='both'`` the go
+    and come lists together, with the counts and time summed over both.
+
+    Attributes:
+        parser (str): The parser that ran: 'chunked' or 'regex'.
+        stops (int): Number of well-formed stops returned, over every direction parsed.
+        malformed (int): Number of stops flagged as malformed and left out, over every direction parsed.
+        elapsed (float): Seconds spent parsing.
+    """
+    parser: str
+    stops: int
+    malformed: int
+    elapsed: float
+
+
+def _text(raw: str) -> str:
+    return (html.unescape(raw) if '&' in raw else raw).strip()
+
+
+def _decimal(raw: str):
+    return float(raw) if raw and _DECIMAL_RE.fullmatch(raw) and raw.count('.') <= 1 else None
+
+
+def _arrival_kind(classes: list) -> str:
+    return next((name[len(POSITION_CLASS) + 1:] for name in classes if name.startswith(POSITION_CLASS + '-')), '')
+
+
+def _record(name, number: str, stop_id: str, latitude, longitude, arrival_info: str = '', arrival_kind: str = '',
+            eta_onroad: str = '') -> stop_record:
+    return stop_record(
+        name=name,
+        number=int(number) if number.isdigit() else None,
+        stop_id=int(stop_id) if stop_id.isdigit() else None,
+        latitude=_decimal(latitude),
+        longitude=_decimal(longitude),
+        arrival_info=arrival_info,
+        arrival_kind=arrival_kind,
+        eta_onroad=eta_onroad,
+    )
+
+
+def _scan_stop(chunk: str) -> stop_record:
+    fields = {}
+    for span_class, span_text, input_name, input_value in _FIELD_RE.findall(chunk):
+        if input_name:
+            fields.setdefault(input_name, input_value)
+            continue
+
+        classes = span_class.split()
+        if 'auto-list-stationlist-place' in classes:
+            fields.setdefault('name', _text(span_text))
+        elif 'auto-list-stationlist-number' in classes:
+            fields.setdefault('number', span_text.strip())
+        elif POSITION_CLASS in classes:
+            if 'arrival_info' not in fields:
+                fields['arrival_info'] = _text(span_text)
+                fields['arrival_kind'] = _arrival_kind(classes)
+        elif 'eta_onroad' in classes:
+            fields.setdefault('eta_onroad', _text(span_text))
+
+    return _record(
+        fields.get('name'), fields.get('number', ''), fields.get('UniStopId', ''),
+        fields.get('Latitude'), fields.get('Longitude'),
+        fields.get('arrival_info', ''), fields.get('arrival_kind', ''), fields.get('eta_onroad', ''),
+    )
+
+
+def _read_stop(chunk: str) -> stop_record:
+    match = _STOP_RE.match(chunk)
+    if not match or 'eta_onroad' in chunk:
+        return _scan_stop(chunk)
+
+    position_class, arrival_info, number, name, stop_id, latitude, longitude = match.groups()
+    return _record(_text(name), number.strip(), stop_id, latitude, longitude,
+                   _text(arrival_info), _arrival_kind(position_class.split()))
+
+
+def direction_section(content: str, direction: str) -> str:
+    """
+    Cuts the stop list of one direction out of a StopsOfRoute document, from its container to the
+    end of its list.
+
+    Args:
+        content (str): The StopsOfRoute HTML document.
+        direction (str): 'go' or 'come'.
+
+    Returns:
+        str: The container markup, or None if the page has no container for the direction.
+
+    Raises:
+        ValueError: If the direction is not 'go' or 'come'.
+    """
+    if direction not in DIRECTION_CONTAINER_IDS:
+        raise ValueError("Direction must be 'go' or 'come'")
+
+    start = content.find(f'id="{DIRECTION_CONTAINER_IDS[direction]}"') if content else -1
+    if start < 0:
+        return None
+    end = content.find('</ul>', start)
+    return content[start:end] if end >= 0 else content[start:]
+
+
+def iter_stops(content: str, direction: str) -> Iterator[stop_record]:
+    """
+    Yields the stops of one direction in page order.
+
+    The first occurrence of each field within a stop's <li> wins, like a DOM ``find``.
+
+    Args:
+        content (str): The StopsOfRoute HTML document.
+        direction (str): 'go' or 'come'.
+
+    Yields:
+        stop_record: One record per <li> in the direction's list.
+
+    Raises:
+        ValueError: If the direction is not 'go' or 'come'.
+    """
+    section = direction_section(content, direction)
+    if not section:
+        return
+
+    for chunk in _LI_RE.split(section)[1:]:
+        yield _read_stop(chunk)
+
+
+def missing_fields(record: stop_record) -> tuple:
+    """
+    Lists the required fields a stop is missing.
+
+    Args:
+        record (stop_record): A stop yielded by ``iter_stops``.
+
+    Returns:
+        tuple: Names from REQUIRED_FIELDS whose value is None; empty for a well-formed stop.
+    """
+    return tuple(field for field in REQUIRED_FIELDS if getattr(record, field) is None)
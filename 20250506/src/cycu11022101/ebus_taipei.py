@@ -5,29 +5,45 @@ saves the rendered HTML and CSV file, and stores the parsed data in a SQLite dat
 """
 
 import re
+import time
 import pandas as pd
-from playwright.sync_api import sync_playwright
-from sqlalchemy import create_engine, Column, String, Float, Integer, Boolean
+from sqlalchemy import Column, String, Integer, Boolean
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from cycu11022101.browser_pool import ebus_browser_pool
+from cycu11022101.ebus_wait import wait_for_route_links, wait_for_stop_list, wait_report
+from cycu11022101.ebus_http import fetch_stops_of_route, has_stop_fields, read_snapshot
+from cycu11022101.ebus_parse import direction_section, iter_stops, missing_fields, parse_report
+from cycu11022101.eta import append_eta_observations, eta_columns
+from cycu11022101.fetch_scheduler import fetch_scheduler
+from cycu11022101.route_catalogue import mark_refreshed
+from cycu11022101.ebus_db import (
+    get_engine, upsert_rows, route_list_table, route_info_busstop_table, route_status_writer
+)
+
 
 class taipei_route_list:
     """
     Manages fetching, parsing, and storing route data for Taipei eBus.
     """
 
-    def __init__(self, working_directory: str = 'data'):
+    def __init__(self, working_directory: str = 'data', browser_pool: ebus_browser_pool = None,
+                 status_flush_every: int = 50):
         """
         Initializes the taipei_route_list, fetches webpage content,
         configures the ORM, and sets up the SQLite database.
 
         Args:
             working_directory (str): Directory to store the HTML and database files.
+            browser_pool (ebus_browser_pool): Shared browser to fetch with; a one-off browser is used if omitted.
+            status_flush_every (int): Number of route status changes buffered before they are written.
         """
         self.working_directory = working_directory
+        self.browser_pool = browser_pool
         self.url = 'https://ebus.gov.taipei/ebus?ct=all'
         self.content = None
+        self.wait_report = None
 
         # Fetch webpage content
         self._fetch_content()
@@ -44,26 +60,30 @@ class taipei_route_list:
 
         self.orm = bus_route_orm
 
-        # Create and connect to the SQLite engine
-        self.engine = create_engine(f'sqlite:///{self.working_directory}/hermes_ebus_taipei.sqlite3')
-        self.engine.connect()
+        # Connect to the package's shared SQLite engine
+        self.engine = get_engine(self.working_directory)
         Base.metadata.create_all(self.engine)
 
         # Create session
         Session = sessionmaker(bind=self.engine)
         self.session = Session()
 
+        # Route status changes are buffered and written in batches
+        self.status_writer = route_status_writer(self.engine, flush_every=status_flush_every)
+
     def _fetch_content(self):
         """
         Fetches the webpage content using Playwright and saves it as a local HTML file.
         """
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(self.url)
-            page.wait_for_timeout(3000)  # Wait for the page to load
-            self.content = page.content()
-            browser.close()
+        pool = self.browser_pool or ebus_browser_pool(size=0)
+        try:
+            with pool.page() as page:
+                page.goto(self.url)
+                self.wait_report = wait_for_route_links(page)  # Wait until the route links are in the DOM
+                self.content = page.content()
+        finally:
+            if pool is not self.browser_pool:
+                pool.close()
 
         # Save the rendered HTML to a file for inspection
         html_file_path = f'{self.working_directory}/hermes_ebus_taipei_route_list.html'
@@ -92,12 +112,14 @@ class taipei_route_list:
 
     def save_to_database(self):
         """
-        Saves the parsed bus route data to the SQLite database via SQLAlchemy ORM.
-        """
-        for _, row in self.dataframe.iterrows():
-            self.session.merge(self.orm(route_id=row['route_id'], route_name=row['route_name']))
+        Saves the parsed bus route catalogue to the SQLite database in one batched upsert.
 
-        self.session.commit()
+        Existing routes keep their route_data_updated flag; only their names are refreshed.
+        The refresh is recorded so route catalogues treat the table as fresh.
+        """
+        rows = self.dataframe[["route_id", "route_name"]].to_dict("records")
+        upsert_rows(self.engine, route_list_table, rows)
+        mark_refreshed(self.engine, 'browser', len(rows))
 
     def read_from_database(self) -> pd.DataFrame:
         """
@@ -106,32 +128,40 @@ class taipei_route_list:
         Returns:
             pd.DataFrame: DataFrame containing bus route data.
         """
+        self.status_writer.flush()
         query = self.session.query(self.orm)
         self.db_dataframe = pd.read_sql(query.statement, self.session.bind)
         return self.db_dataframe
 
     def set_route_data_updated(self, route_id: str, route_data_updated: int = 1):
         """
-        Sets the route_data_updated flag in the database.
+        Sets the route_data_updated flag; the write is buffered until the next flush.
 
         Args:
             route_id (str): The ID of the bus route.
             route_data_updated (bool): The value to set for the route_data_updated flag.
         """
-        self.session.query(self.orm).filter_by(route_id=route_id).update({"route_data_updated": route_data_updated})
-        self.session.commit()
+        self.status_writer.set(route_id, route_data_updated)
 
 
     def set_route_data_unexcepted(self, route_id: str):
-        self.session.query(self.orm).filter_by(route_id=route_id).update({"route_data_updated": 2 })
-        self.session.commit()
+        self.status_writer.set(route_id, 2)
+
+    def flush_status(self) -> int:
+        """
+        Writes the buffered route status changes now.
+
+        Returns:
+            int: Number of routes written.
+        """
+        return self.status_writer.flush()
 
     def __del__(self):
         """
-        Closes the session and engine when the object is deleted.
+        Flushes pending status changes and closes the session when the object is deleted.
         """
+        self.status_writer.close()
         self.session.close()
-        self.engine.dispose()
 
 
 class taipei_route_info:
@@ -139,40 +169,123 @@ class taipei_route_info:
     Manages fetching, parsing, and storing bus stop data for a specified route and direction.
     """
 
-    def __init__(self, route_id: str, direction: str = 'go', working_directory: str = 'data'):
+    def __init__(self, route_id: str, direction: str = 'go', working_directory: str = 'data',
+                 browser_pool: ebus_browser_pool = None, backend: str = 'browser', http_session=None):
         """
         Initializes the taipei_route_info by setting parameters and fetching the webpage content.
 
         Args:
             route_id (str): The unique identifier of the bus route.
-            direction (str): The direction of the route; must be either 'go' or 'come'.
+            direction (str): The direction of the route: 'go', 'come', or 'both' to read the two
+                directions from a single page load.
+            browser_pool (ebus_browser_pool): Shared browser to fetch with; a one-off browser is used if omitted.
+            backend (str): 'browser' renders the page with Playwright; 'http' downloads the
+                server-rendered HTML and falls back to the browser if the stop fields are missing;
+                'snapshot' reads the saved page from the working directory's snapshot store
+                (or a loose ebus_taipei_{route_id}_{direction}.html file).
+            http_session (requests.Session): Session for the 'http' backend; the shared session if omitted.
         """
         self.route_id = route_id
         self.direction = direction
         self.content = None
+        self.contents = {}
+        self.wait_report = None
         self.url = f'https://ebus.gov.taipei/Route/StopsOfRoute?routeid={route_id}'
         self.working_directory = working_directory
+        self.browser_pool = browser_pool
+        self.backend = backend
+        self.http_session = http_session
+        self.fetched_with = None
+        self.fetched_at = None
+        self.malformed_stops = []
+        self.parse_report = None
+
+        if self.direction not in ['go', 'come', 'both']:
+            raise ValueError("Direction must be 'go', 'come' or 'both'")
+
+        self.directions = ['go', 'come'] if self.direction == 'both' else [self.direction]
 
-        if self.direction not in ['go', 'come']:
-            raise ValueError("Direction must be 'go' or 'come'")
+        if self.backend not in ['browser', 'http', 'snapshot']:
+            raise ValueError("Backend must be 'browser', 'http' or 'snapshot'")
 
         self._fetch_content()
 
     def _fetch_content(self):
         """
-        Fetches the webpage content using Playwright and writes the rendered HTML to a local file.
-        """
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(self.url)
+        Fetches the webpage content with the selected backend.
 
-            if self.direction == 'come':
-                page.click('a.stationlist-come-go-gray.stationlist-come')
+        ``contents`` maps each requested direction to the HTML its stops are parsed from, and
+        ``content`` is the first of them. The 'http' backend falls back to the browser when the
+        hidden stop fields are missing or the request fails. ETA spans are filled by JavaScript,
+        so only the browser backend yields arrival_info.
+        """
+        self.fetched_at = time.time()
+        if self.backend == 'snapshot':
+            self._read_snapshots()
+            self.fetched_with = 'snapshot'
+        else:
+            content = None
+            if self.backend == 'http':
+                try:
+                    content = fetch_stops_of_route(self.route_id, session=self.http_session)
+                except Exception:
+                    content = None
+
+            # Every StopsOfRoute document carries both directions, so one download serves 'both'
+            if content is not None and any(has_stop_fields(content, direction) for direction in self.directions):
+                self.contents = {direction: content for direction in self.directions}
+                self.fetched_with = 'http'
+            else:
+                self._fetch_with_browser()
+                self.fetched_with = 'browser'
+
+        self.content = self.contents[self.directions[0]]
+
+    def _read_snapshots(self):
+        """
+        Reads each direction's saved snapshot; with 'both', a direction without one is read
+        from the other direction's page, which lists its stops without ETAs.
+        """
+        for direction in self.directions:
+            try:
+                self.contents[direction] = read_snapshot(self.route_id, direction, self.working_directory)
+            except FileNotFoundError:
+                if self.direction != 'both':
+                    raise
+
+        if not self.contents:
+            raise FileNotFoundError(f"No snapshot found for route ID {self.route_id}")
+        for direction in self.directions:
+            self.contents.setdefault(direction, next(iter(self.contents.values())))
+
+    def _fetch_with_browser(self):
+        """
+        Fetches the webpage content using Playwright and writes the rendered HTML to a local file.
 
-            page.wait_for_timeout(3000)  # Wait for page render
-            self.content = page.content()
-            browser.close()
+        With 'both' the page is loaded once: the go list is read first, then the come tab is
+        clicked on the same page so its ETAs render, and the DOM is read again.
+        """
+        pool = self.browser_pool or ebus_browser_pool(size=0)
+        try:
+            with pool.page() as page:
+                page.goto(self.url)
+
+                reports = []
+                for direction in self.directions:
+                    if direction == 'come':
+                        page.click('a.stationlist-come-go-gray.stationlist-come')
+
+                    reports.append(wait_for_stop_list(page, direction))  # Wait until stops and ETAs render
+                    self.contents[direction] = page.content()
+
+                self.wait_report = reports[0] if len(reports) == 1 else wait_report(
+                    all(report.ready for report in reports),
+                    sum(report.elapsed for report in reports),
+                    '+'.join(report.signal for report in reports),
+                )
+        finally:
+            if pool is not self.browser_pool:
+                pool.close()
 
         # Save the rendered HTML to a file for inspection
         self.html_file = f"{self.working_directory}/ebus_taipei_{self.route_id}.html"
@@ -180,83 +293,131 @@ class taipei_route_info:
         # with open(html_file, "w", encoding="utf-8") as file:
         #     file.write(self.content)
 
-    def parse_route_info(self) -> pd.DataFrame:
+    def parse_route_info(self, parser: str = 'chunked') -> pd.DataFrame:
         """
         Parses the fetched HTML content to extract bus stop data.
 
+        Only the containers of this object's directions are scanned, as every StopsOfRoute
+        document carries both directions; with 'both' the go rows come first. The 'chunked' parser collects each stop's fields
+        within its own <li>, so its cost is linear in the page size; stops missing a field are
+        left out and kept in ``malformed_stops``. The 'regex' parser is the original single
+        pattern. Either way the outcome and parse time are kept in ``parse_report``, and
+        arrival_info is normalized into eta_status and eta_seconds columns (see cycu11022101.eta).
+
+        Args:
+            parser (str): 'chunked' or 'regex'.
+
         Returns:
             pd.DataFrame: DataFrame containing bus stop information.
 
         Raises:
-            ValueError: If no data is found for the route.
+            ValueError: If the parser is unknown or no data is found for the route.
         """
-        pattern = re.compile(
-            r'<li>.*?<span class="auto-list-stationlist-position.*?">(.*?)</span>\s*'
-            r'<span class="auto-list-stationlist-number">\s*(\d+)</span>\s*'
-            r'<span class="auto-list-stationlist-place">(.*?)</span>.*?'
-            r'<input[^>]+name="item\.UniStopId"[^>]+value="(\d+)"[^>]*>.*?'
-            r'<input[^>]+name="item\.Latitude"[^>]+value="([\d\.]+)"[^>]*>.*?'
-            r'<input[^>]+name="item\.Longitude"[^>]+value="([\d\.]+)"[^>]*>',
-            re.DOTALL
+        if parser not in ['chunked', 'regex']:
+            raise ValueError("Parser must be 'chunked' or 'regex'")
+
+        started = time.perf_counter()
+        self.malformed_stops = []
+        bus_routes = []
+        for direction in self.directions:
+            if parser == 'chunked':
+                stops = self._parse_chunked(self.contents[direction], direction)
+            else:
+                stops = self._parse_regex(self.contents[direction], direction)
+            bus_routes.extend(stop + (direction,) for stop in stops)
+        self.parse_report = parse_report(
+            parser, len(bus_routes), len(self.malformed_stops), time.perf_counter() - started
         )
 
-        matches = pattern.findall(self.content)
-        if not matches:
+        if not bus_routes:
             raise ValueError(f"No data found for route ID {self.route_id}")
 
-        bus_routes = [m for m in matches]
         self.dataframe = pd.DataFrame(
             bus_routes,
-            columns=["arrival_info", "stop_number", "stop_name", "stop_id", "latitude", "longitude"]
+            columns=["arrival_info", "stop_number", "stop_name", "stop_id", "latitude", "longitude", "direction"]
         )
 
-        self.dataframe["direction"] = self.direction
         self.dataframe["route_id"] = self.route_id
+        self.dataframe = self.dataframe.join(eta_columns(self.dataframe["arrival_info"], self.fetched_at))
 
         return self.dataframe
 
-    def save_to_database(self):
+    def _parse_chunked(self, content: str, direction: str) -> list:
         """
-        Saves the parsed bus stop data to the SQLite database.
+        Collects the stops of a direction one <li> at a time, flagging malformed ones.
         """
-        db_file = f"{self.working_directory}/hermes_ebus_taipei.sqlite3"
-        engine = create_engine(f"sqlite:///{db_file}")
-        Base = declarative_base()
+        bus_routes = []
+        for record in iter_stops(content, direction):
+            if missing_fields(record):
+                self.malformed_stops.append(record)
+                continue
+            bus_routes.append((record.arrival_info, record.number, record.name,
+                               record.stop_id, record.latitude, record.longitude))
+        return bus_routes
+
+    def _parse_regex(self, content: str, direction: str) -> list:
+        """
+        Matches the stops of a direction with the original pattern, whose fields are joined by lazy gaps.
 
-        class bus_stop_orm(Base):
-            __tablename__ = "data_route_info_busstop"
-            stop_id = Column(Integer)
-            arrival_info = Column(String)
-            stop_number = Column(Integer, primary_key=True)
-            stop_name = Column(String)
-            latitude = Column(Float)
-            longitude = Column(Float)
-            direction = Column(String, primary_key=True)
-            route_id = Column(String, primary_key=True)
+        A stop missing one of the hidden inputs makes this pattern run on into the next
+        stop, so its fields can be paired with a neighbour's; nothing is flagged.
+        """
+        pattern = re.compile(
+            r'<li>.*?<span class="auto-list-stationlist-position.*?">(.*?)</span>\s*'
+            r'<span class="auto-list-stationlist-number">\s*(\d+)</span>\s*'
+            r'<span class="auto-list-stationlist-place">(.*?)</span>.*?'
+            r'<input[^>]+name="item\.UniStopId"[^>]+value="(\d+)"[^>]*>.*?'
+            r'<input[^>]+name="item\.Latitude"[^>]+value="([\d\.]+)"[^>]*>.*?'
+            r'<input[^>]+name="item\.Longitude"[^>]+value="([\d\.]+)"[^>]*>',
+            re.DOTALL
+        )
 
-        Base.metadata.create_all(engine)
-        Session = sessionmaker(bind=engine)
-        session = Session()
+        return pattern.findall(direction_section(content, direction) or content)
 
-        for _, row in self.dataframe.iterrows():
-            session.merge(bus_stop_orm(
-                stop_id=row["stop_id"],
-                arrival_info=row["arrival_info"],
-                stop_number=row["stop_number"],
-                stop_name=row["stop_name"],
-                latitude=row["latitude"],
-                longitude=row["longitude"],
-                direction=row["direction"],
-                route_id=row["route_id"]
-            ))
+    def save_to_database(self, record_etas: bool = True):
+        """
+        Saves the parsed bus stop data to the SQLite database in one batched upsert.
+
+        Args:
+            record_etas (bool): Whether a page rendered by the browser also appends its ETAs to the
+                day's observation table; other backends carry no ETAs and never do.
+        """
+        save_stops_to_database(self.dataframe, self.working_directory)
+        if record_etas and self.fetched_with == 'browser':
+            append_eta_observations(get_engine(self.working_directory), self.dataframe, self.fetched_at)
 
-        session.commit()
-        session.close()
+
+def save_stops_to_database(dataframe: pd.DataFrame, working_directory: str = 'data') -> int:
+    """
+    Upserts parsed bus stops into data_route_info_busstop in a single transaction.
+
+    Pass the concatenation of several routes' ``parse_route_info`` results to load
+    them all at once.
+
+    Args:
+        dataframe (pd.DataFrame): Rows with the columns produced by ``parse_route_info``.
+        working_directory (str): Directory holding the database file.
+
+    Returns:
+        int: Number of rows written.
+    """
+    columns = [column.name for column in route_info_busstop_table.columns]
+    rows = dataframe[columns].astype({
+        "stop_id": "int64",
+        "stop_number": "int64",
+        "latitude": "float64",
+        "longitude": "float64",
+    }).to_dict("records")
+
+    return upsert_rows(get_engine(working_directory), route_info_busstop_table, rows)
 
 
 if __name__ == "__main__":
+    # One browser serves the route list and every route page
+    browser_pool = ebus_browser_pool()
+
     # Initialize and process route data
-    route_list = taipei_route_list()
+    route_list = taipei_route_list(browser_pool=browser_pool)
     route_list.parse_route_list()
     route_list.save_to_database()
 
@@ -266,25 +427,44 @@ if __name__ == "__main__":
     bus_list = [bus1]
 
 
-    for route_id in bus_list:
-        try:
-            route_info = taipei_route_info(route_id, direction="go")
-            route_info.parse_route_info()
-            route_info.save_to_database()
+    def update_route(job: tuple) -> taipei_route_info:
+        route_id, direction = job
+        route_info = taipei_route_info(route_id, direction=direction, browser_pool=browser_pool)
+        route_info.parse_route_info()
+        route_info.save_to_database()
+        return route_info
 
+    # Failures are retried with backoff; jobs out of attempts get one more round at the end
+    scheduler = fetch_scheduler()
+    jobs = [(route_id, "both") for route_id in bus_list]  # One page load per route for both directions
+    for round_number in range(2):
+        for route_id, direction in jobs:
+            route_info = scheduler.call(update_route, (route_id, direction))
+            if route_info is None:
+                continue
 
             for index, row in route_info.dataframe.iterrows():
                 print(f"Stop Number: {row['stop_number']}, Stop Name: {row['stop_name']}, "
                       f"Latitude: {row['latitude']}, Longitude: {row['longitude']}")
 
-            # route_info = taipei_route_info(route_id, direction="come")
-            # route_info.parse_route_info()
-            # route_info.save_to_database()
-
             route_list.set_route_data_updated(route_id)
-            print(f"Route data for {route_id} updated.")
-
-        except Exception as e:
-            print(f"Error processing route {route_id}: {e}")
-            route_list.set_route_data_unexcepted(route_id)
-            continue
\ No newline at end of file
+            print(f"Route data for {route_id} updated "
+                  f"(waited {route_info.wait_report.elapsed:.2f}s, {route_info.wait_report.signal}; "
+                  f"parsed in {route_info.parse_report.elapsed * 1000:.1f}ms, "
+                  f"{route_info.parse_report.malformed} malformed stops).")
+            page_stats = browser_pool.last_page_stats
+            if page_stats is not None:
+                print(f"  {page_stats.requests} requests, {page_stats.blocked} blocked "
+                      f"{page_stats.blocked_by_reason}, {page_stats.bytes_loaded / 1024:.0f} KiB loaded")
+        jobs = scheduler.take_dead_letters()
+
+    # Only routes that failed both rounds are marked as failed
+    for route_id, direction in jobs:
+        print(f"Error processing route {route_id}: gave up after retries")
+        route_list.set_route_data_unexcepted(route_id)
+
+    route_list.flush_status()
+    total = browser_pool.stats()
+    print(f"{browser_pool.pages_served} page loads: {total.requests} requests, {total.blocked} blocked, "
+          f"{total.bytes_loaded / 1024:.0f} KiB loaded")
+    browser_pool.close()
\ No newline at end of file
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides the readiness wait used by every Taipei eBus fetcher. Instead of sleeping
+for a fixed time, it watches the DOM with a MutationObserver and returns as soon as the station
+list and its ETA spans are populated, or when a hard cap expires.
+
+The same JavaScript predicate backs the Playwright (sync and async) and Selenium entry points.
+"""
+
+import time
+from typing import NamedTuple
+
+
+# Resolves to {ready, signal} once the predicate holds or the cap expires.
+_READY_JS = """
+([kind, selector, timeoutMs]) => new Promise((resolve) => {
+    const text = (el) => (el.textContent || '').trim();
+    const isReady = () => {
+        if (kind === 'stops') {
+            const container = document.querySelector(selector);
+            if (!container) return false;
+            const items = container.querySelectorAll('li');
+            if (items.length === 0) return false;
+            let etaSpans = 0;
+            let etaFilled = 0;
+            for (const item of items) {
+                const place = item.querySelector('.auto-list-stationlist-place');
+                if (!place || !text(place)) return false;
+                const eta = item.querySelector('.auto-list-stationlist-position');
+                if (eta) {
+                    etaSpans += 1;
+                    if (text(eta)) etaFilled += 1;
+                }
+            }
+            // ETAs arrive in one batch; a stop without service may legitimately stay blank
+            return etaSpans === 0 || etaFilled > 0;
+        }
+        const links = document.querySelectorAll(selector);
+        if (links.length === 0) return false;
+        if (kind === 'visible_links') {
+            for (const link of links) {
+                if (!(link.innerText || '').trim()) return false;
+            }
+        }
+        return true;
+    };
+
+    if (isReady()) {
+        resolve({ready: true, signal: 'immediate'});
+        return;
+    }
+
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        if (isReady()) finish(true, 'mutation');
+    });
+    const finish = (ready, signal) => {
+        observer.disconnect();
+        clearTimeout(timer);
+        resolve({ready: ready, signal: signal});
+    };
+    timer = setTimeout(() => finish(isReady(), 'timeout'), timeoutMs);
+    observer.observe(document.documentElement, {
+        childList: true, subtree: true, characterData: true, attributes: true
+    });
+})
+"""
+
+ROUTE_LINK_SELECTOR = 'a[href^="javascript:go"]'
+
+DIRECTION_CONTAINERS = {
+    'go': '#GoDirectionRoute',
+    'come': '#BackDirectionRoute',
+}
+
+
+class wait_report(NamedTuple):
+    """
+    Outcome of a readiness wait.
+
+    Attributes:
+        ready (bool): Whether the page reached the expected state before the cap.
+        elapsed (float): Seconds actually spent waiting.
+        signal (str): What ended the wait: 'immediate', 'mutation', 'timeout' or 'error'.
+    """
+    ready: bool
+    elapsed: float
+    signal: str
+
+
+def _stops_args(direction: str, timeout: float) -> list:
+    if direction not in DIRECTION_CONTAINERS:
+        raise ValueError("Direction must be 'go' or 'come'")
+    return ['stops', DIRECTION_CONTAINERS[direction], int(timeout * 1000)]
+
+
+def _links_args(visible: bool, timeout: float) -> list:
+    return ['visible_links' if visible else 'links', ROUTE_LINK_SELECTOR, int(timeout * 1000)]
+
+
+def _report(result, started: float) -> wait_report:
+    elapsed = time.perf_counter() - started
+    if not result:
+        return wait_report(False, elapsed, 'error')
+    return wait_report(bool(result.get('ready')), elapsed, result.get('signal', 'error'))
+
+
+def _playwright_wait(page, args: list) -> wait_report:
+    started = time.perf_counter()
+    try:
+        result = page.evaluate(_READY_JS, args)
+    except Exception:
+        result = None
+    return _report(result, started)
+
+
+async def _playwright_wait_async(page, args: list) -> wait_report:
+    started = time.perf_counter()
+    try:
+        result = await page.evaluate(_READY_JS, args)
+    except Exception:
+        result = None
+    return _report(result, started)
+
+
+def _selenium_wait(driver, args: list) -> wait_report:
+    started = time.perf_counter()
+    script = (
+        "const done = arguments[arguments.length - 1];"
+        f"({_READY_JS})(arguments[0]).then(done, () => done(null));"
+    )
+    try:
+        driver.set_script_timeout(args[-1] / 1000 + 5)
+        result = driver.execute_async_script(script, args)
+    except Exception:
+        result = None
+    return _report(result, started)
+
+
+def wait_for_stop_list(page, direction: str = 'go', timeout: float = 10.0) -> wait_report:
+    """
+    Waits on a Playwright page until the direction's stop list and ETA spans are populated.
+
+    Args:
+        page (playwright.sync_api.Page): Page showing a StopsOfRoute document.
+        direction (str): 'go' or 'come'.
+        timeout (float): Hard cap in seconds.
+
+    Returns:
+        wait_report: Whether the list became ready and how long the wait took.
+    """
+    return _playwright_wait(page, _stops_args(direction, timeout))
+
+
+def wait_for_route_links(page, timeout: float = 10.0, visible: bool = False) -> wait_report:
+    """
+    Waits on a Playwright page until the route catalogue links are present.
+
+    Args:
+        page (playwright.sync_api.Page): Page showing the eBus route catalogue.
+        timeout (float): Hard cap in seconds.
+        visible (bool): Also require every link to be rendered with text (expanded panels).
+
+    Returns:
+        wait_report: Whether the links appeared and how long the wait took.
+    """
+    return _playwright_wait(page, _links_args(visible, timeout))
+
+
+async def async_wait_for_stop_list(page, direction: str = 'go', timeout: float = 10.0) -> wait_report:
+    """
+    Async counterpart of ``wait_for_stop_list`` for ``playwright.async_api`` pages.
+    """
+    return await _playwright_wait_async(page, _stops_args(direction, timeout))
+
+
+async def async_wait_for_route_links(page, timeout: float = 10.0, visible: bool = False) -> wait_report:
+    """
+    Async counterpart of ``wait_for_route_links`` for ``playwright.async_api`` pages.
+    """
+    return await _playwright_wait_async(page, _links_args(visible, timeout))
+
+
+def selenium_wait_for_stop_list(driver, direction: str = 'go', timeout: float = 10.0) -> wait_report:
+    """
+    Selenium counterpart of ``wait_for_stop_list``.
+
+    Args:
+        driver (selenium.webdriver.Remote): Driver showing a StopsOfRoute document.
+        direction (str): 'go' or 'come'.
+        timeout (float): Hard cap in seconds.
+
+    Returns:
+        wait_report: Whether the list became ready and how long the wait took.
+    """
+    return _selenium_wait(driver, _stops_args(direction, timeout))
+
+
+def selenium_wait_for_route_links(driver, timeout: float = 10.0, visible: bool = False) -> wait_report:
+    """
+    Selenium counterpart of ``wait_for_route_links``.
+    """
+    return _selenium_wait(driver, _links_args(visible, timeout))
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+This module turns the eBus arrival texts ('5分鐘', '進站中', '預計14:20發車', '末班已過', ...) into
+typed records, a status code plus seconds until arrival, when a page is parsed. The records are
+appended to one SQLite table per day (see ebus_db.eta_observation_table), and analytics read a day
+back as typed columns instead of re-parsing strings row by row.
+"""
+
+import re
+import time
+from enum import IntEnum
+from functools import lru_cache
+from typing import NamedTuple
+
+import pandas as pd
+from sqlalchemy import inspect, select
+
+from cycu11022101.ebus_db import ETA_TABLE_PREFIX, eta_observation_table
+
+
+# The site shows Taipei time (UTC+8, no daylight saving)
+TAIPEI_OFFSET = 8 * 60 * 60
+
+_MINUTES_RE = re.compile(r'約?\s*(\d+)\s*分')
+_SCHEDULED_RE = re.compile(r'(\d{1,2}):(\d{2})\s*發車')
+
+
+class eta_status(IntEnum):
+    """
+    Kind of an arrival text; stored as a small integer.
+    """
+    NO_DATA = 0  # empty span: no ETA published for the stop
+    MINUTES = 1  # '5分鐘', '約5分'
+    ARRIVING = 2  # '進站中', '即將進站'
+    SCHEDULED = 3  # '預計14:20發車'
+    NOT_DEPARTED = 4  # '尚未發車', '待發車'
+    LAST_BUS_PASSED = 5  # '末班已過'
+    NO_SERVICE = 6  # '今日未營運', '今日停駛'
+    NOT_STOPPING = 7  # '交管不停', '不停靠'
+    UNKNOWN = 9  # any other text
+
+
+STATUS_TEXTS = {
+    '進站中': eta_status.ARRIVING,
+    '即將進站': eta_status.ARRIVING,
+    '尚未發車': eta_status.NOT_DEPARTED,
+    '待發車': eta_status.NOT_DEPARTED,
+    '末班已過': eta_status.LAST_BUS_PASSED,
+    '今日未營運': eta_status.NO_SERVICE,
+    '今日停駛': eta_status.NO_SERVICE,
+    '交管不停': eta_status.NOT_STOPPING,
+    '不停靠': eta_status.NOT_STOPPING,
+}
+
+
+class eta_record(NamedTuple):
+    """
+    A normalized arrival text.
+
+    Attributes:
+        status (eta_status): What the text says.
+        seconds (int): Seconds until the bus arrives (MINUTES, ARRIVING) or departs (SCHEDULED)
+            as of the observation; None for the other statuses.
+    """
+    status: eta_status
+    seconds: int
+
+    @property
+    def minutes(self) -> int:
+        """
+        Whole minutes until arrival or departure, or None.
+        """
+        return None if self.seconds is None else self.seconds // 60
+
+
+@lru_cache(maxsize=4096)
+def _classify(text: str) -> tuple:
+    """
+    Returns (status, seconds) for a text; for SCHEDULED, seconds is the departure's time of day.
+    """
+    if not text:
+        return eta_status.NO_DATA, None
+    if text in STATUS_TEXTS:
+        status = STATUS_TEXTS[text]
+        return status, 0 if status == eta_status.ARRIVING else None
+
+    match = _SCHEDULED_RE.search(text)
+    if match:
+        return eta_status.SCHEDULED, int(match.group(1)) * 3600 + int(match.group(2)) * 60
+    match = _MINUTES_RE.search(text)
+    if match:
+        return eta_status.MINUTES, int(match.group(1)) * 60
+    return eta_status.UNKNOWN, None
+
+
+def _seconds_of_day(observed_at: float) -> int:
+    return int(observed_at + TAIPEI_OFFSET) % 86400
+
+
+def _until(departure: int, observed_at: float) -> int:
+    """
+    Seconds from the observation to a departure given as a time of day, assuming it lies within 12 hours either way.
+    """
+    delta = departure - _seconds_of_day(observed_at)
+    if delta < -43200:
+        delta += 86400
+    elif delta > 43200:
+        delta -= 86400
+    return max(delta, 0)
+
+
+def normalize_eta(text, observed_at: float = None) -> eta_record:
+    """
+    Normalizes one arrival text.
+
+    Args:
+        text (str): The text of the ETA span; None or NaN count as empty.
+        observed_at (float): When the page was read, in seconds since the epoch; the current time if omitted.
+            Only needed to turn a scheduled departure time into seconds.
+
+    Returns:
+        eta_record: The status and seconds.
+    """
+    status, seconds = _classify(text.strip() if isinstance(text, str) else '')
+    if status == eta_status.SCHEDULED:
+        seconds = _until(seconds, time.time() if observed_at is None else observed_at)
+    return eta_record(status, seconds)
+
+
+def eta_columns(texts, observed_at: float = None) -> pd.DataFrame:
+    """
+    Normalizes a column of arrival texts; each distinct text is parsed once.
+
+    Args:
+        texts (pd.Series): Arrival texts, e.g. a dataframe's arrival_info column.
+        observed_at (float): When the page was read; the current time if omitted.
+
+    Returns:
+        pd.DataFrame: Columns eta_status (int8) and eta_seconds (float, NaN where not applicable),
+            on the index of ``texts``.
+    """
+    texts = pd.Series(texts)
+    observed_at = time.time() if observed_at is None else observed_at
+    cleaned = texts.where(texts.notna(), '').astype(str).str.strip()
+
+    records = {text: normalize_eta(text, observed_at) for text in cleaned.unique()}
+    return pd.DataFrame({
+        'eta_status': cleaned.map({text: int(record.status) for text, record in records.items()}).astype('int8'),
+        'eta_seconds': cleaned.map({text: record.seconds for text, record in records.items()}).astype('float64'),
+    }, index=texts.index)
+
+
+def eta_day(observed_at: float) -> str:
+    """
+    Returns the Taipei calendar day of a time as YYYYMMDD, the key of its observation table.
+    """
+    return time.strftime('%Y%m%d', time.gmtime(observed_at + TAIPEI_OFFSET))
+
+
+_created_tables = set()
+
+
+def append_eta_observations(engine, dataframe: pd.DataFrame, observed_at: float = None) -> int:
+    """
+    Appends one reading of stops to the day's ETA observation table, creating the table on first use.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Target database.
+        dataframe (pd.DataFrame): Rows with route_id, direction, stop_number and stop_id, plus either
+            eta_status and eta_seconds or the raw arrival_info.
+        observed_at (float): When the page was read; the current time if omitted.
+
+    Returns:
+        int: Number of rows appended.
+    """
+    if dataframe.empty:
+        return 0
+
+    observed_at = time.time() if observed_at is None else observed_at
+    if 'eta_status' not in dataframe:
+        dataframe = dataframe.join(eta_columns(dataframe['arrival_info'], observed_at))
+
+    table = eta_observation_table(eta_day(observed_at))
+    if (engine.url, table.name) not in _created_tables:
+        table.create(engine, checkfirst=True)
+        _created_tables.add((engine.url, table.name))
+
+    rows = [
+        {
+            'observed_at': observed_at,
+            'route_id': route_id,
+            'direction': direction,
+            'stop_number': int(stop_number),
+            'stop_id': int(stop_id),
+            'status': int(status),
+            'seconds': None if pd.isna(seconds) else int(seconds),
+        }
+        for route_id, direction, stop_number, stop_id, status, seconds in zip(
+            dataframe['route_id'], dataframe['direction'], dataframe['stop_number'],
+            dataframe['stop_id'], dataframe['eta_status'], dataframe['eta_seconds'],
+        )
+    ]
+    with engine.begin() as connection:
+        connection.execute(table.insert(), rows)
+    return len(rows)
+
+
+def eta_days(engine) -> list:
+    """
+    Lists the days that have an ETA observation table.
+
+    Returns:
+        list: Days as YYYYMMDD, oldest first.
+    """
+    return sorted(
+        name[len(ETA_TABLE_PREFIX):] for name in inspect(engine).get_table_names()
+        if name.startswith(ETA_TABLE_PREFIX)
+    )
+
+
+def read_eta_observations(engine, day: str, route_id: str = None, direction: str = None) -> pd.DataFrame:
+    """
+    Reads one day of ETA observations as typed columns.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Source database.
+        day (str): The day as YYYYMMDD.
+        route_id (str): Only this route, if given.
+        direction (str): Only this direction, if given.
+
+    Returns:
+        pd.DataFrame: Columns observed_at, route_id, direction, stop_number, stop_id, status (int8)
+            and seconds (float, NaN where not applicable); empty if the day has no table.
+    """
+    table = eta_observation_table(day)
+    columns = [column.name for column in table.columns]
+    if day not in eta_days(engine):
+        return pd.DataFrame(columns=columns)
+
+    query = select(table)
+    if route_id is not None:
+        query = query.where(table.c.route_id == route_id)
+    if direction is not None:
+        query = query.where(table.c.direction == direction)
+
+    with engine.connect() as connection:
+        frame = pd.read_sql(query, connection)
+    return frame.astype({'status': 'int8', 'seconds': 'float64'})
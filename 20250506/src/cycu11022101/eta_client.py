@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+This module is the client side of the local ETA service (cycu11022101.eta_service). Besides the
+standard library it only imports cycu11022101.ebus_parse, which has no third-party dependencies,
+so command-line tools can ask the running service for live ETAs without importing Playwright,
+Selenium, requests or SQLAlchemy, starting a browser or resolving a driver.
+"""
+
+import json
+from typing import NamedTuple
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from cycu11022101.ebus_parse import stop_record
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_URL = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}'
+
+
+class eta_result(NamedTuple):
+    """
+    Live stops of one route as answered by the ETA service.
+
+    Attributes:
+        route_id (str): The ID of the bus route.
+        stops (dict): stop_record lists keyed by direction ('go', 'come').
+        fetched_at (float): When the service read the page, in seconds since the epoch.
+        elapsed (float): Seconds the service spent on the query.
+        source (str): 'tab' if an open tab of the route was read again, 'load' if the page was loaded.
+    """
+    route_id: str
+    stops: dict
+    fetched_at: float
+    elapsed: float
+    source: str
+
+
+def service_available(url: str = DEFAULT_URL, timeout: float = 0.5) -> bool:
+    """
+    Checks whether an ETA service answers at the URL.
+
+    Args:
+        url (str): Base URL of the service.
+        timeout (float): Seconds to wait for the answer.
+
+    Returns:
+        bool: True if the service's status endpoint answered.
+    """
+    try:
+        with urlopen(f'{url}/status', timeout=timeout) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
+
+
+def fetch_eta(route_id: str, direction: str = 'both', url: str = DEFAULT_URL, timeout: float = 60.0) -> eta_result:
+    """
+    Asks the ETA service for a route's stops and their live ETAs.
+
+    Args:
+        route_id (str): The ID of the bus route.
+        direction (str): 'go', 'come' or 'both'.
+        url (str): Base URL of the service.
+        timeout (float): Seconds to wait for the answer.
+
+    Returns:
+        eta_result: The stops per direction.
+
+    Raises:
+        ValueError: If the service rejects the query or cannot read the route.
+        OSError: If the service cannot be reached.
+    """
+    query = urlencode({'route_id': route_id, 'direction': direction})
+    try:
+        with urlopen(f'{url}/eta?{query}', timeout=timeout) as response:
+            payload = json.load(response)
+    except HTTPError as e:
+        try:
+            message = json.load(e).get('error')
+        except ValueError:
+            message = None
+        raise ValueError(message or f"ETA service answered with status {e.code}") from e
+
+    return eta_result(
+        payload['route_id'],
+        {direction: [stop_record(**stop) for stop in stops] for direction, stops in payload['stops'].items()},
+        payload['fetched_at'],
+        payload['elapsed'],
+        payload['source'],
+    )
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+This module watches a set of routes for ETA changes. It reads each route from a tab kept open by an
+eta_service (the page refreshes its own ETA spans every 15 seconds), compares the stops with the
+previous snapshot of that route and yields only the stops whose arrival text changed, as eta_change
+events from a generator or an async iterator. Maps and alerts then handle deltas instead of whole
+routes, and one process can poll many routes without reloading their pages.
+
+Usage:
+    python -m cycu11022101.eta_poller ROUTE_ID [ROUTE_ID ...] [--interval 15] [--direction both]
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from cycu11022101.eta import eta_status, normalize_eta
+from cycu11022101.eta_service import eta_service
+
+
+class eta_change(NamedTuple):
+    """
+    A stop whose arrival text differs from the previous poll.
+
+    Attributes:
+        route_id (str): The ID of the bus route.
+        direction (str): 'go' or 'come'.
+        stop_number (int): Sequence number along the route, or None.
+        stop_id (int): UniStopId, or None.
+        name (str): Stop name.
+        previous (str): Arrival text of the previous poll; None the first time the stop is seen.
+        arrival_info (str): Current arrival text.
+        status (eta_status): Normalized kind of the current text.
+        seconds (int): Seconds until arrival or departure, or None (see eta.eta_record).
+        observed_at (float): When the page was read, in seconds since the epoch.
+    """
+    route_id: str
+    direction: str
+    stop_number: int
+    stop_id: int
+    name: str
+    previous: str
+    arrival_info: str
+    status: eta_status
+    seconds: int
+    observed_at: float
+
+
+class eta_poller:
+    """
+    Polls routes on an interval from warm tabs and reports only the stops that changed.
+
+    The poller, like the service and browser pool under it, is bound to one thread: use either
+    ``events`` on the calling thread or ``events_async``, which runs every poll on one worker thread.
+    """
+
+    def __init__(self, route_ids: list, interval: float = 15.0, direction: str = 'both',
+                 service: eta_service = None, emit_initial: bool = True):
+        """
+        Initializes the poller without launching the browser; the first poll does.
+
+        Args:
+            route_ids (list): IDs of the routes to watch.
+            interval (float): Seconds between the starts of two polls; the page itself refreshes every 15.
+            direction (str): 'go', 'come' or 'both'.
+            service (eta_service): Service whose tabs are read; one keeping a tab per route if omitted.
+            emit_initial (bool): Whether the first poll of a route reports every stop (previous None).
+
+        Raises:
+            ValueError: If the interval is not positive or the direction is invalid.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if direction not in ('go', 'come', 'both'):
+            raise ValueError("Direction must be 'go', 'come' or 'both'")
+
+        self.route_ids = list(dict.fromkeys(route_ids))
+        self.interval = interval
+        self.direction = direction
+        self.service = service or eta_service(tabs=max(len(self.route_ids), 1))
+        self.emit_initial = emit_initial
+
+        self.snapshots = {}  # route_id -> {(direction, stop_number, stop_id): arrival_info}
+        self.errors = {}  # route_id -> last exception, cleared by a successful poll
+        self.polls = 0
+        self.changes = 0
+
+        self._executor = None
+
+    def add_route(self, route_id: str):
+        """
+        Starts watching a route from the next poll on.
+        """
+        if route_id not in self.route_ids:
+            self.route_ids.append(route_id)
+            self.service.tabs = max(self.service.tabs, len(self.route_ids))
+
+    def remove_route(self, route_id: str):
+        """
+        Stops watching a route and forgets its snapshot; its tab is closed when the service needs the room.
+        """
+        if route_id in self.route_ids:
+            self.route_ids.remove(route_id)
+        self.snapshots.pop(route_id, None)
+        self.errors.pop(route_id, None)
+
+    def _diff(self, answer: dict) -> list:
+        route_id, observed_at = answer['route_id'], answer['fetched_at']
+        previous_snapshot = self.snapshots.get(route_id)
+        snapshot = {}
+        changes = []
+
+        for direction, stops in answer['stops'].items():
+            for stop in stops:
+                key = (direction, stop['number'], stop['stop_id'])
+                text = stop['arrival_info']
+                snapshot[key] = text
+
+                if previous_snapshot is None:
+                    if not self.emit_initial:
+                        continue
+                    previous = None
+                else:
+                    previous = previous_snapshot.get(key)
+                    if previous == text:
+                        continue
+
+                record = normalize_eta(text, observed_at)
+                changes.append(eta_change(
+                    route_id, direction, stop['number'], stop['stop_id'], stop['name'],
+                    previous, text, record.status, record.seconds, observed_at,
+                ))
+
+        self.snapshots[route_id] = snapshot
+        return changes
+
+    def poll_once(self) -> list:
+        """
+        Reads every watched route once and compares it with its previous snapshot.
+
+        A route that cannot be read is skipped and its error kept in ``errors``; its snapshot stays as it was.
+
+        Returns:
+            list: eta_change events, in route and stop order.
+        """
+        changes = []
+        for route_id in list(self.route_ids):
+            try:
+                answer = self.service.query(route_id, self.direction)
+            except Exception as e:
+                self.errors[route_id] = e
+                continue
+            self.errors.pop(route_id, None)
+            changes.extend(self._diff(answer))
+
+        self.polls += 1
+        self.changes += len(changes)
+        return changes
+
+    def events(self, max_polls: int = None):
+        """
+        Polls on the interval and yields each changed stop.
+
+        Args:
+            max_polls (int): Number of polls before the generator ends; no limit if omitted.
+
+        Yields:
+            eta_change: A stop whose arrival text changed.
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            started = time.monotonic()
+            yield from self.poll_once()
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(max(0.0, started + self.interval - time.monotonic()))
+
+    async def events_async(self, max_polls: int = None):
+        """
+        Async iterator version of ``events``; the polls run on one worker thread that owns the browser.
+
+        Args:
+            max_polls (int): Number of polls before the iterator ends; no limit if omitted.
+
+        Yields:
+            eta_change: A stop whose arrival text changed.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='eta_poller')
+        loop = asyncio.get_running_loop()
+
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            started = loop.time()
+            for change in await loop.run_in_executor(self._executor, self.poll_once):
+                yield change
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                await asyncio.sleep(max(0.0, started + self.interval - loop.time()))
+
+    def close(self):
+        """
+        Closes the tabs and the browser, on the thread that polled.
+        """
+        if self._executor is not None:
+            self._executor.submit(self.service.close).result()
+            self._executor.shutdown()
+            self._executor = None
+        else:
+            self.service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print ETA changes of Taipei eBus routes as they happen")
+    parser.add_argument("route_ids", nargs="+", help="route IDs to watch")
+    parser.add_argument("--interval", type=float, default=15.0, help="seconds between polls")
+    parser.add_argument("--direction", default="both", choices=["go", "come", "both"])
+    args = parser.parse_args()
+
+    poller = eta_poller(args.route_ids, args.interval, args.direction, emit_initial=False)
+    try:
+        for change in poller.events():
+            stamp = time.strftime('%H:%M:%S', time.localtime(change.observed_at))
+            print(f"{stamp} {change.route_id} {change.direction} {change.stop_number} {change.name}: "
+                  f"{change.previous} -> {change.arrival_info}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        poller.close()
+        print(f"{poller.polls} polls, {poller.changes} changes")
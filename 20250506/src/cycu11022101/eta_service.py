@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+This module runs a long-lived local ETA service for the interactive tools. It keeps one Chromium
+warm with pre-opened pages and keeps the StopsOfRoute tabs of recently queried routes open: those
+pages poll StopStatusOfRoute every 15 seconds and rewrite their ETA spans in place, so a repeated
+query reads the open tab again instead of loading the page. Tools ask it over a small HTTP API on
+localhost (see cycu11022101.eta_client), so their query latency excludes browser start-up and driver
+resolution.
+
+Usage:
+    python -m cycu11022101.eta_service [--port 8765] [--tabs 4] [--preload ROUTE_ID ...]
+"""
+
+import argparse
+import json
+import re
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from cycu11022101.browser_pool import ebus_browser_pool
+from cycu11022101.ebus_http import STOPS_OF_ROUTE_URL
+from cycu11022101.ebus_parse import iter_stops
+from cycu11022101.ebus_wait import wait_for_stop_list
+from cycu11022101.eta_client import DEFAULT_HOST, DEFAULT_PORT
+
+
+DIRECTION_TABS = {
+    'go': 'a.stationlist-go',
+    'come': 'a.stationlist-come',
+}
+
+_ROUTE_ID_RE = re.compile(r'[0-9A-Za-z]+')
+
+
+class eta_service:
+    """
+    Answers live ETA queries from a warm browser, keeping the tabs of recent routes open.
+
+    Like the browser pool it uses, the service is bound to the thread that created it.
+    """
+
+    def __init__(self, tabs: int = 4, max_tab_age: float = 600.0, headless: bool = True,
+                 browser_pool: ebus_browser_pool = None):
+        """
+        Initializes the service without launching the browser; ``start`` or the first query does.
+
+        Args:
+            tabs (int): Maximum number of route tabs kept open; the least recently queried is closed first.
+            max_tab_age (float): Seconds after which an open tab is loaded again instead of read again.
+            headless (bool): Whether Chromium runs without a window.
+            browser_pool (ebus_browser_pool): Pool to take pages from; one holding ``tabs`` pages if omitted.
+
+        Raises:
+            ValueError: If tabs is below 1.
+        """
+        if tabs < 1:
+            raise ValueError("tabs must be at least 1")
+
+        self.tabs = tabs
+        self.max_tab_age = max_tab_age
+        self.browser_pool = browser_pool or ebus_browser_pool(size=tabs, headless=headless)
+        self.open_tabs = OrderedDict()  # route_id -> [pool entry, loaded_at, direction shown]
+
+        self.started_at = time.time()
+        self.queries = 0
+        self.loads = 0
+        self.tab_reads = 0
+
+    def start(self):
+        """
+        Launches the browser and opens the idle pages.
+
+        Returns:
+            eta_service: The service itself, for chaining.
+        """
+        self.browser_pool.warm()
+        return self
+
+    def _close_tab(self, route_id: str, healthy: bool = True):
+        entry = self.open_tabs.pop(route_id)[0]
+        self.browser_pool.release(entry, healthy)
+
+    def _tab(self, route_id: str) -> tuple:
+        """
+        Returns the route's open tab, loading the page into a pooled one if it has none or it is too old.
+        """
+        tab = self.open_tabs.get(route_id)
+        if tab is not None and time.time() - tab[1] >= self.max_tab_age:
+            self._close_tab(route_id)
+            tab = None
+
+        if tab is not None:
+            self.open_tabs.move_to_end(route_id)
+            return tab, False
+
+        while len(self.open_tabs) >= self.tabs:
+            self._close_tab(next(iter(self.open_tabs)))
+
+        entry = self.browser_pool.acquire()
+        try:
+            entry[1].goto(STOPS_OF_ROUTE_URL.format(route_id=route_id))
+        except Exception:
+            self.browser_pool.release(entry, healthy=False)
+            raise
+
+        tab = [entry, time.time(), 'go']
+        self.open_tabs[route_id] = tab
+        return tab, True
+
+    def query(self, route_id: str, direction: str = 'both') -> dict:
+        """
+        Reads a route's stops and live ETAs.
+
+        Args:
+            route_id (str): The ID of the bus route.
+            direction (str): 'go', 'come' or 'both'.
+
+        Returns:
+            dict: JSON-ready answer with route_id, stops (stop_record dicts per direction),
+                fetched_at, elapsed and source ('tab' or 'load').
+
+        Raises:
+            ValueError: If the route ID or direction is invalid.
+        """
+        if not _ROUTE_ID_RE.fullmatch(route_id or ''):
+            raise ValueError("route_id must be alphanumeric")
+        if direction not in ('go', 'come', 'both'):
+            raise ValueError("Direction must be 'go', 'come' or 'both'")
+
+        started = time.perf_counter()
+        tab, loaded = self._tab(route_id)
+        page = tab[0][1]
+
+        stops = {}
+        try:
+            for shown in (['go', 'come'] if direction == 'both' else [direction]):
+                if tab[2] != shown:
+                    page.click(DIRECTION_TABS[shown])
+                    tab[2] = shown
+                wait_for_stop_list(page, shown)  # Returns at once when the ETAs are already rendered
+                stops[shown] = [record._asdict() for record in iter_stops(page.content(), shown)]
+        except Exception:
+            self._close_tab(route_id, healthy=False)
+            raise
+
+        self.queries += 1
+        if loaded:
+            self.loads += 1
+        else:
+            self.tab_reads += 1
+
+        return {
+            'route_id': route_id,
+            'stops': stops,
+            'fetched_at': time.time(),
+            'elapsed': time.perf_counter() - started,
+            'source': 'load' if loaded else 'tab',
+        }
+
+    def status(self) -> dict:
+        """
+        Returns the service's counters and open tabs.
+
+        Returns:
+            dict: JSON-ready status.
+        """
+        now = time.time()
+        totals = self.browser_pool.stats()
+        return {
+            'uptime': now - self.started_at,
+            'queries': self.queries,
+            'loads': self.loads,
+            'tab_reads': self.tab_reads,
+            'open_tabs': [{'route_id': route_id, 'age': now - tab[1]} for route_id, tab in self.open_tabs.items()],
+            'pages_created': self.browser_pool.pages_created,
+            'requests': totals.requests,
+            'blocked': totals.blocked,
+            'bytes_loaded': totals.bytes_loaded,
+        }
+
+    def close(self):
+        """
+        Closes every open tab and the browser.
+        """
+        for route_id in list(self.open_tabs):
+            self._close_tab(route_id)
+        self.browser_pool.close()
+
+    def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, preload: list = ()):
+        """
+        Answers HTTP requests until interrupted, then closes the browser.
+
+        Requests are handled one at a time on the calling thread, which owns the browser.
+
+        Args:
+            host (str): Address to listen on; keep it on localhost.
+            port (int): Port to listen on.
+            preload (list): Route IDs whose tabs are opened before the first request.
+        """
+        self.start()
+        for route_id in preload:
+            try:
+                self.query(route_id)
+            except Exception as e:
+                print(f"Could not preload route {route_id}: {e}")
+
+        server = HTTPServer((host, port), eta_request_handler)
+        server.eta_service = self
+        print(f"ETA service listening on http://{host}:{port} ({self.tabs} tabs)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.close()
+
+
+class eta_request_handler(BaseHTTPRequestHandler):
+    """
+    HTTP front end of an eta_service: ``GET /eta?route_id=...&direction=both`` and ``GET /status``.
+    """
+
+    def _send(self, status: int, body: dict):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        service = self.server.eta_service
+        url = urlsplit(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        if url.path == '/status':
+            self._send(200, service.status())
+        elif url.path == '/eta':
+            try:
+                self._send(200, service.query(params.get('route_id', ''), params.get('direction', 'both')))
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+            except Exception as e:
+                self._send(502, {'error': f"Could not read route {params.get('route_id')}: {e}"})
+        else:
+            self._send(404, {'error': f"Unknown path {url.path}"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local live ETA service for the Taipei eBus tools")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--tabs", type=int, default=4, help="route tabs kept open")
+    parser.add_argument("--max-tab-age", type=float, default=600.0, help="seconds before an open tab is reloaded")
+    parser.add_argument("--headed", action="store_true", help="show the browser window")
+    parser.add_argument("--preload", nargs="*", default=[], help="route IDs to open before serving")
+    args = parser.parse_args()
+
+    eta_service(args.tabs, args.max_tab_age, headless=not args.headed).serve(args.host, args.port, args.preload)
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+This module retries eBus fetches on one shared policy: exponential backoff with full jitter between
+attempts, a circuit breaker shared by every job that pauses all fetching while the site keeps failing,
+and a dead-letter queue of jobs that ran out of attempts so a crawl can retry them once at the end
+instead of waiting on them in the middle.
+"""
+
+import asyncio
+import random
+import time
+from typing import NamedTuple
+
+
+class schedule_report(NamedTuple):
+    """
+    Counters of a fetch_scheduler since it was created.
+
+    Attributes:
+        jobs (int): Jobs submitted through ``call`` or ``call_async``.
+        succeeded (int): Jobs that eventually returned a result.
+        attempts (int): Fetch attempts made, including retries.
+        dead_lettered (int): Jobs that ran out of attempts and were queued as dead letters.
+        breaker_trips (int): Times the circuit breaker opened.
+        waited (float): Seconds spent in backoff or waiting for the breaker.
+    """
+    jobs: int
+    succeeded: int
+    attempts: int
+    dead_lettered: int
+    breaker_trips: int
+    waited: float
+
+
+class circuit_breaker:
+    """
+    Stops all fetches for a while after too many consecutive failures across jobs.
+
+    Closed: calls go through. Open: calls wait until ``reset_timeout`` has passed since the trip.
+    Half-open: one probe call goes through; success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        """
+        Initializes a closed breaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures, counted over every job, that open the breaker.
+            reset_timeout (float): Seconds the breaker stays open before letting a probe through.
+            clock (callable): Monotonic time source, in seconds.
+
+        Raises:
+            ValueError: If the threshold is below 1 or the timeout is negative.
+        """
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        if reset_timeout < 0:
+            raise ValueError("reset_timeout must not be negative")
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.probing = False
+
+    def wait_time(self) -> float:
+        """
+        Tells how long a caller must wait before it may fetch, moving an expired open breaker to half-open.
+
+        Returns:
+            float: 0 if the call may go ahead now, otherwise seconds to wait before asking again.
+        """
+        if self.state == 'open':
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if remaining > 0:
+                return remaining
+            self.state = 'half_open'
+            self.probing = False
+
+        if self.state == 'half_open':
+            if self.probing:
+                return min(1.0, self.reset_timeout) or 0.01
+            self.probing = True
+        return 0.0
+
+    def record_success(self):
+        """
+        Closes the breaker and clears the failure count.
+        """
+        self.state = 'closed'
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        """
+        Counts a failure; opens the breaker at the threshold or when a half-open probe fails.
+        """
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.trips += 1
+            self.state = 'open'
+            self.opened_at = self.clock()
+            self.probing = False
+
+
+class fetch_scheduler:
+    """
+    Runs fetch jobs with retries, exponential backoff with jitter, a shared circuit breaker
+    and a dead-letter queue.
+    """
+
+    def __init__(self, retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 breaker: circuit_breaker = None, rng: random.Random = None):
+        """
+        Initializes the scheduler.
+
+        Args:
+            retries (int): Attempts per job before it goes to the dead-letter queue.
+            base_delay (float): Backoff cap after the first failed attempt, in seconds; doubles per attempt.
+            max_delay (float): Upper bound of the backoff cap, in seconds.
+            breaker (circuit_breaker): Breaker shared by every job; a default one if omitted.
+            rng (random.Random): Source of the jitter; the module's generator if omitted.
+
+        Raises:
+            ValueError: If retries is below 1 or a delay is negative.
+        """
+        if retries < 1:
+            raise ValueError("retries must be at least 1")
+        if base_delay < 0 or max_delay < 0:
+            raise ValueError("Delays must not be negative")
+
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or circuit_breaker()
+        self.rng = rng or random
+        self.dead_letters = []
+        self.jobs = 0
+        self.succeeded = 0
+        self.attempts = 0
+        self.dead_lettered = 0
+        self.waited = 0.0
+
+    def delay(self, attempt: int) -> float:
+        """
+        Draws the backoff before retry number ``attempt`` ("full jitter": uniform up to the capped exponential).
+
+        Args:
+            attempt (int): 1 after the first failed attempt, 2 after the second, ...
+
+        Returns:
+            float: Seconds to sleep.
+        """
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _succeeded(self, result):
+        self.breaker.record_success()
+        self.succeeded += 1
+        return result
+
+    def _failed(self, job, attempt: int, error) -> float:
+        """
+        Records a failed attempt; returns the backoff before the next one, or None when the job is out of attempts.
+        """
+        self.breaker.record_failure()
+        if attempt < self.retries:
+            return self.delay(attempt)
+
+        self.dead_letters.append(job)
+        self.dead_lettered += 1
+        print(f"Giving up on {job} after {attempt} attempts: {error}")
+        return None
+
+    def call(self, fetch, job):
+        """
+        Runs ``fetch(job)`` until it returns a result, sleeping between attempts.
+
+        A fetch fails if it raises or returns None. After ``retries`` failures the job is appended
+        to ``dead_letters`` and None is returned.
+
+        Args:
+            fetch (callable): Function taking the job and returning its result.
+            job: The job, e.g. a (route_id, direction) tuple.
+
+        Returns:
+            The fetch's result, or None if the job was dead-lettered.
+        """
+        self.jobs += 1
+        for attempt in range(1, self.retries + 1):
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                time.sleep(wait)
+                self.waited += wait
+                wait = self.breaker.wait_time()
+
+            self.attempts += 1
+            try:
+                result = fetch(job)
+                error = 'no result'
+            except Exception as e:
+                result = None
+                error = e
+            if result is not None:
+                return self._succeeded(result)
+
+            backoff = self._failed(job, attempt, error)
+            if backoff is None:
+                return None
+            time.sleep(backoff)
+            self.waited += backoff
+
+    async def call_async(self, fetch, job):
+        """
+        Coroutine version of ``call``: ``fetch(job)`` is awaited and waits use ``asyncio.sleep``.
+
+        Args:
+            fetch (callable): Coroutine function taking the job and returning its result.
+            job: The job, e.g. a (route_id, direction) tuple.
+
+        Returns:
+            The fetch's result, or None if the job was dead-lettered.
+        """
+        self.jobs += 1
+        for attempt in range(1, self.retries + 1):
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                self.waited += wait
+                wait = self.breaker.wait_time()
+
+            self.attempts += 1
+            try:
+                result = await fetch(job)
+                error = 'no result'
+            except Exception as e:
+                result = None
+                error = e
+            if result is not None:
+                return self._succeeded(result)
+
+            backoff = self._failed(job, attempt, error)
+            if backoff is None:
+                return None
+            await asyncio.sleep(backoff)
+            self.waited += backoff
+
+    def take_dead_letters(self) -> list:
+        """
+        Returns the dead-lettered jobs in the order they failed and empties the queue.
+
+        Returns:
+            list: The jobs.
+        """
+        jobs, self.dead_letters = self.dead_letters, []
+        return jobs
+
+    def report(self) -> schedule_report:
+        """
+        Returns the scheduler's counters.
+
+        Returns:
+            schedule_report: Counters since the scheduler was created.
+        """
+        return schedule_report(self.jobs, self.succeeded, self.attempts, self.dead_lettered,
+                               self.breaker.trips, self.waited)
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+This module compiles the bus network into compact CSR arrays and plans journeys with transfers
+using RAPTOR-style rounds: round k finds every stop reachable with k rides. The cost of a ride is
+the number of stops travelled, and transfers happen between routes at stops with the same name.
+"""
+
+import csv
+import glob
+import os
+import pickle
+from array import array
+from typing import NamedTuple
+
+
+GRAPH_FORMAT_VERSION = 1
+
+# Attributes written by route_graph.save; everything else is rebuilt on load
+GRAPH_ARRAYS = (
+    'stop_names', 'pattern_routes', 'pattern_directions',
+    'pattern_ptr', 'pattern_stops', 'stop_ptr', 'stop_patterns', 'stop_positions',
+)
+
+
+class journey_leg(NamedTuple):
+    """
+    One ride on one route pattern.
+
+    Attributes:
+        route (str): Route name (or route ID when no name is known).
+        direction (str): 'go', 'come' or '' when the source has no directions.
+        board_stop (str): Stop where the ride starts.
+        alight_stop (str): Stop where the ride ends.
+        stops (int): Number of stops travelled.
+    """
+    route: str
+    direction: str
+    board_stop: str
+    alight_stop: str
+    stops: int
+
+
+class journey(NamedTuple):
+    """
+    A complete trip from origin to destination.
+
+    Attributes:
+        legs (list): journey_leg items in travel order.
+        transfers (int): Number of changes between routes.
+        stops (int): Total number of stops travelled.
+    """
+    legs: list
+    transfers: int
+    stops: int
+
+
+class route_graph:
+    """
+    Compiled bus network in CSR form.
+
+    ``pattern_ptr[p]:pattern_ptr[p + 1]`` slices ``pattern_stops`` to the stop sequence of pattern p.
+    ``stop_ptr[s]:stop_ptr[s + 1]`` slices ``stop_patterns``/``stop_positions`` to the patterns
+    serving stop s and the stop's position along each.
+    """
+
+    def __init__(self, patterns: list):
+        """
+        Compiles ordered stop sequences into CSR arrays.
+
+        Args:
+            patterns (list): (route, direction, [stop names in travel order]) tuples.
+        """
+        self.stop_names = []
+        self.stop_lookup = {}
+        self.pattern_routes = []
+        self.pattern_directions = []
+        self.pattern_ptr = array('l', [0])
+        self.pattern_stops = array('l')
+
+        for route, direction, stops in patterns:
+            if len(stops) < 2:
+                continue
+            self.pattern_routes.append(route)
+            self.pattern_directions.append(direction)
+            for name in stops:
+                stop = self.stop_lookup.get(name)
+                if stop is None:
+                    stop = self.stop_lookup[name] = len(self.stop_names)
+                    self.stop_names.append(name)
+                self.pattern_stops.append(stop)
+            self.pattern_ptr.append(len(self.pattern_stops))
+
+        serving = [[] for _ in self.stop_names]
+        for pattern in range(len(self.pattern_routes)):
+            start = self.pattern_ptr[pattern]
+            for position in range(self.pattern_ptr[pattern + 1] - start):
+                serving[self.pattern_stops[start + position]].append((pattern, position))
+
+        self.stop_ptr = array('l', [0])
+        self.stop_patterns = array('l')
+        self.stop_positions = array('l')
+        for entries in serving:
+            for pattern, position in entries:
+                self.stop_patterns.append(pattern)
+                self.stop_positions.append(position)
+            self.stop_ptr.append(len(self.stop_patterns))
+
+        self._build_views()
+
+    def _build_views(self):
+        # Python views of the CSR arrays for the query loop: list indexing is cheaper than array
+        # slicing, and keying each stop's entries by pattern lets a round filter them with a
+        # C-level set intersection instead of a Python loop.
+        self.pattern_sequences = [
+            self.pattern_stops[self.pattern_ptr[pattern]:self.pattern_ptr[pattern + 1]].tolist()
+            for pattern in range(len(self.pattern_routes))
+        ]
+        self.stop_first_positions = []
+        self.stop_last_positions = []
+        for stop in range(len(self.stop_names)):
+            first, last = {}, {}
+            for entry in range(self.stop_ptr[stop], self.stop_ptr[stop + 1]):
+                pattern, position = self.stop_patterns[entry], self.stop_positions[entry]
+                first.setdefault(pattern, position)
+                last[pattern] = position
+            self.stop_first_positions.append(first)
+            self.stop_last_positions.append(last)
+
+    @classmethod
+    def from_bus_info_folder(cls, folder: str = 'data/BUS_INFO', route_names_csv: str = None) -> 'route_graph':
+        """
+        Compiles the per-direction CSVs written by the crawlers (bus_route_{rid}_{direction}.csv).
+
+        Args:
+            folder (str): Folder holding the CSVs.
+            route_names_csv (str): Optional "Route ID,Route Name" catalogue (e.g. data/bus_info_tist.csv)
+                used to label legs with route names instead of IDs.
+
+        Returns:
+            route_graph: The compiled network.
+        """
+        names = {}
+        if route_names_csv and os.path.exists(route_names_csv):
+            with open(route_names_csv, newline='', encoding='utf-8-sig') as csvfile:
+                for row in csv.reader(csvfile):
+                    if len(row) >= 2:
+                        names[row[0]] = row[1]
+
+        patterns = []
+        for path in sorted(glob.glob(os.path.join(folder, 'bus_route_*_*.csv'))):
+            route_id, direction = os.path.basename(path)[len('bus_route_'):-len('.csv')].rsplit('_', 1)
+            with open(path, newline='', encoding='utf-8') as csvfile:
+                rows = [row for row in csv.DictReader(csvfile) if row.get('stop_name')]
+            rows.sort(key=lambda row: int(row['stop_number']) if row['stop_number'].isdigit() else 0)
+            patterns.append((names.get(route_id, route_id), direction, [row['stop_name'] for row in rows]))
+        return cls(patterns)
+
+    @classmethod
+    def from_route_csv(cls, csv_path: str) -> 'route_graph':
+        """
+        Compiles a CSV with route_name and stop_name columns in travel order, such as bus_data.csv.
+
+        Args:
+            csv_path (str): Path to the CSV file.
+
+        Returns:
+            route_graph: The compiled network.
+        """
+        routes = {}
+        with open(csv_path, newline='', encoding='utf-8-sig') as csvfile:
+            for row in csv.DictReader(csvfile):
+                routes.setdefault(row['route_name'], []).append(row['stop_name'])
+        return cls([(route, '', stops) for route, stops in routes.items()])
+
+    def save(self, path: str):
+        """
+        Writes the compiled arrays to a binary file.
+        """
+        state = {key: value for key, value in self.__dict__.items() if key in GRAPH_ARRAYS}
+        with open(path, 'wb') as file:
+            pickle.dump((GRAPH_FORMAT_VERSION, state), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> 'route_graph':
+        """
+        Reads a graph written by ``save``.
+
+        Raises:
+            ValueError: If the file was written by an incompatible version.
+        """
+        with open(path, 'rb') as file:
+            version, state = pickle.load(file)
+        if version != GRAPH_FORMAT_VERSION:
+            raise ValueError(f"Unsupported route graph version {version}")
+
+        obj = cls.__new__(cls)
+        obj.__dict__.update(state)
+        obj.stop_lookup = {name: stop for stop, name in enumerate(obj.stop_names)}
+        obj._build_views()
+        return obj
+
+    def plan(self, origin: str, destination: str, max_transfers: int = 2) -> list:
+        """
+        Finds the Pareto-optimal journeys between two stops: for each number of transfers up
+        to max_transfers, the journey with the fewest stops, if it beats every journey with
+        fewer transfers.
+
+        Args:
+            origin (str): Boarding stop name.
+            destination (str): Alighting stop name.
+            max_transfers (int): Maximum number of changes between routes.
+
+        Returns:
+            list: journey items, fewest transfers first; empty if the stops are unknown or unconnected.
+        """
+        source = self.stop_lookup.get(origin)
+        target = self.stop_lookup.get(destination)
+        if source is None or target is None or source == target:
+            return []
+
+        sequences = self.pattern_sequences
+        first_positions = self.stop_first_positions
+        infinity = 1 << 30
+
+        # Patterns reaching the target (scan limit = just past its last position) and, for the
+        # round before, the stops one ride before the target with the patterns serving them.
+        # The last two rounds only need to look at these.
+        target_limits = {pattern: position + 1 for pattern, position in self.stop_last_positions[target].items()}
+        target_patterns = frozenset(target_limits)
+
+        feeder_stops = feeder_patterns = None
+        if max_transfers >= 1:
+            feeder_stops = {target}
+            for pattern, limit in target_limits.items():
+                feeder_stops.update(sequences[pattern][:limit - 1])
+            feeder_patterns = frozenset().union(*[first_positions[stop] for stop in feeder_stops])
+
+        best = [infinity] * len(self.stop_names)
+        best[source] = 0
+        marked = [source]
+        parents = []
+        journeys = []
+
+        for ride in range(max_transfers + 1):
+            if ride == max_transfers:
+                allowed, useful = target_patterns, (target,)
+            elif ride == max_transfers - 1:
+                allowed, useful = feeder_patterns, feeder_stops
+            else:
+                allowed, useful = None, None
+
+            # Earliest marked position on every allowed pattern touching a stop improved last round
+            queue = {}
+            for stop in marked:
+                positions = first_positions[stop]
+                for pattern in (positions if allowed is None else allowed.intersection(positions)):
+                    position = positions[pattern]
+                    if position < queue.get(pattern, infinity):
+                        queue[pattern] = position
+
+            previous = best[:]
+            round_parents = {}
+            improved = []
+            target_best = best[target]
+
+            for pattern, first in queue.items():
+                sequence = sequences[pattern]
+                end = len(sequence)
+                if ride == max_transfers:
+                    end = target_limits[pattern]
+                elif useful is not None:
+                    # Nothing after the last useful stop can improve a kept label
+                    while end > first and sequence[end - 1] not in useful:
+                        end -= 1
+
+                # The cost of riding to position i is base + i, where base = label - position of
+                # the boarding stop; an unreached boarding stop leaves base + i >= infinity.
+                base = infinity
+                board = first
+                for position in range(first, end):
+                    stop = sequence[position]
+                    cost = base + position
+                    if cost < best[stop] and cost < target_best and (useful is None or stop in useful):
+                        best[stop] = cost
+                        round_parents[stop] = (pattern, board, position)
+                        improved.append(stop)
+                        if stop == target:
+                            target_best = cost
+                    label = previous[stop] - position
+                    if label < base:
+                        base = label
+                        board = position
+
+            parents.append(round_parents)
+            if target in round_parents:
+                journeys.append(self._reconstruct(parents, target, best[target]))
+            if not improved:
+                break
+            marked = improved
+
+        return journeys
+
+    def _reconstruct(self, parents: list, target: int, cost: int) -> journey:
+        legs = []
+        stop = target
+        for round_parents in reversed(parents):
+            step = round_parents.get(stop)
+            if step is None:
+                continue
+            pattern, board_position, alight_position = step
+            board_stop = self.pattern_sequences[pattern][board_position]
+            legs.append(journey_leg(
+                self.pattern_routes[pattern],
+                self.pattern_directions[pattern],
+                self.stop_names[board_stop],
+                self.stop_names[stop],
+                alight_position - board_position,
+            ))
+            stop = board_stop
+        legs.reverse()
+        return journey(legs, len(legs) - 1, cost)
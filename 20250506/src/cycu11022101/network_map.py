@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+This module renders the whole bus network to one Folium map whose size grows with the data, not
+with per-marker HTML. Stops shared by several routes are merged into one point, and all points go
+into a single FastMarkerCluster layer fed from a compact array. Popups are built in the browser
+when a stop is clicked, from name and route tables embedded once in the page. Route lines are
+stored as lists of stop indices into the same points, drawn on a canvas and hidden until switched
+on in the layer control.
+
+Needs folium (``pip install cycu11022101[maps]``).
+
+Usage:
+    python -m cycu11022101.network_map [--bus-info data/BUS_INFO] [--names data/bus_info_tist.csv] [--output bus_network_map.html]
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from typing import NamedTuple
+
+import folium
+from folium.plugins import FastMarkerCluster
+from folium.template import Template
+from sqlalchemy import select
+
+from cycu11022101.ebus_db import get_engine, route_info_busstop_table, route_list_table
+
+
+TAIPEI_CENTER = (25.0330, 121.5654)
+
+# Decimal places kept for coordinates, about 1 m
+COORDINATE_DIGITS = 5
+
+DIRECTION_LABELS = {'go': '去程', 'come': '返程'}
+
+# Rows are [latitude, longitude, stop index]; the callback also keeps each point for the route lines
+_MARKER_CALLBACK = """
+function (row) {
+    NETWORK_POINTS[row[2]] = [row[0], row[1]];
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {radius: 5, weight: 1, color: '#8b0000', fillColor: '#e34a33', fillOpacity: 0.8});
+    marker.bindPopup(function () { return networkStopPopup(row[2]); }, {maxWidth: 300});
+    return marker;
+}
+"""
+
+# Popups are built as DOM nodes from the embedded tables when opened, so names are never parsed as HTML
+_POPUP_SCRIPT = """
+var NETWORK_ROUTES = %(routes)s;
+var NETWORK_STOPS = %(stops)s;
+var NETWORK_POINTS = [];
+function networkStopPopup(index) {
+    var stop = NETWORK_STOPS[index];
+    var box = document.createElement('div');
+    var title = document.createElement('b');
+    title.textContent = stop[0];
+    box.appendChild(title);
+    var routes = document.createElement('div');
+    routes.textContent = stop[1].length + ' 條路線：' + stop[1].map(function (route) {
+        return NETWORK_ROUTES[route];
+    }).join('、');
+    box.appendChild(routes);
+    return box;
+}
+"""
+
+
+class route_lines(folium.MacroElement):
+    """
+    Polylines of route directions given as stop indices, added to the parent layer in the browser.
+
+    Must be rendered after the stop cluster, which fills NETWORK_POINTS.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function () {
+                var lines = {{ this.lines|tojson }};
+                for (var i = 0; i < lines.length; i++) {
+                    var points = lines[i][1].map(function (index) { return NETWORK_POINTS[index]; });
+                    L.polyline(points, {color: '#3182bd', weight: 2, opacity: 0.5})
+                        .bindTooltip(document.createTextNode(lines[i][0]), {sticky: true})
+                        .addTo({{ this._parent.get_name() }});
+                }
+            })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, lines: list):
+        """
+        Args:
+            lines (list): (label, [stop index, ...]) per route direction.
+        """
+        super().__init__()
+        self._name = 'RouteLines'
+        self.lines = lines
+
+
+class map_report(NamedTuple):
+    """
+    Outcome of rendering a network map.
+
+    Attributes:
+        path (str): The HTML file written.
+        stops (int): Stop points drawn, after merging shared stops.
+        stop_rows (int): Stop rows read from the routes before merging.
+        routes (int): Route directions drawn as lines.
+        bytes_written (int): Size of the HTML file.
+        elapsed (float): Seconds spent building and writing the map.
+    """
+    path: str
+    stops: int
+    stop_rows: int
+    routes: int
+    bytes_written: int
+    elapsed: float
+
+
+def _script_json(value) -> str:
+    # Keeps a '</script>' inside a stop name from closing the embedding script element
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+
+def _float(value: str) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class bus_network:
+    """
+    Stops and route lines of the whole network, with stops shared by several routes merged.
+
+    ``stops`` holds [latitude, longitude, name, route indices] per merged stop, ``route_names``
+    the labels the route indices refer to, and ``lines`` (label, [stop index, ...]) per route direction.
+    """
+
+    def __init__(self, patterns: list):
+        """
+        Merges the stops of ordered stop sequences.
+
+        Stops are the same point when they share a UniStopId, or when they have no ID and share
+        their name and rounded coordinates.
+
+        Args:
+            patterns (list): (route name, direction, [(stop_id, stop_name, latitude, longitude), ...]) tuples,
+                stops in travel order.
+        """
+        self.stops = []
+        self.route_names = []
+        self.lines = []
+        self.stop_rows = 0
+
+        stop_lookup = {}
+        route_lookup = {}
+        for route, direction, stops in patterns:
+            route_index = route_lookup.get(route)
+            if route_index is None:
+                route_index = route_lookup[route] = len(self.route_names)
+                self.route_names.append(route)
+
+            line = []
+            for stop_id, stop_name, latitude, longitude in stops:
+                if latitude is None or longitude is None:
+                    continue
+                self.stop_rows += 1
+                latitude, longitude = round(latitude, COORDINATE_DIGITS), round(longitude, COORDINATE_DIGITS)
+
+                key = stop_id if stop_id is not None else (stop_name, latitude, longitude)
+                index = stop_lookup.get(key)
+                if index is None:
+                    index = stop_lookup[key] = len(self.stops)
+                    self.stops.append([latitude, longitude, stop_name, []])
+                if route_index not in self.stops[index][3]:
+                    self.stops[index][3].append(route_index)
+                line.append(index)
+
+            if len(line) > 1:
+                label = f"{route} ({DIRECTION_LABELS.get(direction, direction)})" if direction else route
+                self.lines.append((label, line))
+
+    @classmethod
+    def from_bus_info_folder(cls, folder: str = 'data/BUS_INFO', route_names_csv: str = None) -> 'bus_network':
+        """
+        Reads the per-direction CSVs written by the crawlers (bus_route_{rid}_{direction}.csv).
+
+        Args:
+            folder (str): Folder holding the CSVs.
+            route_names_csv (str): Optional "Route ID,Route Name" catalogue (e.g. data/bus_info_tist.csv)
+                used to label routes with names instead of IDs.
+
+        Returns:
+            bus_network: The network.
+        """
+        names = {}
+        if route_names_csv and os.path.exists(route_names_csv):
+            with open(route_names_csv, newline='', encoding='utf-8-sig') as csvfile:
+                for row in csv.reader(csvfile):
+                    if len(row) >= 2:
+                        names[row[0]] = row[1]
+
+        patterns = []
+        for path in sorted(glob.glob(os.path.join(folder, 'bus_route_*_*.csv'))):
+            route_id, direction = os.path.basename(path)[len('bus_route_'):-len('.csv')].rsplit('_', 1)
+            with open(path, newline='', encoding='utf-8') as csvfile:
+                rows = [row for row in csv.DictReader(csvfile) if row.get('stop_name')]
+            rows.sort(key=lambda row: int(row['stop_number']) if row['stop_number'].isdigit() else 0)
+            patterns.append((names.get(route_id, route_id), direction, [
+                (int(row['stop_id']) if row['stop_id'].isdigit() else None, row['stop_name'],
+                 _float(row['latitude']), _float(row['longitude']))
+                for row in rows
+            ]))
+        return cls(patterns)
+
+    @classmethod
+    def from_database(cls, working_directory: str = 'data') -> 'bus_network':
+        """
+        Reads data_route_info_busstop, labelling routes with their names from data_route_list.
+
+        Args:
+            working_directory (str): Directory holding the database file.
+
+        Returns:
+            bus_network: The network.
+        """
+        stops = route_info_busstop_table.c
+        with get_engine(working_directory).connect() as connection:
+            names = dict(connection.execute(select(route_list_table.c.route_id, route_list_table.c.route_name)).all())
+            rows = connection.execute(
+                select(stops.route_id, stops.direction, stops.stop_id, stops.stop_name, stops.latitude, stops.longitude)
+                .order_by(stops.route_id, stops.direction, stops.stop_number)
+            ).all()
+
+        patterns = {}
+        for route_id, direction, stop_id, stop_name, latitude, longitude in rows:
+            patterns.setdefault((route_id, direction), []).append((stop_id, stop_name, latitude, longitude))
+        return cls([
+            (names.get(route_id) or route_id, direction, stops)
+            for (route_id, direction), stops in patterns.items()
+        ])
+
+    def render(self, include_routes: bool = True, show_routes: bool = False) -> folium.Map:
+        """
+        Builds the map.
+
+        Args:
+            include_routes (bool): Whether the route lines are embedded at all.
+            show_routes (bool): Whether the route lines are shown on load; they can be switched on in the layer control.
+
+        Returns:
+            folium.Map: The map.
+        """
+        if self.stops:
+            center = [sum(stop[0] for stop in self.stops) / len(self.stops),
+                      sum(stop[1] for stop in self.stops) / len(self.stops)]
+        else:
+            center = list(TAIPEI_CENTER)
+
+        network_map = folium.Map(location=center, zoom_start=12, prefer_canvas=True)
+        popup_script = _POPUP_SCRIPT % {
+            'routes': _script_json(self.route_names),
+            'stops': _script_json([[stop[2], stop[3]] for stop in self.stops]),
+        }
+        network_map.get_root().header.add_child(folium.Element(f'<script>{popup_script}</script>'))
+
+        FastMarkerCluster(
+            [[stop[0], stop[1], index] for index, stop in enumerate(self.stops)],
+            callback=_MARKER_CALLBACK,
+            name=f'站牌 ({len(self.stops)})',
+            disable_clustering_at_zoom=17,
+        ).add_to(network_map)
+
+        if include_routes and self.lines:
+            routes_layer = folium.FeatureGroup(name=f'路線 ({len(self.lines)})', show=show_routes)
+            route_lines(self.lines).add_to(routes_layer)
+            routes_layer.add_to(network_map)
+
+        folium.LayerControl(collapsed=False).add_to(network_map)
+        return network_map
+
+    def save(self, path: str = 'bus_network_map.html', include_routes: bool = True,
+             show_routes: bool = False) -> map_report:
+        """
+        Renders the map to one HTML file.
+
+        Args:
+            path (str): File to write.
+            include_routes (bool): See ``render``.
+            show_routes (bool): See ``render``.
+
+        Returns:
+            map_report: What was drawn and how large the file is.
+        """
+        started = time.perf_counter()
+        self.render(include_routes, show_routes).save(path)
+        return map_report(
+            path, len(self.stops), self.stop_rows, len(self.lines) if include_routes else 0,
+            os.path.getsize(path), time.perf_counter() - started,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every Taipei bus route to one map")
+    parser.add_argument("--bus-info", default="data/BUS_INFO", help="folder of bus_route_{rid}_{direction}.csv files")
+    parser.add_argument("--names", default="data/bus_info_tist.csv", help="Route ID,Route Name catalogue")
+    parser.add_argument("--database", default=None, help="read this working directory's database instead of the CSVs")
+    parser.add_argument("--output", default="bus_network_map.html")
+    parser.add_argument("--no-routes", action="store_true", help="leave the route lines out")
+    parser.add_argument("--show-routes", action="store_true", help="show the route lines on load")
+    args = parser.parse_args()
+
+    if args.database:
+        network = bus_network.from_database(args.database)
+    else:
+        network = bus_network.from_bus_info_folder(args.bus_info, args.names)
+    report = network.save(args.output, not args.no_routes, args.show_routes)
+    print(f"{report.stops} stops (from {report.stop_rows} stop rows) and {report.routes} route lines "
+          f"written to {report.path}: {report.bytes_written / 1024:.0f} KiB in {report.elapsed:.2f}s")
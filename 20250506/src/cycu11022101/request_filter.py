@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+This module keeps the eBus fetchers from downloading what they never read. The scrapers only look at
+DOM text and hidden inputs, so images, fonts, stylesheets, media, map tiles and analytics are aborted
+before they are requested: through a Playwright ``route()`` handler, or for the Selenium scripts through
+Chrome preferences and the DevTools ``Network.setBlockedURLs`` command. Both report per page how many
+requests went out, how many were blocked and how many bytes were transferred.
+"""
+
+import json
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+
+BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet'})
+
+FIRST_PARTY_HOSTS = ('ebus.gov.taipei',)
+
+# Third-party hosts the pages do not work without: jQuery and the hCaptcha widget
+ESSENTIAL_HOSTS = ('ajax.googleapis.com', 'hcaptcha.com')
+
+_BLOCKED_EXTENSIONS = (
+    'png', 'jpg', 'jpeg', 'gif', 'svg', 'webp', 'ico', 'bmp',
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    'css', 'mp4', 'webm', 'mp3',
+)
+
+# Chrome's counterpart of the Playwright filter: it matches URLs only, so types are told apart by extension
+BLOCKED_URL_PATTERNS = tuple(
+    [pattern for extension in _BLOCKED_EXTENSIONS for pattern in (f'*.{extension}', f'*.{extension}?*')]
+    + [
+        '*/css?v=*',  # ebus.gov.taipei's bundled stylesheets
+        '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*',
+        '*maps.nlsc.gov.tw*', '*tile.openstreetmap.org*',
+    ]
+)
+
+_TRANSFER_SIZE_JS = (
+    "performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'))"
+    ".reduce((total, entry) => total + (entry.transferSize || 0), 0)"
+)
+
+
+class filter_stats(NamedTuple):
+    """
+    Requests of one page (or of every page since a reset).
+
+    Attributes:
+        requests (int): Requests the page made, blocked ones included.
+        blocked (int): Requests aborted before they went out.
+        bytes_loaded (int): Bytes transferred for the requests that went out.
+        blocked_by_reason (dict): Blocked requests per resource type or 'third-party'.
+    """
+    requests: int
+    blocked: int
+    bytes_loaded: int
+    blocked_by_reason: dict
+
+
+class request_filter:
+    """
+    Playwright request interception that aborts non-essential resource types and third-party hosts.
+
+    Routing turns off Playwright's HTTP cache for the page or context it is installed on.
+    """
+
+    def __init__(self, blocked_types: frozenset = BLOCKED_RESOURCE_TYPES,
+                 allowed_hosts: tuple = FIRST_PARTY_HOSTS + ESSENTIAL_HOSTS):
+        """
+        Initializes the filter with empty counters.
+
+        Args:
+            blocked_types (frozenset): Playwright resource types to abort.
+            allowed_hosts (tuple): Hosts (and their subdomains) requests may go to; None allows every host.
+        """
+        self.blocked_types = blocked_types
+        self.allowed_hosts = allowed_hosts
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the counters, e.g. before the next page.
+        """
+        self.requests = 0
+        self.blocked = 0
+        self.bytes_loaded = 0
+        self.blocked_by_reason = {}
+
+    def block_reason(self, resource_type: str, url: str) -> str:
+        """
+        Decides whether a request is blocked.
+
+        Args:
+            resource_type (str): Playwright resource type, e.g. 'document', 'script' or 'image'.
+            url (str): The request URL.
+
+        Returns:
+            str: The resource type or 'third-party' if the request is blocked, otherwise None.
+        """
+        if resource_type in self.blocked_types:
+            return resource_type
+
+        host = urlsplit(url).hostname
+        if host and self.allowed_hosts is not None and not any(
+            host == allowed or host.endswith('.' + allowed) for allowed in self.allowed_hosts
+        ):
+            return 'third-party'
+        return None
+
+    def _should_abort(self, request) -> bool:
+        self.requests += 1
+        reason = self.block_reason(request.resource_type, request.url)
+        if reason is None:
+            return False
+
+        self.blocked += 1
+        self.blocked_by_reason[reason] = self.blocked_by_reason.get(reason, 0) + 1
+        return True
+
+    def handle(self, route):
+        """
+        Route handler for the Playwright sync API.
+        """
+        if self._should_abort(route.request):
+            route.abort()
+        else:
+            route.continue_()
+
+    async def handle_async(self, route):
+        """
+        Route handler for the Playwright async API.
+        """
+        if self._should_abort(route.request):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def install(self, target):
+        """
+        Routes every request of a sync Playwright page or browser context through the filter.
+
+        Args:
+            target: playwright.sync_api.Page or BrowserContext.
+
+        Returns:
+            request_filter: The filter itself, for chaining.
+        """
+        target.route('**/*', self.handle)
+        return self
+
+    async def install_async(self, target):
+        """
+        Routes every request of an async Playwright page or browser context through the filter.
+
+        Args:
+            target: playwright.async_api.Page or BrowserContext.
+
+        Returns:
+            request_filter: The filter itself, for chaining.
+        """
+        await target.route('**/*', self.handle_async)
+        return self
+
+    def measure(self, page) -> filter_stats:
+        """
+        Adds the page's transferred bytes, as reported by the Resource Timing API, and returns the counters.
+
+        Cross-origin responses without Timing-Allow-Origin count as 0 bytes.
+
+        Args:
+            page (playwright.sync_api.Page): The page that was loaded.
+
+        Returns:
+            filter_stats: The counters since the last reset.
+        """
+        self.bytes_loaded += int(page.evaluate(f'() => {_TRANSFER_SIZE_JS}') or 0)
+        return self.stats()
+
+    async def measure_async(self, page) -> filter_stats:
+        """
+        Coroutine version of ``measure`` for an async Playwright page.
+        """
+        self.bytes_loaded += int(await page.evaluate(f'() => {_TRANSFER_SIZE_JS}') or 0)
+        return self.stats()
+
+    def stats(self) -> filter_stats:
+        """
+        Returns the counters since the last reset.
+
+        Returns:
+            filter_stats: The counters.
+        """
+        return filter_stats(self.requests, self.blocked, self.bytes_loaded, dict(self.blocked_by_reason))
+
+
+def add_chrome_blocking_options(options):
+    """
+    Adds the Chrome settings used by ``block_chrome_requests`` to Selenium ChromeOptions: images off
+    and the performance log on, so per-page request counts can be read back.
+
+    Args:
+        options (selenium.webdriver.chrome.options.Options): Options to extend.
+
+    Returns:
+        Options: The same options.
+    """
+    options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return options
+
+
+def block_chrome_requests(driver, patterns: tuple = BLOCKED_URL_PATTERNS):
+    """
+    Makes a running Chrome WebDriver refuse URLs matching the patterns, through the DevTools protocol.
+
+    Args:
+        driver (selenium.webdriver.Chrome): The driver.
+        patterns (tuple): URL patterns with '*' wildcards.
+    """
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(patterns)})
+
+
+def chrome_page_stats(driver) -> filter_stats:
+    """
+    Counts the requests since the previous call from Chrome's performance log, which this call empties.
+
+    Needs the options from ``add_chrome_blocking_options``.
+
+    Args:
+        driver (selenium.webdriver.Chrome): The driver.
+
+    Returns:
+        filter_stats: Requests sent, requests blocked (by 'blocked-url' or another Chrome reason)
+            and encoded bytes received.
+    """
+    requests = blocked = bytes_loaded = 0
+    blocked_by_reason = {}
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        method, params = message.get('method'), message.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            requests += 1
+        elif method == 'Network.loadingFinished':
+            bytes_loaded += int(params.get('encodedDataLength', 0))
+        elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+            blocked += 1
+            reason = 'blocked-url' if params['blockedReason'] == 'inspector' else params['blockedReason']
+            blocked_by_reason[reason] = blocked_by_reason.get(reason, 0) + 1
+    return filter_stats(requests, blocked, bytes_loaded, blocked_by_reason)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+This module answers route name to route ID lookups from the local route catalogue instead of
+scraping the eBus route list on every start. The catalogue is read once from data_route_list
+(seeded from bus_info_tist.csv when the table is empty) into in-memory dicts. When it is older
+than its TTL it is refreshed from the website on a background thread, and lookups keep answering
+from the copy already loaded until the refresh lands.
+"""
+
+import csv
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from cycu11022101.ebus_db import get_engine, route_catalogue_table, route_list_table, upsert_rows
+from cycu11022101.ebus_http import fetch_route_list
+
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+# Seconds before a failed background refresh is tried again in the same process
+RETRY_AFTER = 15 * 60
+
+ROUTE_NAMES_CSV = 'bus_info_tist.csv'
+
+ROUTE_LINK_RE = re.compile(r'<li><a href="javascript:go\(\'(.*?)\'\)">(.*?)</a></li>', re.DOTALL)
+
+
+def parse_route_links(content: str) -> list:
+    """
+    Reads the route links of a route list page.
+
+    Args:
+        content (str): The HTML document.
+
+    Returns:
+        list: (route_id, route_name) tuples in page order, each route ID once.
+    """
+    pairs = {}
+    for route_id, route_name in ROUTE_LINK_RE.findall(content):
+        pairs.setdefault(route_id, route_name.strip())
+    return list(pairs.items())
+
+
+def fetch_route_pairs() -> list:
+    """
+    Downloads the route list over plain HTTP and reads its route links.
+
+    Returns:
+        list: (route_id, route_name) tuples.
+    """
+    return parse_route_links(fetch_route_list())
+
+
+def mark_refreshed(engine, source: str, route_count: int, refreshed_at: float = None):
+    """
+    Records that data_route_list was just refreshed, so catalogues consider it fresh.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Database holding data_route_list.
+        source (str): Where the routes came from, e.g. 'http', 'browser' or 'csv'.
+        route_count (int): Number of routes written.
+        refreshed_at (float): Seconds since the epoch; the current time if omitted.
+    """
+    upsert_rows(engine, route_catalogue_table, [{
+        'source': source,
+        'refreshed_at': time.time() if refreshed_at is None else refreshed_at,
+        'route_count': route_count,
+    }])
+
+
+class route_catalogue:
+    """
+    In-memory route name and route ID lookups backed by data_route_list, refreshed in the background when stale.
+    """
+
+    def __init__(self, working_directory: str = 'data', ttl: float = DEFAULT_TTL, refresher=None,
+                 csv_path: str = None, auto_refresh: bool = True):
+        """
+        Initializes the catalogue and loads it from the database.
+
+        Args:
+            working_directory (str): Directory holding the database file and bus_info_tist.csv.
+            ttl (float): Seconds after the last refresh before the catalogue is refreshed again.
+            refresher (callable): Function returning (route_id, route_name) tuples from the website;
+                ``fetch_route_pairs`` if omitted.
+            csv_path (str): "Route ID,Route Name" CSV used when data_route_list is empty;
+                bus_info_tist.csv in the working directory if omitted.
+            auto_refresh (bool): Whether a stale catalogue starts a background refresh on load and on lookups.
+        """
+        self.working_directory = working_directory
+        self.ttl = ttl
+        self.refresher = refresher or fetch_route_pairs
+        self.csv_path = csv_path or os.path.join(working_directory, ROUTE_NAMES_CSV)
+        self.auto_refresh = auto_refresh
+        self.engine = get_engine(working_directory)
+
+        self.by_name = {}
+        self.by_id = {}
+        self.refreshed_at = None
+        self.last_error = None
+        self.refreshes = 0
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._next_attempt = 0.0
+
+        self.load()
+        if auto_refresh:
+            self.refresh_in_background()
+
+    def _set(self, pairs: list, refreshed_at: float):
+        by_name, by_id = {}, {}
+        for route_id, route_name in pairs:
+            by_id.setdefault(route_id, route_name)
+            by_name.setdefault(route_name, route_id)
+        with self._lock:
+            self.by_name, self.by_id, self.refreshed_at = by_name, by_id, refreshed_at
+
+    def _seed_from_csv(self) -> list:
+        """
+        Copies the CSV catalogue into data_route_list, stamped with the file's modification time.
+        """
+        if not os.path.exists(self.csv_path):
+            return []
+
+        pairs = {}
+        with open(self.csv_path, newline='', encoding='utf-8-sig') as csvfile:
+            for row in list(csv.reader(csvfile))[1:]:
+                if len(row) >= 2 and row[0]:
+                    pairs.setdefault(row[0], row[1].strip())
+
+        rows = [{'route_id': route_id, 'route_name': route_name} for route_id, route_name in pairs.items()]
+        upsert_rows(self.engine, route_list_table, rows)
+        mark_refreshed(self.engine, 'csv', len(rows), os.path.getmtime(self.csv_path))
+        return list(pairs.items())
+
+    def load(self) -> int:
+        """
+        Reads the catalogue from data_route_list, seeding the table from the CSV if it is empty.
+
+        Returns:
+            int: Number of routes loaded.
+        """
+        with self.engine.connect() as connection:
+            pairs = [tuple(row) for row in connection.execute(
+                select(route_list_table.c.route_id, route_list_table.c.route_name)
+            )]
+        if not pairs:
+            pairs = self._seed_from_csv()
+
+        with self.engine.connect() as connection:
+            refreshed_at = connection.execute(select(func.max(route_catalogue_table.c.refreshed_at))).scalar()
+
+        self._set(pairs, refreshed_at)
+        return len(pairs)
+
+    def age(self, now: float = None) -> float:
+        """
+        Returns the seconds since the last refresh, or None if the catalogue was never refreshed.
+        """
+        if self.refreshed_at is None:
+            return None
+        return (time.time() if now is None else now) - self.refreshed_at
+
+    def is_stale(self, now: float = None) -> bool:
+        """
+        Tells whether the catalogue is empty, was never refreshed or is at least ``ttl`` seconds old.
+        """
+        age = self.age(now)
+        return not self.by_id or age is None or age >= self.ttl
+
+    def refresh(self) -> int:
+        """
+        Refreshes data_route_list and the in-memory lookups from the website, on the calling thread.
+
+        Routes already in the table keep their route_data_updated flag.
+
+        Returns:
+            int: Number of routes read.
+
+        Raises:
+            ValueError: If the route list page yields no routes.
+        """
+        pairs = self.refresher()
+        if not pairs:
+            raise ValueError("No routes found on the route list page")
+
+        upsert_rows(self.engine, route_list_table,
+                    [{'route_id': route_id, 'route_name': route_name} for route_id, route_name in pairs])
+        refreshed_at = time.time()
+        mark_refreshed(self.engine, 'http', len(pairs), refreshed_at)
+        self._set(pairs, refreshed_at)
+        self.refreshes += 1
+        return len(pairs)
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+            self._next_attempt = time.time() + min(self.ttl, RETRY_AFTER)
+
+    def refresh_in_background(self) -> bool:
+        """
+        Starts a background refresh if the catalogue is stale and no refresh is running or recently failed.
+
+        Returns:
+            bool: True if a refresh was started.
+        """
+        if not self.is_stale() or time.time() < self._next_attempt:
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return False
+
+        self._thread = threading.Thread(target=self._refresh_quietly, name='route_catalogue_refresh', daemon=True)
+        self._thread.start()
+        return True
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits for a running background refresh.
+
+        Args:
+            timeout (float): Seconds to wait at most; no limit if omitted.
+
+        Returns:
+            bool: True if no refresh is running any more.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def route_id(self, route_name: str) -> str:
+        """
+        Looks up a route ID by route name.
+
+        Args:
+            route_name (str): Name as shown on the eBus site, e.g. '299' or '0東'.
+
+        Returns:
+            str: The route ID, or None if the name is unknown.
+        """
+        if self.auto_refresh:
+            self.refresh_in_background()
+        return self.by_name.get(route_name.strip())
+
+    def route_name(self, route_id: str) -> str:
+        """
+        Looks up a route name by route ID.
+
+        Args:
+            route_id (str): The ID of the bus route.
+
+        Returns:
+            str: The route name, or None if the ID is unknown.
+        """
+        if self.auto_refresh:
+            self.refresh_in_background()
+        return self.by_id.get(route_id)
+
+    def routes(self) -> list:
+        """
+        Lists every route in catalogue order.
+
+        Returns:
+            list: Dicts with 'name' and 'route_id' keys.
+        """
+        return [{'name': route_name, 'route_id': route_id} for route_id, route_name in self.by_id.items()]
+
+    def __len__(self) -> int:
+        return len(self.by_id)
@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+"""
+This module keeps rendered eBus pages in one content-addressed SQLite file (ebus_snapshots.sqlite3)
+instead of one ebus_taipei_{route_id}_{direction}.html file per fetch.
+
+Identical pages are stored once, keyed by their SHA-1. Each blob is compressed against a
+dictionary trained on sample pages, so the site chrome shared by every page costs almost nothing.
+A new store trains its first dictionary on its own once enough pages have been put, and
+recompresses those pages against it.
+zstandard is used when installed, otherwise zlib with a preset dictionary. An index maps
+(route_id, direction, fetched_at) to blobs, and readers can stream-decompress a snapshot as text.
+"""
+
+import argparse
+import collections
+import glob
+import hashlib
+import io
+import os
+import random
+import time
+import zlib
+
+from sqlalchemy import (
+    create_engine, select, func, update, bindparam, MetaData, Table, Column, String, Float, Integer, LargeBinary
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is always available
+    zstandard = None
+
+
+SNAPSHOT_DB_FILENAME = 'ebus_snapshots.sqlite3'
+
+ZSTD_LEVEL = 9
+ZSTD_DICT_SIZE = 512 * 1024
+ZLIB_LEVEL = 9
+ZLIB_DICT_SIZE = 32 * 1024  # zlib only looks back 32 KiB, so a larger preset dictionary is wasted
+STREAM_BUFFER_SIZE = 256 * 1024
+AUTO_TRAIN_SAMPLES = 32  # pages stored without a dictionary before the first one is trained on them
+
+snapshot_metadata = MetaData()
+
+dictionaries_table = Table(
+    'snapshot_dictionaries', snapshot_metadata,
+    Column('dict_id', Integer, primary_key=True, autoincrement=True),
+    Column('codec', String),
+    Column('data', LargeBinary),
+    Column('created_at', Float),
+)
+
+blobs_table = Table(
+    'snapshot_blobs', snapshot_metadata,
+    Column('sha1', String, primary_key=True),
+    Column('codec', String),
+    Column('dict_id', Integer),
+    Column('raw_size', Integer),
+    Column('data', LargeBinary),
+)
+
+snapshots_table = Table(
+    'snapshots', snapshot_metadata,
+    Column('route_id', String, primary_key=True),
+    Column('direction', String, primary_key=True),
+    Column('fetched_at', Float, primary_key=True),
+    Column('sha1', String),
+)
+
+_stores = {}
+
+
+def default_codec() -> str:
+    """
+    Returns 'zstd' if the zstandard package is installed, otherwise 'zlib'.
+    """
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def _common_chrome(samples: list, size: int) -> bytes:
+    # zlib has no dictionary trainer: keep the lines most pages share, most common last,
+    # because zlib prefers the end of a preset dictionary
+    counts = collections.Counter()
+    for sample in samples:
+        counts.update(set(sample.split(b'\n')))
+
+    shared = [line for line, count in counts.items() if count * 2 >= len(samples) and line.strip()]
+    shared.sort(key=lambda line: (counts[line], len(line)))
+    return b'\n'.join(shared)[-size:]
+
+
+class _zlib_reader(io.RawIOBase):
+    """
+    Incrementally inflates a zlib blob compressed with a preset dictionary.
+    """
+
+    def __init__(self, data: bytes, zdict: bytes = None, chunk_size: int = 64 * 1024):
+        self._source = io.BytesIO(data)
+        self._inflater = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        self._chunk_size = chunk_size
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = self._source.read(self._chunk_size)
+            if not chunk:
+                self._pending = self._inflater.flush()
+                break
+            self._pending = self._inflater.decompress(chunk)
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class snapshot_store:
+    """
+    Content-addressed, dictionary-compressed store of rendered StopsOfRoute pages.
+    """
+
+    def __init__(self, working_directory: str = 'data', codec: str = None, auto_train: int = AUTO_TRAIN_SAMPLES):
+        """
+        Opens (or creates) the store in a working directory.
+
+        Args:
+            working_directory (str): Directory holding ebus_snapshots.sqlite3.
+            codec (str): 'zstd' or 'zlib' for new blobs; defaults to zstd when installed.
+            auto_train (int): Number of pages stored without a dictionary after which ``put`` trains
+                one on them; 0 turns automatic training off.
+
+        Raises:
+            ValueError: If the codec is unknown or zstd is requested without zstandard installed.
+        """
+        self.codec = codec or default_codec()
+        if self.codec not in ('zstd', 'zlib'):
+            raise ValueError("Codec must be 'zstd' or 'zlib'")
+        if self.codec == 'zstd' and zstandard is None:
+            raise ValueError("The 'zstd' codec needs the zstandard package")
+
+        self.working_directory = working_directory
+        self.auto_train = auto_train
+        self.engine = create_engine(f'sqlite:///{working_directory}/{SNAPSHOT_DB_FILENAME}')
+        snapshot_metadata.create_all(self.engine)
+        self._dictionaries = {}
+        self._zstd_compressors = {}
+        self._zstd_decompressors = {}
+        self._current_dict_id = None
+
+    # Dictionaries
+
+    def _dictionary(self, dict_id: int) -> bytes:
+        if dict_id not in self._dictionaries:
+            with self.engine.connect() as connection:
+                self._dictionaries[dict_id] = connection.execute(
+                    select(dictionaries_table.c.data).where(dictionaries_table.c.dict_id == dict_id)
+                ).scalar_one()
+        return self._dictionaries[dict_id]
+
+    def current_dictionary(self) -> int:
+        """
+        Returns the ID of the newest dictionary for this store's codec, or None if none was trained.
+        """
+        if self._current_dict_id is None:
+            with self.engine.connect() as connection:
+                self._current_dict_id = connection.execute(
+                    select(func.max(dictionaries_table.c.dict_id)).where(dictionaries_table.c.codec == self.codec)
+                ).scalar()
+        return self._current_dict_id
+
+    def train_dictionary(self, samples: list, size: int = None, connection=None) -> int:
+        """
+        Trains a compression dictionary on sample pages and makes it current for new blobs.
+
+        Args:
+            samples (list): Page contents (str or bytes); a few dozen pages are enough.
+            size (int): Dictionary size in bytes; defaults to 512 KiB for zstd and 32 KiB for zlib.
+            connection (sqlalchemy.engine.Connection): Open connection to join its transaction instead.
+
+        Returns:
+            int: The new dictionary's ID.
+
+        Raises:
+            ValueError: If no samples are given.
+        """
+        samples = [sample.encode('utf-8') if isinstance(sample, str) else sample for sample in samples if sample]
+        if not samples:
+            raise ValueError("No samples to train a dictionary on")
+
+        if self.codec == 'zstd':
+            data = zstandard.train_dictionary(size or ZSTD_DICT_SIZE, samples).as_bytes()
+        else:
+            data = _common_chrome(samples, size or ZLIB_DICT_SIZE)
+
+        if connection is None:
+            with self.engine.begin() as connection:
+                return self.train_dictionary(samples, size, connection)
+
+        dict_id = connection.execute(dictionaries_table.insert().values(
+            codec=self.codec, data=data, created_at=time.time()
+        )).inserted_primary_key[0]
+        self._dictionaries[dict_id] = data
+        self._current_dict_id = dict_id
+        return dict_id
+
+    def _train_on_stored(self):
+        # Until a dictionary exists, pages are stored without one; once enough have piled up they
+        # become the training samples and are recompressed against the new dictionary
+        if not self.auto_train or self.current_dictionary() is not None:
+            return
+
+        untrained = (blobs_table.c.codec == self.codec) & blobs_table.c.dict_id.is_(None)
+        with self.engine.begin() as connection:
+            count = connection.execute(select(func.count()).select_from(blobs_table).where(untrained)).scalar()
+            if count < self.auto_train:
+                return
+
+            decoder = self._decoder(self.codec, None)
+            pages = {
+                sha1: self._decompress(self.codec, decoder, data)
+                for sha1, data in connection.execute(select(blobs_table.c.sha1, blobs_table.c.data).where(untrained))
+            }
+            dict_id = self.train_dictionary(list(pages.values()), connection=connection)
+            connection.execute(
+                update(blobs_table).where(blobs_table.c.sha1 == bindparam('b_sha1')),
+                [{'b_sha1': sha1, 'dict_id': dict_id, 'data': self._compress(raw, dict_id)} for sha1, raw in pages.items()],
+            )
+
+    # Writing
+
+    def _compress(self, raw: bytes, dict_id: int) -> bytes:
+        zdict = self._dictionary(dict_id) if dict_id is not None else None
+        if self.codec == 'zstd':
+            # Loading a dictionary is the expensive part, so keep one compressor per dictionary
+            compressor = self._zstd_compressors.get(dict_id)
+            if compressor is None:
+                dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+                compressor = self._zstd_compressors[dict_id] = zstandard.ZstdCompressor(
+                    level=ZSTD_LEVEL, dict_data=dict_data
+                )
+            return compressor.compress(raw)
+
+        deflater = zlib.compressobj(ZLIB_LEVEL, zdict=zdict) if zdict else zlib.compressobj(ZLIB_LEVEL)
+        return deflater.compress(raw) + deflater.flush()
+
+    def put(self, route_id: str, direction: str, content: str, fetched_at: float = None, connection=None) -> str:
+        """
+        Stores a page. Pages identical to one already stored only add an index entry.
+
+        Without a connection, a store that has no dictionary yet trains one first once enough pages
+        are stored (see ``auto_train``). Callers passing a connection train their own dictionary,
+        as ``import_html_files`` does.
+
+        Args:
+            route_id (str): The unique identifier of the bus route.
+            direction (str): 'go' or 'come'.
+            content (str): The HTML document.
+            fetched_at (float): Unix time of the fetch; now if omitted.
+            connection (sqlalchemy.engine.Connection): Open connection to join its transaction instead.
+
+        Returns:
+            str: The SHA-1 of the page.
+        """
+        raw = content.encode('utf-8')
+        sha1 = hashlib.sha1(raw).hexdigest()
+        fetched_at = time.time() if fetched_at is None else fetched_at
+
+        if connection is None:
+            self._train_on_stored()
+            with self.engine.begin() as connection:
+                return self.put(route_id, direction, content, fetched_at, connection)
+
+        known = connection.execute(select(blobs_table.c.sha1).where(blobs_table.c.sha1 == sha1)).first()
+        if known is None:
+            dict_id = self.current_dictionary()
+            connection.execute(blobs_table.insert().values(
+                sha1=sha1, codec=self.codec, dict_id=dict_id, raw_size=len(raw), data=self._compress(raw, dict_id)
+            ))
+
+        stmt = sqlite_insert(snapshots_table).values(
+            route_id=route_id, direction=direction, fetched_at=fetched_at, sha1=sha1
+        )
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['route_id', 'direction', 'fetched_at'], set_={'sha1': stmt.excluded.sha1}
+        ))
+        return sha1
+
+    def import_html_files(self, folder: str = 'data', remove: bool = False, train_samples: int = 64) -> dict:
+        """
+        Moves ebus_taipei_{route_id}_{direction}.html files into the store, using each file's
+        mtime as its fetch time. A dictionary is trained on a sample first if none exists yet.
+
+        Args:
+            folder (str): Folder holding the HTML files.
+            remove (bool): Delete each file once it is stored.
+            train_samples (int): Number of pages sampled to train the dictionary.
+
+        Returns:
+            dict: Counts of imported, empty and removed files.
+        """
+        paths = []
+        for path in sorted(glob.glob(os.path.join(folder, 'ebus_taipei_*_*.html'))):
+            route_id, _, direction = os.path.basename(path)[len('ebus_taipei_'):-len('.html')].rpartition('_')
+            if direction in ('go', 'come'):
+                paths.append((path, route_id, direction))
+
+        if self.current_dictionary() is None:
+            candidates = [path for path, _, _ in paths if os.path.getsize(path) > 0]
+            sample = random.Random(0).sample(candidates, min(train_samples, len(candidates)))
+            if sample:
+                self.train_dictionary([open(path, 'rb').read() for path in sample])
+
+        counts = {'imported': 0, 'empty': 0, 'removed': 0}
+        with self.engine.begin() as connection:
+            for path, route_id, direction in paths:
+                with open(path, 'r', encoding='utf-8') as file:
+                    content = file.read()
+                if content:
+                    self.put(route_id, direction, content, os.path.getmtime(path), connection)
+                    counts['imported'] += 1
+                else:
+                    counts['empty'] += 1
+
+        # Files are only deleted after the transaction holding their pages has committed
+        if remove:
+            for path, _, _ in paths:
+                os.remove(path)
+                counts['removed'] += 1
+        return counts
+
+    # Reading
+
+    def _find(self, route_id: str, direction: str, at: float = None):
+        stmt = (
+            select(blobs_table.c.codec, blobs_table.c.dict_id, blobs_table.c.data)
+            .join(snapshots_table, snapshots_table.c.sha1 == blobs_table.c.sha1)
+            .where(snapshots_table.c.route_id == route_id, snapshots_table.c.direction == direction)
+            .order_by(snapshots_table.c.fetched_at.desc())
+            .limit(1)
+        )
+        if at is not None:
+            stmt = stmt.where(snapshots_table.c.fetched_at <= at)
+        with self.engine.connect() as connection:
+            return connection.execute(stmt).first()
+
+    def _locate(self, route_id: str, direction: str, at: float):
+        found = self._find(route_id, direction, at)
+        if found is None:
+            raise FileNotFoundError(f"No snapshot for route {route_id} ({direction})")
+
+        codec, dict_id, data = found
+        return codec, self._decoder(codec, dict_id), data
+
+    def _decoder(self, codec: str, dict_id: int):
+        # A cached ZstdDecompressor for zstd blobs, the preset dictionary (or None) for zlib blobs
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ValueError("This snapshot was compressed with zstd; install zstandard to read it")
+            decompressor = self._zstd_decompressors.get(dict_id)
+            if decompressor is None:
+                zdict = self._dictionary(dict_id) if dict_id is not None else None
+                dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+                decompressor = self._zstd_decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+            return decompressor
+        return self._dictionary(dict_id) if dict_id is not None else None
+
+    @staticmethod
+    def _decompress(codec: str, decoder, data: bytes) -> bytes:
+        if codec == 'zstd':
+            return decoder.decompress(data)
+
+        inflater = zlib.decompressobj(zdict=decoder) if decoder else zlib.decompressobj()
+        return inflater.decompress(data) + inflater.flush()
+
+    def open(self, route_id: str, direction: str, at: float = None) -> io.TextIOBase:
+        """
+        Opens the newest snapshot of a route direction (as of ``at``) as a decompressing text stream.
+
+        Args:
+            route_id (str): The unique identifier of the bus route.
+            direction (str): 'go' or 'come'.
+            at (float): Unix time; the newest snapshot fetched at or before it. Latest if omitted.
+
+        Returns:
+            io.TextIOBase: UTF-8 text stream of the page.
+
+        Raises:
+            FileNotFoundError: If no snapshot matches.
+            ValueError: If the blob needs zstandard and it is not installed.
+        """
+        codec, decoder, data = self._locate(route_id, direction, at)
+        if codec == 'zstd':
+            raw = decoder.stream_reader(io.BytesIO(data))
+        else:
+            raw = _zlib_reader(data, decoder)
+        return io.TextIOWrapper(io.BufferedReader(raw, buffer_size=STREAM_BUFFER_SIZE), encoding='utf-8')
+
+    def read(self, route_id: str, direction: str, at: float = None) -> str:
+        """
+        Returns the newest snapshot of a route direction (as of ``at``) as a string, decompressed
+        in one call.
+
+        Raises:
+            FileNotFoundError: If no snapshot matches.
+            ValueError: If the blob needs zstandard and it is not installed.
+        """
+        codec, decoder, data = self._locate(route_id, direction, at)
+        return self._decompress(codec, decoder, data).decode('utf-8')
+
+    def latest_snapshots(self) -> list:
+        """
+        Returns (route_id, direction, fetched_at) of the newest snapshot of every route direction.
+        """
+        stmt = (
+            select(snapshots_table.c.route_id, snapshots_table.c.direction, func.max(snapshots_table.c.fetched_at))
+            .group_by(snapshots_table.c.route_id, snapshots_table.c.direction)
+            .order_by(snapshots_table.c.route_id, snapshots_table.c.direction)
+        )
+        with self.engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(stmt)]
+
+    def history(self, route_id: str, direction: str) -> list:
+        """
+        Returns the (fetched_at, sha1) index entries of a route direction, oldest first.
+        """
+        stmt = (
+            select(snapshots_table.c.fetched_at, snapshots_table.c.sha1)
+            .where(snapshots_table.c.route_id == route_id, snapshots_table.c.direction == direction)
+            .order_by(snapshots_table.c.fetched_at)
+        )
+        with self.engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(stmt)]
+
+    def stats(self) -> dict:
+        """
+        Returns the number of snapshots and blobs and the raw and stored sizes in bytes.
+        """
+        with self.engine.connect() as connection:
+            snapshots = connection.execute(select(func.count()).select_from(snapshots_table)).scalar()
+            blobs, raw_bytes, stored_bytes = connection.execute(select(
+                func.count(), func.coalesce(func.sum(blobs_table.c.raw_size), 0),
+                func.coalesce(func.sum(func.length(blobs_table.c.data)), 0),
+            )).one()
+        return {'snapshots': snapshots, 'blobs': blobs, 'raw_bytes': raw_bytes, 'stored_bytes': stored_bytes}
+
+
+def get_store(working_directory: str = 'data') -> snapshot_store:
+    """
+    Returns the cached store for a working directory, creating it on first use.
+    """
+    store = _stores.get(working_directory)
+    if store is None:
+        store = _stores[working_directory] = snapshot_store(working_directory)
+    return store
+
+
+def has_store(working_directory: str = 'data') -> bool:
+    """
+    Returns True if a working directory already holds a snapshot store.
+    """
+    return os.path.exists(os.path.join(working_directory, SNAPSHOT_DB_FILENAME))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import ebus_taipei_*.html snapshots into the snapshot store')
+    parser.add_argument('folder', nargs='?', default='data', help='folder holding the HTML files and the store')
+    parser.add_argument('--remove', action='store_true', help='delete each HTML file once it is stored')
+    args = parser.parse_args()
+
+    store = get_store(args.folder)
+    started = time.perf_counter()
+    counts = store.import_html_files(args.folder, remove=args.remove)
+    stats = store.stats()
+    print(f"{counts['imported']} pages imported ({counts['empty']} empty, {counts['removed']} files removed) "
+          f"in {time.perf_counter() - started:.1f}s")
+    print(f"{stats['snapshots']} snapshots in {stats['blobs']} blobs: "
+          f"{stats['raw_bytes'] / 1e6:.1f} MB -> {stats['stored_bytes'] / 1e6:.1f} MB "
+          f"({stats['raw_bytes'] / max(stats['stored_bytes'], 1):.1f}x) using {store.codec}")
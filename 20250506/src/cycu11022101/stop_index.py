@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+This module builds an inverted index from bus stop name to the routes serving it, with the
+stop's positions along each route. "Which routes go from A to B" then becomes a set
+intersection plus an order check instead of a scan over every route's stop list.
+"""
+
+import csv
+import os
+import pickle
+
+
+INDEX_FORMAT_VERSION = 1
+
+
+class stop_route_index:
+    """
+    Maps each stop name to {route name: positions of the stop along that route}.
+    """
+
+    def __init__(self, routes: dict):
+        """
+        Builds the index from ordered stop lists.
+
+        Args:
+            routes (dict): Route name -> list of stop names in travel order.
+        """
+        self.routes = routes
+        self.index = {}
+        for route, stops in routes.items():
+            for position, stop in enumerate(stops):
+                self.index.setdefault(stop, {}).setdefault(route, []).append(position)
+
+        # Tuples are smaller to pickle and cannot be mutated by callers
+        for serving in self.index.values():
+            for route in serving:
+                serving[route] = tuple(serving[route])
+
+    @classmethod
+    def from_csv(cls, csv_path: str) -> 'stop_route_index':
+        """
+        Builds the index from a CSV with route_name and stop_name columns in travel order,
+        such as bus_data.csv.
+
+        Args:
+            csv_path (str): Path to the CSV file.
+
+        Returns:
+            stop_route_index: The built index.
+        """
+        routes = {}
+        with open(csv_path, newline='', encoding='utf-8-sig') as csvfile:
+            for row in csv.DictReader(csvfile):
+                routes.setdefault(row['route_name'], []).append(row['stop_name'])
+        return cls(routes)
+
+    def save(self, index_path: str):
+        """
+        Writes the index to a binary file.
+
+        Args:
+            index_path (str): Destination path.
+        """
+        with open(index_path, 'wb') as file:
+            pickle.dump((INDEX_FORMAT_VERSION, self.routes, self.index), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, index_path: str) -> 'stop_route_index':
+        """
+        Reads an index written by ``save`` without rebuilding it.
+
+        Args:
+            index_path (str): Path to the binary index file.
+
+        Returns:
+            stop_route_index: The loaded index.
+
+        Raises:
+            ValueError: If the file was written by an incompatible version.
+        """
+        with open(index_path, 'rb') as file:
+            version, routes, index = pickle.load(file)
+
+        if version != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported stop index version {version}")
+
+        obj = cls.__new__(cls)
+        obj.routes = routes
+        obj.index = index
+        return obj
+
+    @classmethod
+    def load_or_build(cls, csv_path: str, index_path: str = None) -> 'stop_route_index':
+        """
+        Loads the binary index if it is newer than the CSV, otherwise rebuilds and saves it.
+
+        Args:
+            csv_path (str): Source CSV with route_name and stop_name columns.
+            index_path (str): Binary index path; defaults to the CSV path with a .stopidx suffix.
+
+        Returns:
+            stop_route_index: The index.
+        """
+        index_path = index_path or os.path.splitext(csv_path)[0] + '.stopidx'
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(csv_path):
+            try:
+                return cls.load(index_path)
+            except (ValueError, pickle.UnpicklingError, EOFError):
+                pass
+
+        obj = cls.from_csv(csv_path)
+        obj.save(index_path)
+        return obj
+
+    def routes_serving(self, stop: str) -> dict:
+        """
+        Returns the routes serving a stop with the stop's positions on each.
+
+        Args:
+            stop (str): Stop name.
+
+        Returns:
+            dict: Route name -> tuple of positions; empty if the stop is unknown.
+        """
+        return self.index.get(stop, {})
+
+    def routes_between(self, start_stop: str, end_stop: str) -> list:
+        """
+        Finds routes that reach end_stop after start_stop.
+
+        A stop listed more than once on a route (e.g. outbound and return legs) uses the
+        shortest ride that keeps the travel order.
+
+        Args:
+            start_stop (str): Boarding stop name.
+            end_stop (str): Alighting stop name.
+
+        Returns:
+            list: (route name, boarding position, alighting position) tuples, shortest ride first.
+        """
+        start_routes = self.index.get(start_stop)
+        end_routes = self.index.get(end_stop)
+        if not start_routes or not end_routes:
+            return []
+
+        results = []
+        for route in start_routes.keys() & end_routes.keys():
+            best = None
+            for start_position in start_routes[route]:
+                for end_position in end_routes[route]:
+                    if end_position > start_position and (best is None or end_position - start_position < best[1] - best[0]):
+                        best = (start_position, end_position)
+            if best is not None:
+                results.append((route, best[0], best[1]))
+
+        results.sort(key=lambda item: (item[2] - item[1], item[0]))
+        return results
@@ -0,0 +1,612 @@
+# -*- coding: utf-8 -*-
+"""
+This module pre-renders bus stops and route lines into a pyramid of Mapbox Vector Tiles on disk
+({z}/{x}/{y}.pbf) with a TileJSON index and a Leaflet.VectorGrid viewer, so a map loads only the
+tiles in view instead of the whole dataset. Stops come from a GeoJSON file such as
+20250422/bus_stops.geojson or from the crawlers' data/BUS_INFO CSVs, and route lines from the
+CSVs. Tiles are encoded here without a protobuf library: each tile holds its features clipped to
+the tile plus a small buffer, in integer tile coordinates, and stops only appear from a zoom where
+they no longer pile up.
+
+Usage:
+    python -m cycu11022101.tile_builder [--stops 20250422/bus_stops.geojson] [--bus-info data/BUS_INFO] [--output tiles]
+
+Serve the output folder over HTTP (e.g. ``python -m http.server -d tiles``) and open index.html;
+browsers do not fetch tiles from file:// URLs.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import struct
+import time
+from typing import NamedTuple
+
+
+TILE_FORMAT_VERSION = 2  # MVT specification version
+
+DEFAULT_EXTENT = 4096
+
+# Tile units drawn beyond each edge, so stops and lines are not cut off at tile borders
+DEFAULT_BUFFER = 64
+
+INDEX_FILENAME = 'metadata.json'
+VIEWER_FILENAME = 'index.html'
+
+POINT, LINESTRING = 1, 2
+
+# Web Mercator cannot show the poles
+MAX_LATITUDE = 85.0511287798
+
+# Leaflet.VectorGrid styles per layer; stops are drawn as circles, routes as lines
+LAYER_STYLES = {
+    'stops': {'radius': 4, 'weight': 1, 'color': '#8b0000', 'fill': True, 'fillColor': '#e34a33', 'fillOpacity': 0.8},
+    'routes': {'weight': 2, 'color': '#3182bd', 'opacity': 0.6},
+}
+
+_VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<script src="https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.js"></script>
+<style>html, body, #map { height: 100%%; margin: 0; }</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+fetch('%(index)s').then(function (response) { return response.json(); }).then(function (index) {
+    var map = L.map('map');
+    map.fitBounds([[index.bounds[1], index.bounds[0]], [index.bounds[3], index.bounds[2]]]);
+    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        maxZoom: 19, attribution: '&copy; OpenStreetMap contributors'
+    }).addTo(map);
+
+    // Only tiles listed in the index are requested; the rest of the pyramid is empty
+    var available = {};
+    Object.keys(index.available).forEach(function (zoom) {
+        index.available[zoom].forEach(function (tile) { available[zoom + '/' + tile] = true; });
+    });
+    var layer = L.vectorGrid.protobuf(index.tiles[0], {
+        vectorTileLayerStyles: %(styles)s,
+        minZoom: index.minzoom,
+        maxNativeZoom: index.maxzoom,
+        interactive: true,
+        getFeatureId: function (feature) { return feature.id; }
+    });
+    var createTile = layer.createTile;
+    layer.createTile = function (coords, done) {
+        if (!available[coords.z + '/' + coords.x + '/' + coords.y] && coords.z <= index.maxzoom) {
+            var empty = document.createElement('div');
+            setTimeout(function () { done(null, empty); }, 0);
+            return empty;
+        }
+        return createTile.call(this, coords, done);
+    };
+    layer.on('click', function (event) {
+        var box = document.createElement('div');
+        Object.keys(event.layer.properties).forEach(function (key) {
+            var line = document.createElement('div');
+            line.textContent = key + ': ' + event.layer.properties[key];
+            box.appendChild(line);
+        });
+        L.popup().setLatLng(event.latlng).setContent(box).openOn(map);
+    });
+    layer.addTo(map);
+});
+</script>
+</body>
+</html>
+"""
+
+
+class tile_report(NamedTuple):
+    """
+    Outcome of building a tile pyramid.
+
+    Attributes:
+        output_folder (str): Folder holding {z}/{x}/{y}.pbf, the index and the viewer.
+        tiles (int): Non-empty tiles written.
+        bytes_written (int): Total size of the tiles.
+        features (dict): Features per layer before tiling.
+        elapsed (float): Seconds spent tiling, encoding and writing.
+    """
+    output_folder: str
+    tiles: int
+    bytes_written: int
+    features: dict
+    elapsed: float
+
+
+def lonlat_to_tile(lon: float, lat: float, zoom: int) -> tuple:
+    """
+    Projects a coordinate to Web Mercator tile units at a zoom level.
+
+    Args:
+        lon (float): Longitude in degrees.
+        lat (float): Latitude in degrees; clamped to the Web Mercator range.
+        zoom (int): Zoom level.
+
+    Returns:
+        tuple: (x, y) as floats; the integer parts are the tile column and row.
+    """
+    scale = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180.0) / 360.0 * scale
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+_SMALL_VARINTS = [bytes((value,)) for value in range(128)]
+
+
+def _varint(value: int) -> bytes:
+    if value < 128:
+        return _SMALL_VARINTS[value]
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    # Length-delimited field (wire type 2)
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number: int, value: int) -> bytes:
+    # Varint field (wire type 0)
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(numbers: list) -> bytes:
+    return b''.join(_varint(number) for number in numbers)
+
+
+def _value(value) -> bytes:
+    # tile.Value: string 1, double 3, sint 6, bool 7
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int):
+        return _uint_field(6, _zigzag(value))
+    if isinstance(value, float):
+        return _varint(3 << 3 | 1) + struct.pack('<d', value)
+    return _field(1, str(value).encode('utf-8'))
+
+
+def _geometry(geometry_type: int, parts: list) -> list:
+    """
+    Encodes points or line parts, in integer tile coordinates, as MVT geometry commands.
+    """
+    commands = []
+    cursor_x = cursor_y = 0
+    if geometry_type == POINT:
+        commands.append(1 | len(parts) << 3)  # MoveTo for every point
+        for x, y in parts:
+            commands += [_zigzag(x - cursor_x), _zigzag(y - cursor_y)]
+            cursor_x, cursor_y = x, y
+        return commands
+
+    for part in parts:
+        for i, (x, y) in enumerate(part):
+            if i == 0:
+                commands.append(1 | 1 << 3)  # MoveTo
+            elif i == 1:
+                commands.append(2 | (len(part) - 1) << 3)  # LineTo for the rest of the part
+            commands += [_zigzag(x - cursor_x), _zigzag(y - cursor_y)]
+            cursor_x, cursor_y = x, y
+    return commands
+
+
+def encode_tile(layers: dict, extent: int = DEFAULT_EXTENT) -> bytes:
+    """
+    Encodes one vector tile.
+
+    Args:
+        layers (dict): Layer name -> list of (feature id, geometry type, parts, properties); for POINT
+            the parts are [(x, y), ...], for LINESTRING [[(x, y), ...], ...], in integer tile coordinates.
+        extent (int): Tile units per tile side.
+
+    Returns:
+        bytes: The tile in the Mapbox Vector Tile protobuf format.
+    """
+    tile = bytearray()
+    for name, features in layers.items():
+        keys, values = {}, {}
+        encoded_features = bytearray()
+        for feature_id, geometry_type, parts, properties in features:
+            tags = []
+            for key, value in properties.items():
+                if value is None:
+                    continue
+                tags.append(keys.setdefault(key, len(keys)))
+                tags.append(values.setdefault((type(value).__name__, value), len(values)))
+
+            feature = bytearray()
+            if feature_id is not None:
+                feature += _uint_field(1, feature_id)
+            if tags:
+                feature += _field(2, _packed(tags))
+            feature += _uint_field(3, geometry_type)
+            feature += _field(4, _packed(_geometry(geometry_type, parts)))
+            encoded_features += _field(2, bytes(feature))
+
+        layer = bytearray(_uint_field(15, TILE_FORMAT_VERSION))
+        layer += _field(1, name.encode('utf-8'))
+        layer += encoded_features
+        for key in keys:
+            layer += _field(3, key.encode('utf-8'))
+        for _, value in values:
+            layer += _field(4, _value(value))
+        layer += _uint_field(5, extent)
+        tile += _field(3, bytes(layer))
+    return bytes(tile)
+
+
+def _clip_segment(x0: float, y0: float, x1: float, y1: float, low: float, high: float) -> tuple:
+    """
+    Liang-Barsky clipping of a segment to the square [low, high]; returns the clipped segment or None.
+    """
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - low), (dx, high - x0), (-dy, y0 - low), (dy, high - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return None
+                t0 = max(t0, t)
+            else:
+                if t < t0:
+                    return None
+                t1 = min(t1, t)
+    return x0 + t0 * dx, y0 + t0 * dy, x0 + t1 * dx, y0 + t1 * dy
+
+
+def clip_line(points: list, low: float, high: float) -> list:
+    """
+    Clips a line in tile coordinates to a square and rounds it to integers.
+
+    Args:
+        points (list): (x, y) floats in tile units of one tile (0 to extent).
+        low (float): Lower edge of the square, e.g. -buffer.
+        high (float): Upper edge of the square, e.g. extent + buffer.
+
+    Returns:
+        list: Parts inside the square, each a list of at least two distinct integer (x, y) points.
+    """
+    parts = []
+    part = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        clipped = _clip_segment(x0, y0, x1, y1, low, high)
+        if clipped is None:
+            if len(part) > 1:
+                parts.append(part)
+            part = []
+            continue
+
+        start = (round(clipped[0]), round(clipped[1]))
+        end = (round(clipped[2]), round(clipped[3]))
+        if not part or part[-1] != start:
+            if len(part) > 1:
+                parts.append(part)
+            part = [start]
+        if end != part[-1]:
+            part.append(end)
+        if (clipped[2], clipped[3]) != (x1, y1):  # The segment leaves the square
+            if len(part) > 1:
+                parts.append(part)
+            part = []
+
+    if len(part) > 1:
+        parts.append(part)
+    return parts
+
+
+class tile_pyramid:
+    """
+    Collects point and line layers and writes them as a vector tile pyramid.
+    """
+
+    def __init__(self, min_zoom: int = 10, max_zoom: int = 16, extent: int = DEFAULT_EXTENT,
+                 buffer: int = DEFAULT_BUFFER):
+        """
+        Initializes an empty pyramid.
+
+        Args:
+            min_zoom (int): Lowest zoom level written.
+            max_zoom (int): Highest zoom level written; maps overzoom its tiles beyond it.
+            extent (int): Tile units per tile side.
+            buffer (int): Tile units kept beyond each tile edge.
+
+        Raises:
+            ValueError: If the zoom range is empty or outside 0 to 22.
+        """
+        if not 0 <= min_zoom <= max_zoom <= 22:
+            raise ValueError("Zoom levels must satisfy 0 <= min_zoom <= max_zoom <= 22")
+
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.extent = extent
+        self.buffer = buffer
+        self.layers = {}  # name -> (geometry type, min zoom, features)
+        self.bounds = None  # [west, south, east, north]
+
+    def _extend_bounds(self, coordinates: list):
+        lons = [lon for lon, _ in coordinates]
+        lats = [lat for _, lat in coordinates]
+        west, south, east, north = min(lons), min(lats), max(lons), max(lats)
+        if self.bounds is not None:
+            west, south = min(west, self.bounds[0]), min(south, self.bounds[1])
+            east, north = max(east, self.bounds[2]), max(north, self.bounds[3])
+        self.bounds = [west, south, east, north]
+
+    def add_points(self, name: str, features: list, min_zoom: int = None):
+        """
+        Adds a point layer.
+
+        Args:
+            name (str): Layer name.
+            features (list): (longitude, latitude, properties dict) tuples.
+            min_zoom (int): First zoom level the layer appears at; the pyramid's lowest if omitted.
+        """
+        if features:
+            self._extend_bounds([(lon, lat) for lon, lat, _ in features])
+        self.layers[name] = (POINT, self.min_zoom if min_zoom is None else min_zoom, features)
+
+    def add_lines(self, name: str, features: list, min_zoom: int = None):
+        """
+        Adds a line layer.
+
+        Args:
+            name (str): Layer name.
+            features (list): ([(longitude, latitude), ...], properties dict) tuples.
+            min_zoom (int): First zoom level the layer appears at; the pyramid's lowest if omitted.
+        """
+        coordinates = [point for line, _ in features for point in line]
+        if coordinates:
+            self._extend_bounds(coordinates)
+        self.layers[name] = (LINESTRING, self.min_zoom if min_zoom is None else min_zoom, features)
+
+    def _tile_points(self, tiles: dict, name: str, features: list, zoom: int):
+        margin = self.buffer / self.extent
+        for feature_id, (lon, lat, properties) in enumerate(features):
+            x, y = lonlat_to_tile(lon, lat, zoom)
+            # A stop near a tile edge also goes into the neighbouring tiles within the buffer
+            for column in range(int(math.floor(x - margin)), int(math.floor(x + margin)) + 1):
+                for row in range(int(math.floor(y - margin)), int(math.floor(y + margin)) + 1):
+                    point = (round((x - column) * self.extent), round((y - row) * self.extent))
+                    tiles.setdefault((column, row), {}).setdefault(name, []).append(
+                        (feature_id, POINT, [point], properties)
+                    )
+
+    def _tile_lines(self, tiles: dict, name: str, features: list, zoom: int):
+        margin = self.buffer / self.extent
+        for feature_id, (line, properties) in enumerate(features):
+            projected = [lonlat_to_tile(lon, lat, zoom) for lon, lat in line]
+
+            # Each tile only clips the segments whose bounding box reaches it, in runs of consecutive segments
+            segments = {}
+            for index, ((x0, y0), (x1, y1)) in enumerate(zip(projected, projected[1:])):
+                for column in range(int(math.floor(min(x0, x1) - margin)), int(math.floor(max(x0, x1) + margin)) + 1):
+                    for row in range(int(math.floor(min(y0, y1) - margin)), int(math.floor(max(y0, y1) + margin)) + 1):
+                        segments.setdefault((column, row), []).append(index)
+
+            for (column, row), indices in segments.items():
+                parts = []
+                start = indices[0]
+                for previous, index in zip(indices, indices[1:] + [None]):
+                    if index == previous + 1:
+                        continue
+                    local = [((x - column) * self.extent, (y - row) * self.extent)
+                             for x, y in projected[start:previous + 2]]
+                    parts += clip_line(local, -self.buffer, self.extent + self.buffer)
+                    start = index
+                if parts:
+                    tiles.setdefault((column, row), {}).setdefault(name, []).append(
+                        (feature_id, LINESTRING, parts, properties)
+                    )
+
+    def tiles(self, zoom: int) -> dict:
+        """
+        Cuts every layer into the tiles of one zoom level.
+
+        Args:
+            zoom (int): Zoom level.
+
+        Returns:
+            dict: (x, y) -> {layer name: [(feature id, geometry type, parts, properties), ...]} for non-empty tiles.
+        """
+        tiles = {}
+        for name, (geometry_type, min_zoom, features) in self.layers.items():
+            if zoom < min_zoom:
+                continue
+            if geometry_type == POINT:
+                self._tile_points(tiles, name, features, zoom)
+            else:
+                self._tile_lines(tiles, name, features, zoom)
+        return tiles
+
+    def build(self, output_folder: str = 'tiles', title: str = 'Taipei bus network') -> tile_report:
+        """
+        Writes {z}/{x}/{y}.pbf for every non-empty tile, the TileJSON index and the viewer.
+
+        Args:
+            output_folder (str): Folder to write into; tiles of an earlier build are overwritten, not removed.
+            title (str): Name in the index and title of the viewer.
+
+        Returns:
+            tile_report: What was written.
+        """
+        started = time.perf_counter()
+        available = {}
+        tile_count = bytes_written = 0
+
+        for zoom in range(self.min_zoom, self.max_zoom + 1):
+            tiles = self.tiles(zoom)
+            available[str(zoom)] = sorted(f'{x}/{y}' for x, y in tiles)
+            for (x, y), layers in tiles.items():
+                folder = os.path.join(output_folder, str(zoom), str(x))
+                os.makedirs(folder, exist_ok=True)
+                payload = encode_tile(layers, self.extent)
+                with open(os.path.join(folder, f'{y}.pbf'), 'wb') as tile_file:
+                    tile_file.write(payload)
+                tile_count += 1
+                bytes_written += len(payload)
+
+        vector_layers = []
+        for name, (_, min_zoom, features) in self.layers.items():
+            fields = {}
+            for feature in features:
+                for key, value in feature[-1].items():
+                    fields.setdefault(key, 'Number' if isinstance(value, (int, float)) else 'String')
+            vector_layers.append({'id': name, 'minzoom': min_zoom, 'maxzoom': self.max_zoom, 'fields': fields})
+
+        bounds = self.bounds or [-180.0, -MAX_LATITUDE, 180.0, MAX_LATITUDE]
+        index = {
+            'tilejson': '3.0.0',
+            'name': title,
+            'format': 'pbf',
+            'tiles': ['{z}/{x}/{y}.pbf'],
+            'minzoom': self.min_zoom,
+            'maxzoom': self.max_zoom,
+            'bounds': bounds,
+            'center': [(bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2, self.min_zoom],
+            'vector_layers': vector_layers,
+            # Non-empty tiles per zoom level as "x/y", so viewers skip requests for empty ones
+            'available': available,
+        }
+
+        os.makedirs(output_folder, exist_ok=True)
+        with open(os.path.join(output_folder, INDEX_FILENAME), 'w', encoding='utf-8') as index_file:
+            json.dump(index, index_file, ensure_ascii=False)
+        with open(os.path.join(output_folder, VIEWER_FILENAME), 'w', encoding='utf-8') as viewer_file:
+            viewer_file.write(_VIEWER_TEMPLATE % {
+                'title': title,
+                'index': INDEX_FILENAME,
+                'styles': json.dumps({name: LAYER_STYLES.get(name, {}) for name in self.layers}),
+            })
+
+        return tile_report(
+            output_folder, tile_count, bytes_written,
+            {name: len(features) for name, (_, _, features) in self.layers.items()},
+            time.perf_counter() - started,
+        )
+
+
+def read_stop_geojson(path: str) -> list:
+    """
+    Reads the Point features of a GeoJSON file such as bus_stops.geojson.
+
+    Args:
+        path (str): Path to the GeoJSON file, in WGS84 longitude/latitude.
+
+    Returns:
+        list: (longitude, latitude, properties) tuples.
+    """
+    with open(path, encoding='utf-8') as geojson_file:
+        collection = json.load(geojson_file)
+
+    features = []
+    for feature in collection.get('features', []):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Point':
+            lon, lat = geometry['coordinates'][:2]
+            features.append((lon, lat, feature.get('properties') or {}))
+    return features
+
+
+def read_bus_info(folder: str = 'data/BUS_INFO', route_names_csv: str = None) -> tuple:
+    """
+    Reads stops and route lines from the per-direction CSVs written by the crawlers (bus_route_{rid}_{direction}.csv).
+
+    Stops with the same UniStopId are merged and list every route serving them.
+
+    Args:
+        folder (str): Folder holding the CSVs.
+        route_names_csv (str): Optional "Route ID,Route Name" catalogue (e.g. data/bus_info_tist.csv)
+            used to label routes with names instead of IDs.
+
+    Returns:
+        tuple: (stops, lines): (longitude, latitude, properties) point features and
+            ([(longitude, latitude), ...], properties) line features.
+    """
+    names = {}
+    if route_names_csv and os.path.exists(route_names_csv):
+        with open(route_names_csv, newline='', encoding='utf-8-sig') as csvfile:
+            for row in csv.reader(csvfile):
+                if len(row) >= 2:
+                    names[row[0]] = row[1]
+
+    stops = {}
+    lines = []
+    for path in sorted(glob.glob(os.path.join(folder, 'bus_route_*_*.csv'))):
+        route_id, direction = os.path.basename(path)[len('bus_route_'):-len('.csv')].rsplit('_', 1)
+        route = names.get(route_id, route_id)
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            rows = [row for row in csv.DictReader(csvfile) if row.get('stop_name')]
+        rows.sort(key=lambda row: int(row['stop_number']) if row['stop_number'].isdigit() else 0)
+
+        line = []
+        for row in rows:
+            try:
+                lon, lat = float(row['longitude']), float(row['latitude'])
+            except (TypeError, ValueError):
+                continue
+            line.append((lon, lat))
+
+            key = row['stop_id'] if row['stop_id'].isdigit() else (row['stop_name'], lon, lat)
+            stop = stops.get(key)
+            if stop is None:
+                stop = stops[key] = (lon, lat, {'stop_name': row['stop_name'], 'routes': []})
+                if row['stop_id'].isdigit():
+                    stop[2]['stop_id'] = int(row['stop_id'])
+            if route not in stop[2]['routes']:
+                stop[2]['routes'].append(route)
+
+        if len(line) > 1:
+            lines.append((line, {'route': route, 'route_id': route_id, 'direction': direction}))
+
+    # Tile values are scalars, so the serving routes become one string
+    return [(lon, lat, dict(properties, routes='、'.join(properties['routes'])))
+            for lon, lat, properties in stops.values()], lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render bus stops and routes into a vector tile pyramid")
+    parser.add_argument("--stops", default=None, help="stop GeoJSON (default: the stops of the BUS_INFO CSVs)")
+    parser.add_argument("--bus-info", default="data/BUS_INFO", help="folder of bus_route_{rid}_{direction}.csv files")
+    parser.add_argument("--names", default="data/bus_info_tist.csv", help="Route ID,Route Name catalogue")
+    parser.add_argument("--output", default="tiles")
+    parser.add_argument("--min-zoom", type=int, default=10)
+    parser.add_argument("--max-zoom", type=int, default=16)
+    parser.add_argument("--stops-min-zoom", type=int, default=13, help="first zoom level showing stops")
+    args = parser.parse_args()
+
+    pyramid = tile_pyramid(args.min_zoom, args.max_zoom)
+    bus_info_stops, route_lines = read_bus_info(args.bus_info, args.names)
+    pyramid.add_lines('routes', route_lines)
+    pyramid.add_points('stops', read_stop_geojson(args.stops) if args.stops else bus_info_stops,
+                       max(args.min_zoom, args.stops_min_zoom))
+    report = pyramid.build(args.output)
+    print(f"{report.tiles} tiles ({report.bytes_written / 1024:.0f} KiB) for {report.features} "
+          f"written to {report.output_folder} in {report.elapsed:.1f}s")
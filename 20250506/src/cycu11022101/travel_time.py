@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+This module turns recorded ETAs into real segment travel times. The recorder samples selected
+routes on an interval through taipei_route_info.parse_route_info and appends every stop's
+normalized ETA to the day's observation table (see cycu11022101.eta). The estimator reads those
+tables back, finds when a bus reached each stop (the stop's ETA turned to '進站中'), pairs the
+arrivals at consecutive stops, and precomputes travel-time quantiles per segment and time-of-day
+bin with NumPy. A journey planner then looks an estimate up in one dict access per segment.
+
+Usage:
+    python -m cycu11022101.travel_time record ROUTE_ID [ROUTE_ID ...] [--interval 30] [--duration 3600]
+    python -m cycu11022101.travel_time fit [--days YYYYMMDD ...] [--routes ROUTE_ID ...]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, select
+
+from cycu11022101.browser_pool import ebus_browser_pool
+from cycu11022101.ebus_db import get_engine, segment_time_table
+from cycu11022101.ebus_taipei import taipei_route_info
+from cycu11022101.eta import TAIPEI_OFFSET, append_eta_observations, eta_days, eta_status, read_eta_observations
+
+
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+# Bin key of the whole-day estimate, used when a time-of-day bin has too few samples
+ALL_DAY = -1
+
+# A stop still showing '進站中' after this many seconds without observations counts as a new arrival
+MAX_ARRIVAL_GAP = 300
+
+# Pairs of arrivals further apart than this are not the same bus
+MAX_SEGMENT_SECONDS = 30 * 60
+
+
+class eta_recorder:
+    """
+    Samples the ETAs of selected routes on an interval into the day's observation table.
+
+    Arrivals are detected from the '進站中' state, which lasts about a minute on the site, so
+    intervals much above 30 seconds miss arrivals.
+    """
+
+    def __init__(self, route_ids: list, working_directory: str = 'data', interval: float = 30.0,
+                 browser_pool: ebus_browser_pool = None):
+        """
+        Initializes the recorder without launching the browser; the first sample does.
+
+        Args:
+            route_ids (list): IDs of the routes to sample; both directions are read from one page load.
+            working_directory (str): Directory holding the database file.
+            interval (float): Seconds between the starts of two samples.
+            browser_pool (ebus_browser_pool): Shared browser to fetch with; one with a single page if omitted.
+
+        Raises:
+            ValueError: If the interval is not positive.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+
+        self.route_ids = list(dict.fromkeys(route_ids))
+        self.working_directory = working_directory
+        self.interval = interval
+        self.browser_pool = browser_pool or ebus_browser_pool(size=1)
+        self.engine = get_engine(working_directory)
+
+        self.errors = {}  # route_id -> last exception, cleared by a successful sample
+        self.samples = 0
+        self.rows = 0
+
+    def sample_once(self) -> int:
+        """
+        Reads every route once and appends its stops' ETAs; a route that fails is skipped and its error kept.
+
+        Returns:
+            int: Number of observation rows appended.
+        """
+        rows = 0
+        for route_id in self.route_ids:
+            try:
+                route_info = taipei_route_info(route_id, 'both', self.working_directory, browser_pool=self.browser_pool)
+                route_info.parse_route_info()
+            except Exception as e:
+                self.errors[route_id] = e
+                continue
+            self.errors.pop(route_id, None)
+            rows += append_eta_observations(self.engine, route_info.dataframe, route_info.fetched_at)
+
+        self.samples += 1
+        self.rows += rows
+        return rows
+
+    def run(self, duration: float = None, max_samples: int = None) -> int:
+        """
+        Samples on the interval until the duration has passed or enough samples were taken.
+
+        Args:
+            duration (float): Seconds to record; no limit if omitted.
+            max_samples (int): Number of samples to take; no limit if omitted.
+
+        Returns:
+            int: Number of observation rows appended.
+        """
+        ends = None if duration is None else time.monotonic() + duration
+        rows = samples = 0
+        while max_samples is None or samples < max_samples:
+            started = time.monotonic()
+            rows += self.sample_once()
+            samples += 1
+
+            next_start = started + self.interval
+            if ends is not None and next_start >= ends:
+                break
+            time.sleep(max(0.0, next_start - time.monotonic()))
+        return rows
+
+    def close(self):
+        """
+        Closes the browser.
+        """
+        self.browser_pool.close()
+
+
+def arrival_events(observations: pd.DataFrame, max_gap: float = MAX_ARRIVAL_GAP) -> pd.DataFrame:
+    """
+    Finds when buses reached stops: the observations where a stop's ETA turned to '進站中'.
+
+    Args:
+        observations (pd.DataFrame): Rows as returned by eta.read_eta_observations, any number of days.
+        max_gap (float): Seconds without observations of a stop after which '進站中' counts as a new arrival.
+
+    Returns:
+        pd.DataFrame: Columns route_id, direction, stop_number and arrived_at, sorted by them.
+    """
+    keys = ['route_id', 'direction', 'stop_number']
+    frame = observations.sort_values(keys + ['observed_at'], kind='stable')
+
+    arriving = (frame['status'] == eta_status.ARRIVING).to_numpy()
+    observed_at = frame['observed_at'].to_numpy(dtype='float64')
+    same_stop = np.zeros(len(frame), dtype=bool)
+    same_stop[1:] = True
+    for key in keys:
+        column = frame[key].to_numpy()
+        same_stop[1:] &= column[1:] == column[:-1]
+
+    previous_arriving = np.concatenate(([False], arriving[:-1]))
+    gap = np.concatenate(([np.inf], np.diff(observed_at)))
+    arrived = arriving & (~same_stop | ~previous_arriving | (gap > max_gap))
+
+    events = frame.loc[arrived, keys].assign(arrived_at=observed_at[arrived])
+    return events.reset_index(drop=True)
+
+
+def segment_times(events: pd.DataFrame, max_seconds: float = MAX_SEGMENT_SECONDS) -> pd.DataFrame:
+    """
+    Pairs each arrival at a stop with the latest earlier arrival at the stop before it on the same route and direction.
+
+    Each arrival at the earlier stop is used once. Buses that overtake each other within a
+    segment are paired wrongly; with short segments this is rare.
+
+    Args:
+        events (pd.DataFrame): Rows as returned by ``arrival_events``.
+        max_seconds (float): Pairs further apart are dropped.
+
+    Returns:
+        pd.DataFrame: Columns route_id, direction, from_stop, departed_at and seconds.
+    """
+    frames = []
+    for (route_id, direction), group in events.groupby(['route_id', 'direction'], sort=False):
+        times = {
+            int(stop_number): np.sort(stop_events['arrived_at'].to_numpy(dtype='float64'))
+            for stop_number, stop_events in group.groupby('stop_number', sort=False)
+        }
+        for from_stop, departed in times.items():
+            arrived = times.get(from_stop + 1)
+            if arrived is None:
+                continue
+
+            index = np.searchsorted(departed, arrived, side='left') - 1
+            valid = index >= 0
+            index, arrived = index[valid], arrived[valid]
+            seconds = arrived - departed[index]
+            keep = seconds <= max_seconds
+            index, seconds = index[keep], seconds[keep]
+
+            # The first arrival at the next stop after a departure belongs to that bus
+            index, first = np.unique(index, return_index=True)
+            frames.append(pd.DataFrame({
+                'route_id': route_id,
+                'direction': direction,
+                'from_stop': from_stop,
+                'departed_at': departed[index],
+                'seconds': seconds[first],
+            }))
+
+    if not frames:
+        return pd.DataFrame(columns=['route_id', 'direction', 'from_stop', 'departed_at', 'seconds'])
+    return pd.concat(frames, ignore_index=True)
+
+
+class travel_time_estimator:
+    """
+    Precomputed travel-time quantiles per route segment and time-of-day bin.
+
+    ``table`` maps (route_id, direction, from_stop, bin_start) to (samples, quantile array), with
+    ALL_DAY as the bin of the whole-day estimate.
+    """
+
+    def __init__(self, quantiles: tuple = DEFAULT_QUANTILES, bin_minutes: int = 60, min_samples: int = 3):
+        """
+        Initializes an empty estimator.
+
+        Args:
+            quantiles (tuple): Quantiles to precompute, between 0 and 1.
+            bin_minutes (int): Width of a time-of-day bin; must divide a day.
+            min_samples (int): Samples a time-of-day bin needs before it is used instead of the whole-day estimate.
+
+        Raises:
+            ValueError: If a quantile is out of range or the bin width does not divide a day.
+        """
+        if not all(0 <= quantile <= 1 for quantile in quantiles):
+            raise ValueError("Quantiles must lie between 0 and 1")
+        if bin_minutes <= 0 or 1440 % bin_minutes:
+            raise ValueError("bin_minutes must divide 1440")
+
+        self.quantiles = tuple(float(quantile) for quantile in quantiles)
+        self.bin_minutes = bin_minutes
+        self.min_samples = min_samples
+        self.table = {}
+        self._quantile_index = {quantile: i for i, quantile in enumerate(self.quantiles)}
+
+    def _bin(self, at: float) -> int:
+        minute = int(at + TAIPEI_OFFSET) % 86400 // 60
+        return minute - minute % self.bin_minutes
+
+    def fit(self, segments: pd.DataFrame) -> int:
+        """
+        Replaces the estimates of the segments' routes with quantiles of the given travel times.
+
+        Args:
+            segments (pd.DataFrame): Rows as returned by ``segment_times``.
+
+        Returns:
+            int: Number of (segment, bin) estimates computed, whole-day ones included.
+        """
+        if segments.empty:
+            return 0
+
+        routes = set(zip(segments['route_id'], segments['direction']))
+        self.table = {key: value for key, value in self.table.items() if key[:2] not in routes}
+
+        minute = ((segments['departed_at'].to_numpy(dtype='float64') + TAIPEI_OFFSET) % 86400 // 60).astype('int64')
+        frame = segments.assign(bin_start=minute - minute % self.bin_minutes)
+        seconds = frame['seconds'].to_numpy(dtype='float64')
+
+        estimates = 0
+        for keys, whole_day in ((['route_id', 'direction', 'from_stop', 'bin_start'], False),
+                                (['route_id', 'direction', 'from_stop'], True)):
+            for key, rows in frame.groupby(keys, sort=False).indices.items():
+                values = seconds[rows]
+                route_id, direction, from_stop = key[:3]
+                bin_start = ALL_DAY if whole_day else int(key[3])
+                self.table[(route_id, direction, int(from_stop), bin_start)] = (
+                    len(values), np.quantile(values, self.quantiles),
+                )
+                estimates += 1
+        return estimates
+
+    def estimate(self, route_id: str, direction: str, from_stop: int, at: float = None,
+                 quantile: float = 0.5) -> float:
+        """
+        Looks up the travel time from a stop to the next one.
+
+        Args:
+            route_id (str): The ID of the bus route.
+            direction (str): 'go' or 'come'.
+            from_stop (int): Sequence number of the stop the segment starts at.
+            at (float): Departure time in seconds since the epoch; the current time if omitted.
+            quantile (float): One of the precomputed quantiles.
+
+        Returns:
+            float: Seconds, or None if the segment has no estimate.
+
+        Raises:
+            ValueError: If the quantile was not precomputed.
+        """
+        index = self._quantile_index.get(quantile)
+        if index is None:
+            raise ValueError(f"Quantile {quantile} was not precomputed; choose one of {self.quantiles}")
+
+        entry = self.table.get((route_id, direction, from_stop, self._bin(time.time() if at is None else at)))
+        if entry is None or entry[0] < self.min_samples:
+            entry = self.table.get((route_id, direction, from_stop, ALL_DAY))
+        return None if entry is None else float(entry[1][index])
+
+    def estimate_ride(self, route_id: str, direction: str, board_stop: int, alight_stop: int,
+                      at: float = None, quantile: float = 0.5) -> float:
+        """
+        Adds up the segments of a ride, each looked up at the time the bus is expected to leave its stop.
+
+        Args:
+            route_id (str): The ID of the bus route.
+            direction (str): 'go' or 'come'.
+            board_stop (int): Sequence number of the boarding stop.
+            alight_stop (int): Sequence number of the stop to get off at; after the boarding stop.
+            at (float): Departure time in seconds since the epoch; the current time if omitted.
+            quantile (float): One of the precomputed quantiles.
+
+        Returns:
+            float: Seconds, or None if a segment has no estimate.
+        """
+        at = time.time() if at is None else at
+        total = 0.0
+        for from_stop in range(board_stop, alight_stop):
+            seconds = self.estimate(route_id, direction, from_stop, at + total, quantile)
+            if seconds is None:
+                return None
+            total += seconds
+        return total
+
+    def save(self, engine) -> int:
+        """
+        Replaces the stored estimates of this estimator's routes in data_segment_time.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): Target database.
+
+        Returns:
+            int: Number of rows written.
+        """
+        rows = [
+            {
+                'route_id': route_id, 'direction': direction, 'from_stop': from_stop,
+                'bin_start': bin_start, 'quantile': quantile, 'bin_minutes': self.bin_minutes,
+                'samples': samples, 'seconds': float(seconds),
+            }
+            for (route_id, direction, from_stop, bin_start), (samples, values) in self.table.items()
+            for quantile, seconds in zip(self.quantiles, values)
+        ]
+        routes = {(row['route_id'], row['direction']) for row in rows}
+
+        with engine.begin() as connection:
+            for route_id, direction in routes:
+                connection.execute(delete(segment_time_table).where(
+                    (segment_time_table.c.route_id == route_id) & (segment_time_table.c.direction == direction)
+                ))
+            if rows:
+                connection.execute(segment_time_table.insert(), rows)
+        return len(rows)
+
+    @classmethod
+    def load(cls, engine, min_samples: int = 3) -> 'travel_time_estimator':
+        """
+        Reads the stored estimates into memory.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): Database holding data_segment_time.
+            min_samples (int): See ``__init__``.
+
+        Returns:
+            travel_time_estimator: The estimator; empty if nothing is stored.
+        """
+        with engine.connect() as connection:
+            frame = pd.read_sql(select(segment_time_table), connection)
+        if frame.empty:
+            return cls(min_samples=min_samples)
+
+        quantiles = tuple(sorted(frame['quantile'].unique()))
+        estimator = cls(quantiles, int(frame['bin_minutes'].iloc[0]), min_samples)
+        frame = frame.sort_values('quantile')
+        for key, rows in frame.groupby(['route_id', 'direction', 'from_stop', 'bin_start'], sort=False):
+            values = dict(zip(rows['quantile'], rows['seconds']))
+            estimator.table[(key[0], key[1], int(key[2]), int(key[3]))] = (
+                int(rows['samples'].iloc[0]), np.array([values.get(quantile, np.nan) for quantile in quantiles]),
+            )
+        return estimator
+
+    @classmethod
+    def from_observations(cls, engine, days: list = None, route_ids: list = None, **kwargs) -> 'travel_time_estimator':
+        """
+        Fits an estimator on recorded ETA observations.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): Database holding the data_eta_YYYYMMDD tables.
+            days (list): Days as YYYYMMDD; every recorded day if omitted.
+            route_ids (list): Only these routes, if given.
+            **kwargs: Passed to ``__init__``.
+
+        Returns:
+            travel_time_estimator: The fitted estimator.
+        """
+        estimator = cls(**kwargs)
+        frames = [read_eta_observations(engine, day) for day in (eta_days(engine) if days is None else days)]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return estimator
+
+        observations = pd.concat(frames, ignore_index=True)
+        if route_ids is not None:
+            observations = observations[observations['route_id'].isin(route_ids)]
+        estimator.fit(segment_times(arrival_events(observations)))
+        return estimator
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record Taipei eBus ETAs and estimate segment travel times")
+    parser.add_argument("--working-directory", default="data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="sample routes into the ETA observation tables")
+    record.add_argument("route_ids", nargs="+")
+    record.add_argument("--interval", type=float, default=30.0, help="seconds between samples")
+    record.add_argument("--duration", type=float, default=None, help="seconds to record")
+
+    fit = commands.add_parser("fit", help="precompute travel-time quantiles into data_segment_time")
+    fit.add_argument("--days", nargs="*", default=None, help="days as YYYYMMDD (default: all)")
+    fit.add_argument("--routes", nargs="*", default=None, help="route IDs (default: all)")
+    fit.add_argument("--bin-minutes", type=int, default=60)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        recorder = eta_recorder(args.route_ids, args.working_directory, args.interval)
+        try:
+            rows = recorder.run(args.duration)
+        except KeyboardInterrupt:
+            rows = recorder.rows
+        finally:
+            recorder.close()
+        print(f"{recorder.samples} samples, {rows} observations recorded")
+        for route_id, error in recorder.errors.items():
+            print(f"Route {route_id} failed on its last sample: {error}")
+    else:
+        engine = get_engine(args.working_directory)
+        estimator = travel_time_estimator.from_observations(
+            engine, args.days, args.routes, bin_minutes=args.bin_minutes
+        )
+        print(f"{len(estimator.table)} segment estimates, {estimator.save(engine)} rows saved")
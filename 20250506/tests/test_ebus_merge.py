@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+
+from sqlalchemy import func, select
+
+from cycu11022101.ebus_db import get_engine, route_info_busstop_table
+from cycu11022101.ebus_merge import merge_bus_info_folder
+
+
+HEADER = 'arrival_info,stop_number,stop_name,stop_id,latitude,longitude\n'
+
+
+def write_route_csv(folder, route_id: str, direction: str, stops: int):
+    with open(os.path.join(folder, f'bus_route_{route_id}_{direction}.csv'), 'w', encoding='utf-8') as file:
+        file.write(HEADER)
+        for number in range(1, stops + 1):
+            file.write(f'進站中,{number},站{number},{1000 + number},25.0{number},121.5{number}\n')
+
+
+def count_rows(working_directory: str) -> int:
+    with get_engine(working_directory).connect() as connection:
+        return connection.execute(select(func.count()).select_from(route_info_busstop_table)).scalar()
+
+
+def test_merge_under_another_spelling_of_the_folder_keeps_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data/BUS_INFO')
+    write_route_csv('data/BUS_INFO', '0100000100', 'go', 3)
+    write_route_csv('data/BUS_INFO', '0100000100', 'come', 4)
+
+    first = merge_bus_info_folder('data/BUS_INFO', 'data', workers=1)
+    assert (first.merged, first.rows) == (2, 7)
+
+    second = merge_bus_info_folder('./data/BUS_INFO', 'data', workers=1, full=True)
+    assert (second.merged, second.removed, second.rows) == (2, 0, 7)
+    assert count_rows('data') == 7
+
+    third = merge_bus_info_folder('./data/BUS_INFO', 'data', workers=1)
+    assert (third.merged, third.unchanged, third.removed) == (0, 2, 0)
+
+
+def test_deleted_file_drops_its_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data/BUS_INFO')
+    write_route_csv('data/BUS_INFO', '0100000100', 'go', 3)
+    write_route_csv('data/BUS_INFO', '0100000100', 'come', 4)
+    merge_bus_info_folder('data/BUS_INFO', 'data', workers=1)
+
+    os.remove('data/BUS_INFO/bus_route_0100000100_come.csv')
+    report = merge_bus_info_folder('./data/BUS_INFO', 'data', workers=1)
+    assert report.removed == 1
+    assert count_rows('data') == 3
@@ -17,15 +17,18 @@ class taipei_route_list:
     Manages fetching, parsing, and storing route data for Taipei eBus.
     """
 
-    def __init__(self, working_directory: str = 'data'):
+    def __init__(self, working_directory: str = 'data', browser_pool=None):
         """
         Initializes the taipei_route_list, fetches webpage content,
         configures the ORM, and sets up the SQLite database.
 
         Args:
             working_directory (str): Directory to store the HTML and database files.
+            browser_pool: Shared browser pool (e.g. cycu11022101.browser_pool.ebus_browser_pool)
+                whose ``page()`` lends out pages; a one-off browser is used if omitted.
         """
         self.working_directory = working_directory
+        self.browser_pool = browser_pool
 
         #check if the working directory exists , if not create it
         import os
@@ -63,13 +66,19 @@ class taipei_route_list:
         """
         Fetches the webpage content using Playwright and saves it as a local HTML file.
         """
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(self.url)
-            page.wait_for_timeout(3000)  # Wait for the page to load
-            self.content = page.content()
-            browser.close()
+        if self.browser_pool is not None:
+            with self.browser_pool.page() as page:
+                page.goto(self.url)
+                page.wait_for_timeout(3000)  # Wait for the page to load
+                self.content = page.content()
+        else:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=True)
+                page = browser.new_page()
+                page.goto(self.url)
+                page.wait_for_timeout(3000)  # Wait for the page to load
+                self.content = page.content()
+                browser.close()
 
         # Save the rendered HTML to a file for inspection
         html_file_path = f'{self.working_directory}/hermes_ebus_taipei_route_list.html'
@@ -145,19 +154,21 @@ class taipei_route_info:
     Manages fetching, parsing, and storing bus stop data for a specified route and direction.
     """
 
-    def __init__(self, route_id: str, direction: str = 'go', working_directory: str = 'data'):
+    def __init__(self, route_id: str, direction: str = 'go', working_directory: str = 'data', browser_pool=None):
         """
         Initializes the taipei_route_info by setting parameters and fetching the webpage content.
 
         Args:
             route_id (str): The unique identifier of the bus route.
             direction (str): The direction of the route; must be either 'go' or 'come'.
+            browser_pool: Shared browser pool whose ``page()`` lends out pages; a one-off browser is used if omitted.
         """
         self.route_id = route_id
         self.direction = direction
         self.content = None
         self.url = f'https://ebus.gov.taipei/Route/StopsOfRoute?routeid={route_id}'
         self.working_directory = working_directory
+        self.browser_pool = browser_pool
 
         if self.direction not in ['go', 'come']:
             raise ValueError("Direction must be 'go' or 'come'")
@@ -168,20 +179,30 @@ class taipei_route_info:
         """
         Fetches the webpage content using Playwright and writes the rendered HTML to a local file.
         """
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(self.url)
-
-            if self.direction == 'come':
-                page.click('a.stationlist-come-go-gray.stationlist-come')
-
-            page.wait_for_timeout(3000)  # Wait for page render
-            self.content = page.content()
-            browser.close()
+        if self.browser_pool is not None:
+            with self.browser_pool.page() as page:
+                self._render(page)
+        else:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=True)
+                page = browser.new_page()
+                self._render(page)
+                browser.close()
 
         # Save the rendered HTML to a file for inspection
         self.html_file = f"{self.working_directory}/ebus_taipei_{self.route_id}.html"
+
+    def _render(self, page):
+        """
+        Loads the route page on the given Playwright page and keeps the rendered HTML.
+        """
+        page.goto(self.url)
+
+        if self.direction == 'come':
+            page.click('a.stationlist-come-go-gray.stationlist-come')
+
+        page.wait_for_timeout(3000)  # Wait for page render
+        self.content = page.content()
         
         # with open(html_file, "w", encoding="utf-8") as file:
         #     file.write(self.content)
@@ -262,10 +283,18 @@ class taipei_route_info:
 
 
 # homework 1 
-def get_bus_info_go(bus_id):
-    
+def get_bus_info_go(bus_id, browser_pool=None):
+    """
+    Fetches the outbound stops of a route and returns their stop IDs.
 
-    route_info = taipei_route_info(bus_id, direction="go")
+    Args:
+        bus_id (str): The unique identifier of the bus route.
+        browser_pool: Shared browser pool to reuse across calls; a one-off browser is used if omitted.
+
+    Returns:
+        list: Stop IDs in travel order.
+    """
+    route_info = taipei_route_info(bus_id, direction="go", browser_pool=browser_pool)
     route_info.parse_route_info()
     route_info.save_to_database()
 
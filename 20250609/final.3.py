@@ -1,9 +1,7 @@
 import folium
 import random
-import time
 import webbrowser
-import re
-import csv
+import os
 import asyncio
 
 from selenium import webdriver
@@ -13,67 +11,99 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
 
-# 站牌資料解析
-def extract_stops_from_soup(soup, direction_type, route_id):
-    stops_with_coords = []
-    estimated_times = {}
+from cycu11022101.ebus_parse import direction_section, iter_stops
+from cycu11022101.ebus_wait import selenium_wait_for_stop_list
+from cycu11022101.eta_client import fetch_eta, service_available
+from cycu11022101.request_filter import add_chrome_blocking_options, block_chrome_requests, chrome_page_stats
+from cycu11022101.route_catalogue import route_catalogue
+from cycu11022101.journey_planner import route_graph
+from cycu11022101.stop_index import stop_route_index
 
-    if direction_type == "去程":
-        direction_container = soup.find('div', id='GoDirectionRoute')
-    elif direction_type == "返程":
-        direction_container = soup.find('div', id='BackDirectionRoute')
-    else:
+DIRECTION_KEYS = {"去程": "go", "返程": "come"}
+
+# 站牌資料解析
+def extract_stops_from_html(page_content, direction_type, route_id):
+    # 以單次掃描取出站牌（不建立 BeautifulSoup 樹），輸出與原本的 extract_stops_from_soup 相同
+    # 根據方向類型找到對應的容器
+    direction = DIRECTION_KEYS.get(direction_type)
+    if direction is None:
         print(f"錯誤：未知方向類型 '{direction_type}'。")
         return [], {}
 
-    if not direction_container:
+    if direction_section(page_content, direction) is None:
         print(f"未找到 {direction_type} 方向的內容容器。")
         return [], {}
 
-    all_stop_list_items = direction_container.find_all('li')
+    # 每個站牌的 li 元素對應一筆 stop_record
+    return stops_from_records(list(iter_stops(page_content, direction)), direction_type)
 
-    if not all_stop_list_items:
-        print(f"在 {direction_type} 方向中未找到任何站牌列表項目。")
-        return [], {}
 
-    for item in all_stop_list_items:
-        item_html = str(item)
-        stop_name_tag = item.find('span', class_='auto-list-stationlist-place')
-        stop_name = stop_name_tag.get_text().strip() if stop_name_tag else "未知站名"
+def stops_from_records(records, direction_type):
+    # 將 stop_record 轉成地圖與 CSV 使用的站牌資料和到站時間（網頁解析與 ETA 服務共用）
+    stops_with_coords = []
+    # estimated_times 的鍵包含方向信息
+    estimated_times = {}
 
-        stop_id_match = re.search(r'<input[^>]+name="item\.UniStopId"[^>]+value="(\d+)"[^>]*>', item_html)
-        lat_match = re.search(r'<input[^>]+name="item\.Latitude"[^>]+value="([\d\.]+)"[^>]*>', item_html)
-        lon_match = re.search(r'<input[^>]+name="item\.Longitude"[^>]+value="([\d\.]+)"[^>]*>', item_html)
+    if not records:
+        print(f"在 {direction_type} 方向中未找到任何站牌列表項目。")
+        return [], {}
 
-        stop_id = int(stop_id_match.group(1)) if stop_id_match and stop_id_match.group(1).isdigit() else None
-        lat = float(lat_match.group(1)) if lat_match else None
-        lon = float(lon_match.group(1)) if lon_match else None
+    for record in records:
+        stop_name = record.name if record.name is not None else "未知站名"
 
-        if lat is not None and lon is not None:
+        if record.latitude is not None and record.longitude is not None:
             stops_with_coords.append({
                 "name": stop_name,
-                "lat": lat,
-                "lon": lon,
-                "stop_id": stop_id,
-                "direction": direction_type
+                "lat": record.latitude,
+                "lon": record.longitude,
+                "stop_id": record.stop_id,
+                "direction": direction_type # 添加方向信息
             })
         else:
             print(f"警告：站點 '{stop_name}' 經緯度無效，已跳過。")
 
-        eta_text = "查無資訊"
-        eta_tag_onroad = item.find('span', class_='eta_onroad')
-        if eta_tag_onroad and eta_tag_onroad.get_text().strip() != '':
-            eta_text = eta_tag_onroad.get_text().strip()
-        else:
-            eta_tag_static = item.find('span', class_='auto-list-stationlist-position-time')
-            if eta_tag_static and eta_tag_static.get_text().strip() != '':
-                eta_text = eta_tag_static.get_text().strip()
+        # 抓取到站狀態/時間：優先使用 span.eta_onroad，其次是 auto-list-stationlist-position-time
+        eta_text = record.eta_onroad or (record.arrival_info if record.arrival_kind == "time" else "") or "查無資訊"
+
+        # 使用組合鍵儲存預估時間，以區分去程和返程的同名站牌
         estimated_times[f"{stop_name}_{direction_type}"] = eta_text
 
     return stops_with_coords, estimated_times
 
+def get_bus_route_stops_from_service(route_id, bus_name):
+    # 向本機 ETA 服務（python -m cycu11022101.eta_service）查詢：瀏覽器與分頁已在服務中預熱，
+    # 查詢時間不含啟動瀏覽器與解析驅動程式
+    print(f"\n正在向本機 ETA 服務查詢路線 '{bus_name}' ({route_id}) 的站牌數據和到站時間...")
+
+    all_stops_data = []
+    all_estimated_times = {}
+
+    try:
+        result = fetch_eta(route_id, "both")
+        for direction_type, direction in DIRECTION_KEYS.items():
+            stops, estimated_times = stops_from_records(result.stops.get(direction, []), direction_type)
+            all_stops_data.extend(stops)
+            all_estimated_times.update(estimated_times)
+        source = "沿用已開啟的分頁" if result.source == "tab" else "載入頁面"
+        print(f"ETA 服務回應耗時 {result.elapsed:.2f} 秒（{source}）。")
+    except Exception as e:
+        print(f"[錯誤] ETA 服務查詢路線 {bus_name} 失敗：{e}")
+        return [], {}
+
+    print(f"路線 '{bus_name}' 的所有站牌數據和到站時間獲取完成。共 {len(all_stops_data)} 站。")
+    return all_stops_data, all_estimated_times
+
+
+def print_request_stats(driver_instance, label):
+    # 讀取上次呼叫之後 Chrome 發出、擋下的請求數與傳輸量
+    try:
+        stats = chrome_page_stats(driver_instance)
+        print(f"{label}：請求 {stats.requests} 個，擋下 {stats.blocked} 個，傳輸 {stats.bytes_loaded / 1024:.0f} KiB。")
+    except Exception as e:
+        print(f"無法讀取請求統計：{e}")
+
+
 # Selenium 查詢即時站牌資料
 def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
     print(f"\n正在從 ebus.gov.taipei 獲取路線 '{bus_name}' ({route_id}) 的站牌數據和到站時間...")
@@ -94,20 +124,15 @@ def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
         go_button = driver_instance.find_element(By.CSS_SELECTOR, 'a.stationlist-go')
         go_button.click()
         wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#GoDirectionRoute li .auto-list-stationlist-place')))
-        try:
-            wait.until(
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#GoDirectionRoute span.eta_onroad'), '分') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#GoDirectionRoute span.eta_onroad'), '進站中') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#GoDirectionRoute span.auto-list-stationlist-position-time'), '分鐘')
-            )
-            print("去程到站時間已載入。")
-        except Exception as e:
-            print(f"警告：去程到站時間等待超時 ({e})，部分或全部到站時間可能未完全載入。")
-            time.sleep(5)
+        # 等到站名與到站時間都填好即繼續（最多 15 秒）
+        report = selenium_wait_for_stop_list(driver_instance, 'go', timeout=15)
+        if report.ready:
+            print(f"去程到站時間已載入（等待 {report.elapsed:.2f} 秒）。")
+        else:
+            print(f"警告：去程到站時間等待超時（{report.elapsed:.2f} 秒），部分或全部到站時間可能未完全載入。")
 
         go_page_content = driver_instance.page_source
-        go_soup = BeautifulSoup(go_page_content, 'html.parser')
-        go_stops, go_estimated_times = extract_stops_from_soup(go_soup, "去程", route_id)
+        go_stops, go_estimated_times = extract_stops_from_html(go_page_content, "去程", route_id)
         all_stops_data.extend(go_stops)
         all_estimated_times.update(go_estimated_times)
         print(f"去程數據獲取完成。共 {len(go_stops)} 站。")
@@ -117,20 +142,15 @@ def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
         return_button = driver_instance.find_element(By.CSS_SELECTOR, 'a.stationlist-come')
         return_button.click()
         wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#BackDirectionRoute li .auto-list-stationlist-place')))
-        try:
-            wait.until(
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#BackDirectionRoute span.eta_onroad'), '分') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#BackDirectionRoute span.eta_onroad'), '進站中') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#BackDirectionRoute span.auto-list-stationlist-position-time'), '分鐘')
-            )
-            print("返程到站時間已載入。")
-        except Exception as e:
-            print(f"警告：返程到站時間等待超時 ({e})，部分或全部到站時間可能未完全載入。")
-            time.sleep(5)
+        # 等到站名與到站時間都填好即繼續（最多 15 秒）
+        report = selenium_wait_for_stop_list(driver_instance, 'come', timeout=15)
+        if report.ready:
+            print(f"返程到站時間已載入（等待 {report.elapsed:.2f} 秒）。")
+        else:
+            print(f"警告：返程到站時間等待超時（{report.elapsed:.2f} 秒），部分或全部到站時間可能未完全載入。")
 
         return_page_content = driver_instance.page_source
-        return_soup = BeautifulSoup(return_page_content, 'html.parser')
-        return_stops, return_estimated_times = extract_stops_from_soup(return_soup, "返程", route_id)
+        return_stops, return_estimated_times = extract_stops_from_html(return_page_content, "返程", route_id)
         all_stops_data.extend(return_stops)
         all_estimated_times.update(return_estimated_times)
         print(f"返程數據獲取完成。共 {len(return_stops)} 站。")
@@ -140,6 +160,7 @@ def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
         all_stops_data = []
         all_estimated_times = {}
 
+    print_request_stats(driver_instance, f"路線 '{bus_name}' 查詢")
     print(f"路線 '{bus_name}' 的所有站牌數據和到站時間獲取完成。共 {len(all_stops_data)} 站。")
     return all_stops_data, all_estimated_times
 
@@ -220,31 +241,32 @@ if __name__ == "__main__":
     print("歡迎使用台北市公車路線查詢與地圖顯示工具！")
     print("-----------------------------------")
 
-    # 1. 讀取本地 bus_data.csv
+    # 1. 讀取本地 bus_data.csv 的站牌倒排索引（第一次建立後存成 bus_data.stopidx，之後直接載入）
     bus_info_path = r"C:\Users\User\Desktop\cycu_oop_11022101\bus_data.csv"
-    all_routes = {}
-    with open(bus_info_path, newline='', encoding='utf-8-sig') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            route = row['route_name']
-            stop = row['stop_name']
-            if route not in all_routes:
-                all_routes[route] = []
-            all_routes[route].append(stop)
+    route_index = stop_route_index.load_or_build(bus_info_path)
+    all_routes = route_index.routes
 
     # 2. 使用者輸入出發站與目的站
     start_stop = input("請輸入出發站名稱：").strip()
     end_stop = input("請輸入目的站名稱：").strip()
 
-    # 3. 查詢可搭乘之公車路線
-    possible_routes = []
-    for route, stops in all_routes.items():
-        if start_stop in stops and end_stop in stops:
-            possible_routes.append(route)
+    # 3. 查詢可搭乘之公車路線（出發站必須在目的站之前）
+    possible_routes = [route for route, _, _ in route_index.routes_between(start_stop, end_stop)]
 
     if not possible_routes:
-        print("查無同時經過出發站與目的站的公車路線。")
-        exit()
+        # 沒有直達路線時，改用轉乘規劃（最多轉乘 2 次）
+        print("查無同時經過出發站與目的站的公車路線，改為查詢轉乘方案...")
+        journeys = route_graph.from_route_csv(bus_info_path).plan(start_stop, end_stop, max_transfers=2)
+        if not journeys:
+            print("查無轉乘 2 次以內可抵達的方案。")
+            exit()
+
+        for idx, option in enumerate(journeys):
+            print(f"\n方案 {idx+1}：轉乘 {option.transfers} 次，共 {option.stops} 站")
+            for leg in option.legs:
+                print(f"  搭 {leg.route}：{leg.board_stop} → {leg.alight_stop}（{leg.stops} 站）")
+                if leg.route not in possible_routes:
+                    possible_routes.append(leg.route)
 
     print("\n可搭乘的公車路線：")
     for idx, route in enumerate(possible_routes):
@@ -258,7 +280,30 @@ if __name__ == "__main__":
     for idx, stop in enumerate(all_routes[selected_route_name]):
         print(f"{idx+1}. {stop}")
 
-    # 4. 啟動 Selenium，只查詢使用者選定的路線即時到站時間
+    # 路線代碼由本地路線目錄查詢（SQLite 的 data_route_list，或 bus_info_tist.csv），不必再爬路線列表
+    catalogue = route_catalogue(os.path.join(os.path.dirname(bus_info_path), "data"), auto_refresh=False)
+    route_id = catalogue.route_id(selected_route_name)
+    if not route_id and catalogue.is_stale():
+        # 目錄過期時才從網站更新一次再查
+        print("路線目錄中找不到此路線且目錄已過期，正在更新路線目錄...")
+        try:
+            catalogue.refresh()
+        except Exception as e:
+            print(f"更新路線目錄失敗：{e}")
+        route_id = catalogue.route_id(selected_route_name)
+
+    if not route_id:
+        print("找不到該路線的 route_id，無法查詢即時資訊。")
+        exit()
+
+    # 4. 本機 ETA 服務有在執行時直接向它查詢，不必啟動 Chrome
+    if service_available():
+        stops_with_coords, estimated_times_data = get_bus_route_stops_from_service(route_id, selected_route_name)
+        if stops_with_coords:
+            display_bus_route_on_map(selected_route_name, stops_with_coords, None, estimated_times_data)
+            exit()
+
+    # 服務未執行或查詢失敗時，啟動 Selenium，只查詢使用者選定的路線即時到站時間
     print("\n正在啟動 Chrome WebDriver 並查詢即時到站時間...")
     chrome_options = Options()
     chrome_options.add_argument("--disable-gpu")
@@ -268,43 +313,16 @@ if __name__ == "__main__":
     chrome_options.add_argument("--enable-unsafe-swiftshader")
     chrome_options.add_argument("--log-level=OFF")
     chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    # 不載入圖片，並記錄網路事件以統計每頁的請求數
+    add_chrome_blocking_options(chrome_options)
 
     driver = None
     try:
         driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+        # 擋下字型、樣式表、分析與地圖圖磚等爬蟲用不到的請求
+        block_chrome_requests(driver)
         print("WebDriver 已啟動。")
 
-        # 取得 route_id
-        route_id = None
-        driver.get("https://ebus.gov.taipei/ebus")
-        wait_initial = WebDriverWait(driver, 30)
-        wait_initial.until(EC.presence_of_element_located((By.CSS_SELECTOR, "a[data-toggle='collapse'][href*='#collapse']")))
-        time.sleep(2)
-        for i in range(1, 23):
-            try:
-                collapse_link_selector = f"a[href='#collapse{i}']"
-                collapse_link = driver.find_element(By.CSS_SELECTOR, collapse_link_selector)
-                if collapse_link.get_attribute("aria-expanded") == "false" or "collapsed" in collapse_link.get_attribute("class"):
-                    driver.execute_script("arguments[0].click();", collapse_link)
-                    time.sleep(0.5)
-            except Exception:
-                pass
-        time.sleep(3)
-        bus_links = driver.find_elements(By.CSS_SELECTOR, "a[href*='javascript:go']")
-        for link in bus_links:
-            href = link.get_attribute("href")
-            name = link.text.strip()
-            if name == selected_route_name:
-                route_id_match = re.search(r"go\('([^']+)'\)", href)
-                if route_id_match:
-                    route_id = route_id_match.group(1)
-                    break
-
-        if not route_id:
-            print("找不到該路線的 route_id，無法查詢即時資訊。")
-            driver.quit()
-            exit()
-
         # 5. 查詢即時到站時間並顯示地圖
         stops_with_coords, estimated_times_data = get_bus_route_stops_from_ebus(route_id, selected_route_name, driver)
         display_bus_route_on_map(selected_route_name, stops_with_coords, None, estimated_times_data)
@@ -2,8 +2,9 @@ import folium
 import random
 import time
 import webbrowser
-import re
 import csv
+import glob
+import os
 import asyncio # 雖然目前是 Selenium 程式碼，但因為之前有提到 asyncio，保留導入
 
 from selenium import webdriver
@@ -13,77 +14,101 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
 
-# 將抓取站牌數據的邏輯細分為處理單一方向的數據
-def extract_stops_from_soup(soup, direction_type, route_id):
-    stops_with_coords = []
-    # 修改 estimated_times 的鍵，使其包含方向信息
-    estimated_times = {}
+from cycu11022101.ebus_parse import direction_section, iter_stops
+from cycu11022101.ebus_wait import selenium_wait_for_stop_list
+from cycu11022101.eta_client import fetch_eta, service_available
+from cycu11022101.network_map import bus_network
+from cycu11022101.request_filter import add_chrome_blocking_options, block_chrome_requests, chrome_page_stats
+from cycu11022101.route_catalogue import route_catalogue
+
+DATA_FOLDER = "C:/Users/User/Desktop/cycu_oop_11022101/data"
+NETWORK_MAP_FILE = "bus_network_map.html"
 
+DIRECTION_KEYS = {"去程": "go", "返程": "come"}
+
+# 將抓取站牌數據的邏輯細分為處理單一方向的數據
+def extract_stops_from_html(page_content, direction_type, route_id):
+    # 以單次掃描取出站牌（不建立 BeautifulSoup 樹），輸出與原本的 extract_stops_from_soup 相同
     # 根據方向類型找到對應的容器
-    if direction_type == "去程":
-        direction_container = soup.find('div', id='GoDirectionRoute')
-    elif direction_type == "返程":
-        direction_container = soup.find('div', id='BackDirectionRoute')
-    else:
+    direction = DIRECTION_KEYS.get(direction_type)
+    if direction is None:
         print(f"錯誤：未知方向類型 '{direction_type}'。")
         return [], {}
 
-    if not direction_container:
+    if direction_section(page_content, direction) is None:
         print(f"未找到 {direction_type} 方向的內容容器。")
         return [], {}
 
-    # 查找每個站牌的 li 元素
-    all_stop_list_items = direction_container.find_all('li')
+    # 每個站牌的 li 元素對應一筆 stop_record
+    return stops_from_records(list(iter_stops(page_content, direction)), direction_type)
 
-    if not all_stop_list_items:
-        print(f"在 {direction_type} 方向中未找到任何站牌列表項目。")
-        return [], {}
 
-    for item in all_stop_list_items:
-        item_html = str(item)
-
-        stop_name_tag = item.find('span', class_='auto-list-stationlist-place')
-        stop_name = stop_name_tag.get_text().strip() if stop_name_tag else "未知站名"
+def stops_from_records(records, direction_type):
+    # 將 stop_record 轉成地圖與 CSV 使用的站牌資料和到站時間（網頁解析與 ETA 服務共用）
+    stops_with_coords = []
+    # estimated_times 的鍵包含方向信息
+    estimated_times = {}
 
-        stop_id_match = re.search(r'<input[^>]+name="item\.UniStopId"[^>]+value="(\d+)"[^>]*>', item_html)
-        lat_match = re.search(r'<input[^>]+name="item\.Latitude"[^>]+value="([\d\.]+)"[^>]*>', item_html)
-        lon_match = re.search(r'<input[^>]+name="item\.Longitude"[^>]+value="([\d\.]+)"[^>]*>', item_html)
+    if not records:
+        print(f"在 {direction_type} 方向中未找到任何站牌列表項目。")
+        return [], {}
 
-        stop_id = int(stop_id_match.group(1)) if stop_id_match and stop_id_match.group(1).isdigit() else None
-        lat = float(lat_match.group(1)) if lat_match else None
-        lon = float(lon_match.group(1)) if lon_match else None
+    for record in records:
+        stop_name = record.name if record.name is not None else "未知站名"
 
-        if lat is not None and lon is not None:
+        if record.latitude is not None and record.longitude is not None:
             stops_with_coords.append({
                 "name": stop_name,
-                "lat": lat,
-                "lon": lon,
-                "stop_id": stop_id,
+                "lat": record.latitude,
+                "lon": record.longitude,
+                "stop_id": record.stop_id,
                 "direction": direction_type # 添加方向信息
             })
         else:
             print(f"警告：站點 '{stop_name}' 經緯度無效，已跳過。")
 
-        # 抓取到站狀態/時間
-        eta_text = "查無資訊" # 預設值
+        # 抓取到站狀態/時間：優先使用 span.eta_onroad，其次是 auto-list-stationlist-position-time
+        eta_text = record.eta_onroad or (record.arrival_info if record.arrival_kind == "time" else "") or "查無資訊"
 
-        # 優先查找 span.eta_onroad (動態顯示的到站時間，如「約X分」、「進站中」)
-        eta_tag_onroad = item.find('span', class_='eta_onroad')
-        if eta_tag_onroad and eta_tag_onroad.get_text().strip() != '':
-            eta_text = eta_tag_onroad.get_text().strip()
-        else:
-            # 如果沒有找到 eta_onroad 或其內容為空，則嘗試查找 auto-list-stationlist-position-time (靜態顯示的到站時間，如「X分鐘」)
-            eta_tag_static = item.find('span', class_='auto-list-stationlist-position-time')
-            if eta_tag_static and eta_tag_static.get_text().strip() != '':
-                eta_text = eta_tag_static.get_text().strip()
-        
         # 使用組合鍵儲存預估時間，以區分去程和返程的同名站牌
         estimated_times[f"{stop_name}_{direction_type}"] = eta_text
 
     return stops_with_coords, estimated_times
 
+def get_bus_route_stops_from_service(route_id, bus_name):
+    # 向本機 ETA 服務（python -m cycu11022101.eta_service）查詢：瀏覽器與分頁已在服務中預熱，
+    # 查詢時間不含啟動瀏覽器與解析驅動程式
+    print(f"\n正在向本機 ETA 服務查詢路線 '{bus_name}' ({route_id}) 的站牌數據和到站時間...")
+
+    all_stops_data = []
+    all_estimated_times = {}
+
+    try:
+        result = fetch_eta(route_id, "both")
+        for direction_type, direction in DIRECTION_KEYS.items():
+            stops, estimated_times = stops_from_records(result.stops.get(direction, []), direction_type)
+            all_stops_data.extend(stops)
+            all_estimated_times.update(estimated_times)
+        source = "沿用已開啟的分頁" if result.source == "tab" else "載入頁面"
+        print(f"ETA 服務回應耗時 {result.elapsed:.2f} 秒（{source}）。")
+    except Exception as e:
+        print(f"[錯誤] ETA 服務查詢路線 {bus_name} 失敗：{e}")
+        return [], {}
+
+    print(f"路線 '{bus_name}' 的所有站牌數據和到站時間獲取完成。共 {len(all_stops_data)} 站。")
+    return all_stops_data, all_estimated_times
+
+
+def print_request_stats(driver_instance, label):
+    # 讀取上次呼叫之後 Chrome 發出、擋下的請求數與傳輸量
+    try:
+        stats = chrome_page_stats(driver_instance)
+        print(f"{label}：請求 {stats.requests} 個，擋下 {stats.blocked} 個，傳輸 {stats.bytes_loaded / 1024:.0f} KiB。")
+    except Exception as e:
+        print(f"無法讀取請求統計：{e}")
+
+
 # get_bus_route_stops_from_ebus 不再是 async 函數，移除 async 關鍵字
 def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
     print(f"\n正在從 ebus.gov.taipei 獲取路線 '{bus_name}' ({route_id}) 的站牌數據和到站時間...")
@@ -108,20 +133,15 @@ def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
         # 等待去程的站牌列表出現且內容載入
         wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#GoDirectionRoute li .auto-list-stationlist-place')))
         # 增加等待到站時間顯示的條件
-        try:
-            wait.until(
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#GoDirectionRoute span.eta_onroad'), '分') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#GoDirectionRoute span.eta_onroad'), '進站中') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#GoDirectionRoute span.auto-list-stationlist-position-time'), '分鐘')
-            )
-            print("去程到站時間已載入。")
-        except Exception as e:
-            print(f"警告：去程到站時間等待超時 ({e})，部分或全部到站時間可能未完全載入。")
-            time.sleep(5) # 額外給予一些時間，以防萬一
+        # 等到站名與到站時間都填好即繼續（最多 15 秒）
+        report = selenium_wait_for_stop_list(driver_instance, 'go', timeout=15)
+        if report.ready:
+            print(f"去程到站時間已載入（等待 {report.elapsed:.2f} 秒）。")
+        else:
+            print(f"警告：去程到站時間等待超時（{report.elapsed:.2f} 秒），部分或全部到站時間可能未完全載入。")
 
         go_page_content = driver_instance.page_source
-        go_soup = BeautifulSoup(go_page_content, 'html.parser')
-        go_stops, go_estimated_times = extract_stops_from_soup(go_soup, "去程", route_id)
+        go_stops, go_estimated_times = extract_stops_from_html(go_page_content, "去程", route_id)
         all_stops_data.extend(go_stops)
         all_estimated_times.update(go_estimated_times) # 這裡 now all_estimated_times has keys like "站名_去程"
         print(f"去程數據獲取完成。共 {len(go_stops)} 站。")
@@ -133,20 +153,15 @@ def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
         # 等待返程的站牌列表出現且內容載入
         wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#BackDirectionRoute li .auto-list-stationlist-place')))
         # 增加等待到站時間顯示的條件
-        try:
-            wait.until(
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#BackDirectionRoute span.eta_onroad'), '分') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#BackDirectionRoute span.eta_onroad'), '進站中') or
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, '#BackDirectionRoute span.auto-list-stationlist-position-time'), '分鐘')
-            )
-            print("返程到站時間已載入。")
-        except Exception as e:
-            print(f"警告：返程到站時間等待超時 ({e})，部分或全部到站時間可能未完全載入。")
-            time.sleep(5) # 額外給予一些時間，以防萬一
+        # 等到站名與到站時間都填好即繼續（最多 15 秒）
+        report = selenium_wait_for_stop_list(driver_instance, 'come', timeout=15)
+        if report.ready:
+            print(f"返程到站時間已載入（等待 {report.elapsed:.2f} 秒）。")
+        else:
+            print(f"警告：返程到站時間等待超時（{report.elapsed:.2f} 秒），部分或全部到站時間可能未完全載入。")
 
         return_page_content = driver_instance.page_source
-        return_soup = BeautifulSoup(return_page_content, 'html.parser')
-        return_stops, return_estimated_times = extract_stops_from_soup(return_soup, "返程", route_id)
+        return_stops, return_estimated_times = extract_stops_from_html(return_page_content, "返程", route_id)
         all_stops_data.extend(return_stops)
         all_estimated_times.update(return_estimated_times) # 這裡 all_estimated_times has keys like "站名_返程"
         print(f"返程數據獲取完成。共 {len(return_stops)} 站。")
@@ -156,6 +171,7 @@ def get_bus_route_stops_from_ebus(route_id, bus_name, driver_instance):
         all_stops_data = []
         all_estimated_times = {}
 
+    print_request_stats(driver_instance, f"路線 '{bus_name}' 查詢")
     print(f"路線 '{bus_name}' 的所有站牌數據和到站時間獲取完成。共 {len(all_stops_data)} 站。")
     return all_stops_data, all_estimated_times
 
@@ -239,6 +255,27 @@ def display_bus_route_on_map(route_name, stops_data, bus_location=None, estimate
     webbrowser.open(map_filename)
     print("✅ 完成！")
 
+def display_network_map():
+    # 全路網地圖由 BUS_INFO 的站牌 CSV 一次產生：共用站牌合併成一個點、彈出視窗點擊時才建立，
+    # 站牌資料沒有更新就直接打開上次產生的檔案
+    bus_info_folder = os.path.join(DATA_FOLDER, "BUS_INFO")
+    sources = glob.glob(os.path.join(bus_info_folder, "bus_route_*_*.csv"))
+    if not sources:
+        print(f"在 '{bus_info_folder}' 找不到站牌資料，無法繪製全路網地圖。")
+        return
+
+    if not os.path.exists(NETWORK_MAP_FILE) or \
+            os.path.getmtime(NETWORK_MAP_FILE) < max(os.path.getmtime(path) for path in sources):
+        print("\n正在生成全路網地圖...")
+        network = bus_network.from_bus_info_folder(bus_info_folder, os.path.join(DATA_FOLDER, "bus_info_tist.csv"))
+        report = network.save(NETWORK_MAP_FILE)
+        print(f"地圖已保存到 '{report.path}'：{report.stops} 個站牌（合併自 {report.stop_rows} 筆）、"
+              f"{report.routes} 條路線，{report.bytes_written / 1024:.0f} KiB。")
+    else:
+        print(f"站牌資料沒有更新，直接使用 '{NETWORK_MAP_FILE}'。")
+    webbrowser.open(NETWORK_MAP_FILE)
+
+
 def export_stops_to_csv(route_name, stops_data):
     if not stops_data:
         print(f"沒有路線 '{route_name}' 的站牌數據可輸出到 CSV。")
@@ -264,11 +301,19 @@ def export_stops_to_csv(route_name, stops_data):
     except Exception as e:
         print(f"錯誤：輸出 '{csv_filename}' 時發生問題：{e}")
 
+def start_driver(chrome_options):
+    print("正在啟動 Chrome WebDriver...")
+    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
+    # 擋下字型、樣式表、分析與地圖圖磚等爬蟲用不到的請求
+    block_chrome_requests(driver)
+    print("WebDriver 已啟動 (可見模式，用於調試到站時間問題)。")
+    return driver
+
+
 if __name__ == "__main__":
     print("歡迎使用台北市公車路線查詢與地圖顯示工具！")
     print("-----------------------------------")
 
-    print("正在啟動 Chrome WebDriver...")
     chrome_options = Options()
     # 保持註解，以便在可見模式下運行並觀察
     # chrome_options.add_argument("--headless=new") 
@@ -279,57 +324,23 @@ if __name__ == "__main__":
     chrome_options.add_argument("--enable-unsafe-swiftshader")
     chrome_options.add_argument("--log-level=OFF")
     chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    # 不載入圖片，並記錄網路事件以統計每頁的請求數
+    add_chrome_blocking_options(chrome_options)
+
+    # 路線名稱與代碼的對照改由本地路線目錄提供（SQLite 的 data_route_list，或 bus_info_tist.csv），
+    # 目錄過期時才在背景重新抓取，啟動時不再開瀏覽器展開 22 個選單爬整份路線列表
+    catalogue = route_catalogue(DATA_FOLDER)
+    all_bus_routes_data = catalogue.routes()
+    catalogue_age = catalogue.age()
+    if catalogue_age is not None:
+        print(f"已從路線目錄載入 {len(all_bus_routes_data)} 條公車路線（{catalogue_age / 3600:.0f} 小時前更新）。")
+    else:
+        print(f"已從路線目錄載入 {len(all_bus_routes_data)} 條公車路線。")
+    if catalogue.is_stale():
+        print("路線目錄已過期，正在背景更新...")
 
+    # WebDriver 等到第一次查詢路線時才啟動
     driver = None
-    try:
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        print("WebDriver 已啟動 (可見模式，用於調試到站時間問題)。")
-
-        print("正在獲取所有公車路線列表，請稍候...")
-        all_bus_routes_data = []
-
-        driver.get("https://ebus.gov.taipei/ebus")
-        wait_initial = WebDriverWait(driver, 30)
-
-        wait_initial.until(EC.presence_of_element_located((By.CSS_SELECTOR, "a[data-toggle='collapse'][href*='#collapse']")))
-        time.sleep(2)
-
-        for i in range(1, 23): # 這裡的範圍需要根據實際網站的摺疊選單數量調整
-            try:
-                collapse_link_selector = f"a[href='#collapse{i}']"
-                collapse_link = driver.find_element(By.CSS_SELECTOR, collapse_link_selector)
-
-                if collapse_link.get_attribute("aria-expanded") == "false" or "collapsed" in collapse_link.get_attribute("class"):
-                    driver.execute_script("arguments[0].click();", collapse_link)
-                    print(f"已點擊展開 #collapse{i}...")
-                    time.sleep(0.5)
-            except Exception as e:
-                pass # 忽略找不到某些摺疊選單的錯誤
-
-        time.sleep(3) # 給予時間讓所有路線連結載入
-
-        bus_links = driver.find_elements(By.CSS_SELECTOR, "a[href*='javascript:go']")
-        for link in bus_links:
-            href = link.get_attribute("href")
-            name = link.text.strip()
-            if href and name:
-                try:
-                    route_id_match = re.search(r"go\('([^']+)'\)", href)
-                    if route_id_match:
-                        route_id = route_id_match.group(1)
-                        all_bus_routes_data.append({"name": name, "route_id": route_id})
-                    else:
-                        print(f"警告：無法從 {href} 解析 route_id，跳過此連結。")
-                except Exception as e:
-                    print(f"處理連結 {href} 時發生錯誤：{e}，跳過此連結。")
-        print(f"已獲取 {len(all_bus_routes_data)} 條公車路線。")
-
-    except Exception as e:
-        print(f"錯誤：無法獲取公車路線列表或啟動 WebDriver。原因：{e}")
-        print("請檢查您的網路連接或稍後再試。程式將退出。")
-        if driver:
-            driver.quit()
-        exit()
 
     if all_bus_routes_data:
         print("\n--- 可查詢的公車路線列表 ---")
@@ -349,30 +360,40 @@ if __name__ == "__main__":
         print("\n警告：未獲取到任何公車路線資訊。")
 
     while True:
-        route_name_input = input("\n請輸入您想查詢的公車路線號碼 (請輸入完整的名稱，例如: 299, 0東)，或輸入 'exit' 退出: ").strip()
+        route_name_input = input("\n請輸入您想查詢的公車路線號碼 (請輸入完整的名稱，例如: 299, 0東)，輸入 'map' 顯示全路網地圖，或輸入 'exit' 退出: ").strip()
 
         if route_name_input.lower() == 'exit':
             print("感謝使用，再見！")
             break
 
+        if route_name_input.lower() == 'map':
+            display_network_map()
+            continue
+
         if not route_name_input:
             print("輸入不能為空，請重試。")
             continue
 
-        selected_route = None
-        for route in all_bus_routes_data:
-            if route["name"] == route_name_input:
-                selected_route = route
-                break
+        # 背景更新完成後，新路線也查得到
+        route_id = catalogue.route_id(route_name_input)
+        selected_route = {"name": route_name_input, "route_id": route_id} if route_id else None
 
         if not selected_route:
             print(f"找不到路線 '{route_name_input}'，請確認輸入是否正確，或從上方列表中選擇。")
             continue
 
         try:
-            # get_bus_route_stops_from_ebus 不再是 async 函數，直接呼叫
-            stops_with_coords, estimated_times_data = \
-                get_bus_route_stops_from_ebus(selected_route["route_id"], selected_route["name"], driver)
+            # 本機 ETA 服務有在執行時直接向它查詢；否則（或查詢失敗時）才啟動 Chrome
+            stops_with_coords, estimated_times_data = [], {}
+            if service_available():
+                stops_with_coords, estimated_times_data = \
+                    get_bus_route_stops_from_service(selected_route["route_id"], selected_route["name"])
+
+            if not stops_with_coords:
+                if driver is None:
+                    driver = start_driver(chrome_options)
+                stops_with_coords, estimated_times_data = \
+                    get_bus_route_stops_from_ebus(selected_route["route_id"], selected_route["name"], driver)
 
             if not stops_with_coords:
                 print(f"無法獲取路線 '{selected_route['name']}' 的站牌數據，無法繪製地圖。")
@@ -1,26 +1,20 @@
-import glob
-import os
-import csv
+from cycu11022101.ebus_merge import merge_bus_info_folder
 
-def merge_all_bus_info_csv():
+def merge_all_bus_info_csv(full=False):
     input_folder = "data/BUS_INFO"
-    output_file = "data/merged_bus_info.csv"
-    csv_files = glob.glob(os.path.join(input_folder, "*.csv"))
-    header_saved = False
-
-    with open(output_file, "w", newline="", encoding="utf-8") as fout:
-        writer = None
-        for file in csv_files:
-            with open(file, "r", encoding="utf-8") as fin:
-                reader = csv.reader(fin)
-                header = next(reader)
-                if not header_saved:
-                    writer = csv.writer(fout)
-                    writer.writerow(header)
-                    header_saved = True
-                for row in reader:
-                    writer.writerow(row)
-    print(f"所有CSV已合併到 {output_file}")
+    # 合併進 data/hermes_ebus_taipei.sqlite3 的 data_route_info_busstop 表（保留 route_id 與方向）
+    # 只重新讀取自上次合併後有變動的檔案；full=True 則全部重讀
+    report = merge_bus_info_folder(input_folder, "data", full=full)
+    print(f"掃描 {report.scanned} 個 CSV：合併 {report.merged} 個、未變動 {report.unchanged} 個、"
+          f"移除 {report.removed} 個，寫入 {report.rows} 筆站牌（{report.elapsed:.2f} 秒）")
+    if report.skipped_rows:
+        print(f"警告：{report.skipped_rows} 筆資料欄位格式錯誤，已跳過。")
+    if report.duplicate_rows:
+        print(f"警告：{len(report.duplicate_files)} 個 CSV 有重複的站序，{report.duplicate_rows} 筆只保留第一筆：")
+        for path in report.duplicate_files:
+            print(f"  {path}")
 
 # 使用方式：呼叫 merge_all_bus_info_csv()
-merge_all_bus_info_csv()
\ No newline at end of file
+# 多行程讀檔需要 __main__ 保護，否則 Windows 上子行程會重複執行本檔
+if __name__ == "__main__":
+    merge_all_bus_info_csv()
@@ -1,16 +1,41 @@
 # -*- coding: utf-8 -*-
 import os
 import csv
+import asyncio
+import argparse
+import glob
+import multiprocessing
+from urllib.parse import urlparse
 from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
+import pandas as pd
 import time
 
+from cycu11022101.crawl_planner import DEFAULT_TTL, crawl_planner
+from cycu11022101.ebus_db import get_engine
+from cycu11022101.eta import append_eta_observations
+from cycu11022101.ebus_merge import merge_bus_info_folder
+from cycu11022101.fetch_scheduler import fetch_scheduler
+from cycu11022101.request_filter import filter_stats, request_filter
+from cycu11022101.snapshot_store import get_store, has_store, snapshot_store
+from cycu11022101.ebus_wait import (
+    wait_for_route_links, wait_for_stop_list, async_wait_for_route_links, async_wait_for_stop_list
+)
+
+
+ROUTE_URL = 'https://ebus.gov.taipei/Route/StopsOfRoute?routeid={routeid}'
+
 
 class BusRouteInfo:
-    def __init__(self, routeid: str, direction: str = 'go'):
+    def __init__(self, routeid: str, direction: str = 'go', planner: crawl_planner = None,
+                 scheduler: fetch_scheduler = None):
         self.rid = routeid
+        self.planner = planner
+        self.scheduler = scheduler or fetch_scheduler()
         self.content = None
-        self.url = f'https://ebus.gov.taipei/Route/StopsOfRoute?routeid={routeid}'
+        self.wait_report = None
+        self.url = ROUTE_URL.format(routeid=routeid)
 
         if direction not in ['go', 'come']:
             raise ValueError("Direction must be 'go' or 'come'")
@@ -21,12 +46,22 @@ class BusRouteInfo:
         self.output = self._parse_and_save_to_csv()
 
     def _fetch_content(self):
-        retries = 3  # 最大重試次數
-        while retries > 0:
-            try:
-                with sync_playwright() as p:
-                    browser = p.chromium.launch(headless=True)
+        # 失敗時由排程器以指數退避重試，網站持續失敗時斷路器會暫停所有抓取
+        self.content = self.scheduler.call(self._fetch_once, (self.rid, self.direction))
+
+        if not self.content:
+            print(f"無法抓取公車代碼 {self.rid} 的資料，方向: {self.direction}")
+
+        save_html_snapshot(self.content, self.rid, self.direction)
+
+    def _fetch_once(self, job: tuple) -> str:
+        try:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=True)
+                try:
                     page = browser.new_page()
+                    # 不載入圖片、字型、樣式表與第三方請求（分析、地圖圖磚）
+                    page_filter = request_filter().install(page)
                     page.goto(self.url)
 
                     if self.direction == 'come':
@@ -35,114 +70,468 @@ class BusRouteInfo:
 
                     # 等待站點資訊載入完成
                     page.wait_for_selector('.auto-list-stationlist', timeout=10000)
-                    time.sleep(5)  # 等待 5 秒以確保載入完成
-                    self.content = page.content()
+                    # 等到站名與到站時間都填好即繼續（最多 10 秒）
+                    self.wait_report = wait_for_stop_list(page, self.direction)
+                    print(f"等待到站時間 {self.wait_report.elapsed:.2f} 秒 ({self.wait_report.signal})")
+                    print_page_stats(page_filter.measure(page))
+                    return page.content()
+                finally:
                     browser.close()
-                    break  # 成功抓取後跳出重試迴圈
-            except Exception as e:
-                print(f"等待目標元素時發生錯誤: {e}")
-                retries -= 1
-                time.sleep(5)  # 等待 5 秒後重試
+        except Exception as e:
+            print(f"等待目標元素時發生錯誤: {e}")
+            raise
 
-        if not self.content:
-            print(f"無法抓取公車代碼 {self.rid} 的資料，方向: {self.direction}")
+    def _parse_and_save_to_csv(self):
+        return parse_and_save_to_csv(self.content, self.rid, self.direction, self.planner)
 
-        # 儲存 HTML 內容到檔案（除錯用）
-        os.makedirs("data", exist_ok=True)  # 確保資料夾存在
-        with open(f"data/ebus_taipei_{self.rid}_{self.direction}.html", "w", encoding="utf-8") as file:
-            file.write(self.content or "")
 
-    def _parse_and_save_to_csv(self):
-        # 使用 BeautifulSoup 解析 HTML
-        soup = BeautifulSoup(self.content, 'html.parser') if self.content else None
-        stops = []
+def save_html_snapshot(content: str, rid: str, direction: str):
+    """
+    將 HTML 內容存入 data/ebus_snapshots.sqlite3 快照庫（壓縮、重複內容只存一次）。
+    """
+    if not content:
+        return
+    os.makedirs("data", exist_ok=True)  # 確保資料夾存在
+    get_store("data").put(rid, direction, content)
 
-        if not soup:
-            return "無法解析 HTML 內容，請檢查網頁結構或連線問題。"
 
-        # 根據提供的 HTML 結構，選擇站點資訊
-        stop_elements = soup.select('.auto-list-stationlist')  # 修改選擇器以符合實際網站結構
-        if not stop_elements:
-            return "無法找到站點資訊，請檢查選擇器或網站結構。"
+def parse_route_ids(content: str) -> list:
+    """
+    從公車首頁 HTML 中取出所有公車代碼。
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    route_links = soup.select('a[href^="javascript:go"]')
+    return [link['href'].split("'")[1] for link in route_links]
 
-        for stop in stop_elements:
-            try:
-                # 提取站點資訊
-                arrival_info = stop.select_one('.auto-list-stationlist-position').text.strip()
-                if not arrival_info:  # 如果沒有到達時間，跳過該站點
-                    continue
-
-                if "進站中" in arrival_info:
-                    arrival_info = "進站中"
-                elif "尚未發車" in arrival_info:
-                    arrival_info = "尚未發車"
-
-                stop_number = stop.select_one('.auto-list-stationlist-number').text.strip()  # 車站序號
-                stop_name = stop.select_one('.auto-list-stationlist-place').text.strip()  # 車站名稱
-                stop_id = stop.select_one('input[name="item.UniStopId"]')['value']  # 車站編號
-                latitude = stop.select_one('input[name="item.Latitude"]')['value']  # 緯度
-                longitude = stop.select_one('input[name="item.Longitude"]')['value']  # 經度
-
-                stops.append([arrival_info, stop_number, stop_name, stop_id, latitude, longitude])
-            except AttributeError:
-                # 不顯示錯誤訊息，直接跳過
+
+def parse_stops(content: str) -> list:
+    """
+    解析站點資訊，回傳 [到達時間, 車站序號, 車站名稱, 車站編號, 緯度, 經度] 清單；
+    HTML 無法解析或找不到站點元素時回傳 None。
+    """
+    # 使用 BeautifulSoup 解析 HTML
+    soup = BeautifulSoup(content, 'html.parser') if content else None
+    stops = []
+
+    if not soup:
+        return None
+
+    # 根據提供的 HTML 結構，選擇站點資訊
+    stop_elements = soup.select('.auto-list-stationlist')  # 修改選擇器以符合實際網站結構
+    if not stop_elements:
+        return None
+
+    for stop in stop_elements:
+        try:
+            # 提取站點資訊
+            arrival_info = stop.select_one('.auto-list-stationlist-position').text.strip()
+            if not arrival_info:  # 如果沒有到達時間，跳過該站點
                 continue
 
-        # 確保資料夾存在
-        os.makedirs("data/BUS_INFO", exist_ok=True)
+            if "進站中" in arrival_info:
+                arrival_info = "進站中"
+            elif "尚未發車" in arrival_info:
+                arrival_info = "尚未發車"
+
+            stop_number = stop.select_one('.auto-list-stationlist-number').text.strip()  # 車站序號
+            stop_name = stop.select_one('.auto-list-stationlist-place').text.strip()  # 車站名稱
+            stop_id = stop.select_one('input[name="item.UniStopId"]')['value']  # 車站編號
+            latitude = stop.select_one('input[name="item.Latitude"]')['value']  # 緯度
+            longitude = stop.select_one('input[name="item.Longitude"]')['value']  # 經度
 
-        # 將資料寫入 CSV
-        csv_filename = f"data/BUS_INFO/bus_route_{self.rid}_{self.direction}.csv"
-        with open(csv_filename, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["arrival_info", "stop_number", "stop_name", "stop_id", "latitude", "longitude"])
-            writer.writerows(stops)
+            stops.append([arrival_info, stop_number, stop_name, stop_id, latitude, longitude])
+        except AttributeError:
+            # 不顯示錯誤訊息，直接跳過
+            continue
 
-        output = [f"資料已儲存至 {csv_filename}"]
-        for stop in stops:
-            output.append(f"公車到達時間: {stop[0]}, 車站序號: {stop[1]}, 車站名稱: {stop[2]}, 車站編號: {stop[3]}, 緯度: {stop[4]}, 經度: {stop[5]}")
-        return "\n".join(output)
+    return stops
 
 
-def fetch_all_routes():
+def save_stops_to_csv(stops: list, rid: str, direction: str, working_directory: str = "data") -> str:
     """
-    從網站中抓取所有公車代碼，並依序讀取每個公車代碼的車站資料。
+    將站點清單寫入 {working_directory}/BUS_INFO/bus_route_{rid}_{direction}.csv，回傳檔名。
+    """
+    # 確保資料夾存在
+    bus_info_folder = os.path.join(working_directory, "BUS_INFO")
+    os.makedirs(bus_info_folder, exist_ok=True)
+
+    # 將資料寫入 CSV
+    csv_filename = os.path.join(bus_info_folder, f"bus_route_{rid}_{direction}.csv")
+    with open(csv_filename, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["arrival_info", "stop_number", "stop_name", "stop_id", "latitude", "longitude"])
+        writer.writerows(stops)
+    return csv_filename
+
+
+def record_etas(stops: list, rid: str, direction: str, observed_at: float = None) -> int:
+    """
+    將站點的到站時間正規化為狀態與秒數，附加到當日的 ETA 時間序列表（data_eta_YYYYMMDD），回傳筆數。
+    """
+    frame = pd.DataFrame(stops, columns=["arrival_info", "stop_number", "stop_name", "stop_id", "latitude", "longitude"])
+    frame = frame[frame["stop_number"].str.isdigit() & frame["stop_id"].str.isdigit()].assign(
+        route_id=rid, direction=direction
+    )
+    return append_eta_observations(get_engine("data"), frame, observed_at)
+
+
+def parse_and_save_to_csv(content: str, rid: str, direction: str, planner: crawl_planner = None) -> str:
+    """
+    解析站點資訊並寫入 data/BUS_INFO/bus_route_{rid}_{direction}.csv，回傳輸出訊息。
+    有 planner 時記錄這次抓取的結果；站點與上次相同且 CSV 已存在則不重寫。
+    到站時間每次都會變，不論站點是否變更都附加到 ETA 時間序列表。
+    """
+    if not content:
+        if planner:
+            planner.record_failure(rid, direction, "無法抓取 HTML 內容")
+        return "無法解析 HTML 內容，請檢查網頁結構或連線問題。"
+
+    stops = parse_stops(content)
+    if stops is None:
+        if planner:
+            planner.record_failure(rid, direction, "找不到站點資訊")
+        return "無法找到站點資訊，請檢查選擇器或網站結構。"
+
+    record_etas(stops, rid, direction)
+
+    csv_filename = f"data/BUS_INFO/bus_route_{rid}_{direction}.csv"
+    if planner and not planner.record_success(rid, direction, stops) and os.path.exists(csv_filename):
+        return f"站點未變更，略過寫入 {csv_filename}"
+
+    csv_filename = save_stops_to_csv(stops, rid, direction)
+
+    output = [f"資料已儲存至 {csv_filename}"]
+    for stop in stops:
+        output.append(f"公車到達時間: {stop[0]}, 車站序號: {stop[1]}, 車站名稱: {stop[2]}, 車站編號: {stop[3]}, 緯度: {stop[4]}, 經度: {stop[5]}")
+    return "\n".join(output)
+
+
+def plan_crawl(route_ids: list, planner: crawl_planner, full: bool = False) -> list:
+    """
+    依抓取紀錄決定要抓的 (公車代碼, 方向)：從未抓過、上次失敗或超過 TTL 的才抓；full 時全部重抓。
+    """
+    planner.seed_from_folder("data/BUS_INFO")  # 舊有的 CSV 視為在檔案修改時間抓取成功
+    if full:
+        return [(routeid, direction) for routeid in route_ids for direction in ['go', 'come']]
+
+    jobs = planner.plan(route_ids)
+    reasons = {}
+    for job in jobs:
+        reasons[job.reason] = reasons.get(job.reason, 0) + 1
+    print(f"共 {len(route_ids) * 2} 個路線方向，需抓取 {len(jobs)} 個"
+          f"（新路線 {reasons.get('new', 0)}、上次失敗 {reasons.get('failed', 0)}、過期 {reasons.get('stale', 0)}）")
+    return [(job.route_id, job.direction) for job in jobs]
+
+
+def print_page_stats(stats: filter_stats, label: str = ''):
+    """
+    印出單一頁面的請求數、被擋下的請求數與實際傳輸的位元組數。
+    """
+    print(f"請求 {stats.requests} 個，擋下 {stats.blocked} 個 {stats.blocked_by_reason}，"
+          f"傳輸 {stats.bytes_loaded / 1024:.0f} KiB{label}")
+
+
+def print_schedule_report(scheduler: fetch_scheduler):
+    """
+    印出抓取排程的統計；仍失敗的路線方向留在抓取紀錄中，下次執行時會再抓。
+    """
+    report = scheduler.report()
+    print(f"抓取 {report.jobs} 次（成功 {report.succeeded}，嘗試 {report.attempts} 次），"
+          f"斷路器觸發 {report.breaker_trips} 次，退避等待 {report.waited:.1f} 秒，"
+          f"最後仍失敗 {len(scheduler.dead_letters)} 個路線方向。")
+
+
+def fetch_all_routes(ttl: float = DEFAULT_TTL, full: bool = False):
+    """
+    從網站中抓取所有公車代碼，並依序讀取需要更新的公車代碼的車站資料。
+
+    Args:
+        ttl (float): 成功抓取後經過幾秒才重新抓取。
+        full (bool): 忽略抓取紀錄，全部重抓。
     """
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
         page = browser.new_page()
+        page_filter = request_filter().install(page)
         page.goto("https://ebus.gov.taipei/ebus")
 
         try:
             # 等待公車代碼載入完成
-            page.wait_for_selector('a[href^="javascript:go"]', timeout=10000)
-            time.sleep(5)  # 等待 5 秒以確保載入完成
+            report = wait_for_route_links(page)
+            print(f"等待公車代碼 {report.elapsed:.2f} 秒 ({report.signal})")
+            print_page_stats(page_filter.measure(page))
 
             # 抓取所有公車代碼
-            soup = BeautifulSoup(page.content(), 'html.parser')
-            route_links = soup.select('a[href^="javascript:go"]')
-            route_ids = [link['href'].split("'")[1] for link in route_links]
+            route_ids = parse_route_ids(page.content())
         except Exception as e:
             print(f"抓取公車代碼時發生錯誤: {e}")
             route_ids = []
         finally:
             browser.close()
 
-    # 依序讀取每個公車代碼的車站資料
-    for routeid in route_ids:
-        for direction in ['go', 'come']:
-            csv_filename = f"data/BUS_INFO/bus_route_{routeid}_{direction}.csv"
-            if os.path.exists(csv_filename):
-                print(f"檔案 {csv_filename} 已存在，跳過抓取。")
-                continue
-
+    # 依序讀取需要更新的公車代碼的車站資料；重試用盡的工作在最後再試一輪
+    planner = crawl_planner("data", ttl=ttl)
+    scheduler = fetch_scheduler()
+    jobs = plan_crawl(route_ids, planner, full)
+    for round_jobs in (jobs, None):
+        if round_jobs is None:
+            round_jobs = scheduler.take_dead_letters()
+            if round_jobs:
+                print(f"重新嘗試 {len(round_jobs)} 個抓取失敗的路線方向")
+        for routeid, direction in round_jobs:
             try:
                 print(f"正在處理公車代碼: {routeid}, 方向: {direction}")
-                bus_route = BusRouteInfo(routeid, direction)  # 使用 BusRouteInfo 類別
+                bus_route = BusRouteInfo(routeid, direction, planner, scheduler)  # 使用 BusRouteInfo 類別
                 print(bus_route.output)
             except Exception as e:
                 print(f"處理公車代碼 {routeid} 時發生錯誤: {e}")
+                planner.record_failure(routeid, direction, str(e))
+    print_schedule_report(scheduler)
+
+
+class HostRateLimiter:
+    """
+    每個主機的請求速率限制：同一主機兩次請求之間至少間隔 1 / rate_per_second 秒。
+    """
+
+    def __init__(self, rate_per_second: float = 2.0):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url: str):
+        host = urlparse(url).netloc
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def _fetch_route_content_async(page, routeid: str, direction: str, limiter: HostRateLimiter,
+                                     scheduler: fetch_scheduler, page_filter: request_filter = None):
+    """
+    以非同步頁面讀取單一路線與方向的 HTML，失敗時由排程器退避重試；重試用盡時回傳 None。
+    若有 page_filter，每次載入後印出該頁的請求統計。
+    """
+    url = ROUTE_URL.format(routeid=routeid)
+
+    async def attempt(job: tuple) -> str:
+        try:
+            if page_filter is not None:
+                page_filter.reset()
+            await limiter.wait(url)
+            await page.goto(url)
+
+            if direction == 'come':
+                # 切換到返程
+                await page.click('a.stationlist-come-go-gray.stationlist-come')
+
+            # 等待站點資訊載入完成
+            await page.wait_for_selector('.auto-list-stationlist', timeout=10000)
+            # 等到站名與到站時間都填好即繼續（最多 10 秒）
+            report = await async_wait_for_stop_list(page, direction)
+            print(f"等待到站時間 {report.elapsed:.2f} 秒 ({report.signal}): {routeid}, {direction}")
+            if page_filter is not None:
+                print_page_stats(await page_filter.measure_async(page), f": {routeid}, {direction}")
+            return await page.content()
+        except Exception as e:
+            print(f"等待目標元素時發生錯誤 ({routeid}, {direction}): {e}")
+            raise
+
+    return await scheduler.call_async(attempt, (routeid, direction))
+
+
+async def fetch_all_routes_async(concurrency: int = 4, rate_per_second: float = 2.0, queue_size: int = 64,
+                                 ttl: float = DEFAULT_TTL, full: bool = False):
+    """
+    以 asyncio 同時抓取需要更新的公車代碼的車站資料，輸出格式與 fetch_all_routes 相同。
+
+    Args:
+        concurrency (int): 同時運作的頁面（worker）數量。
+        rate_per_second (float): 對同一主機每秒最多發出的頁面請求數。
+        queue_size (int): (routeid, direction) 工作佇列的最大長度。
+        ttl (float): 成功抓取後經過幾秒才重新抓取。
+        full (bool): 忽略抓取紀錄，全部重抓。
+    """
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            page = await browser.new_page()
+            page_filter = await request_filter().install_async(page)
+            await page.goto("https://ebus.gov.taipei/ebus")
+            try:
+                # 等待公車代碼載入完成
+                report = await async_wait_for_route_links(page)
+                print(f"等待公車代碼 {report.elapsed:.2f} 秒 ({report.signal})")
+                print_page_stats(await page_filter.measure_async(page))
+                route_ids = parse_route_ids(await page.content())
+            except Exception as e:
+                print(f"抓取公車代碼時發生錯誤: {e}")
+                route_ids = []
+            finally:
+                await page.close()
+
+            planner = crawl_planner("data", ttl=ttl)
+            scheduler = fetch_scheduler()
+            jobs = plan_crawl(route_ids, planner, full)
+            queue = asyncio.Queue(maxsize=queue_size)
+            limiter = HostRateLimiter(rate_per_second)
+            started = time.perf_counter()
+            done = 0
+
+            async def producer(jobs: list):
+                for job in jobs:
+                    await queue.put(job)  # 佇列已滿時在此等待
+                for _ in range(concurrency):
+                    await queue.put(None)
+
+            async def worker():
+                nonlocal done
+                context = await browser.new_context()
+                page = await context.new_page()
+                # 每個 worker 的頁面各自擋下圖片、字型、樣式表與第三方請求
+                page_filter = await request_filter().install_async(page)
+                try:
+                    while True:
+                        job = await queue.get()
+                        if job is None:
+                            break
+                        routeid, direction = job
+                        try:
+                            print(f"正在處理公車代碼: {routeid}, 方向: {direction}")
+                            content = await _fetch_route_content_async(page, routeid, direction, limiter, scheduler,
+                                                                       page_filter)
+                            if not content:
+                                print(f"無法抓取公車代碼 {routeid} 的資料，方向: {direction}")
+                            save_html_snapshot(content, routeid, direction)
+                            print(parse_and_save_to_csv(content, routeid, direction, planner))
+                        except Exception as e:
+                            # 單一路線出錯只記錄失敗，worker 繼續處理佇列中的其他工作
+                            print(f"處理公車代碼 {routeid} 時發生錯誤: {e}")
+                            planner.record_failure(routeid, direction, str(e))
+                        done += 1
+                finally:
+                    await context.close()
+
+            await asyncio.gather(producer(jobs), *(worker() for _ in range(concurrency)))
+
+            # 重試用盡的工作在最後再試一輪
+            dead_letters = scheduler.take_dead_letters()
+            if dead_letters:
+                print(f"重新嘗試 {len(dead_letters)} 個抓取失敗的路線方向")
+                await asyncio.gather(producer(dead_letters), *(worker() for _ in range(concurrency)))
+        finally:
+            await browser.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"共處理 {done} 個路線方向，耗時 {elapsed:.1f} 秒。")
+    print_schedule_report(scheduler)
+
+
+_reparse_store = None
+_reparse_directory = "data"
+
+
+def _init_reparse_worker(working_directory: str):
+    # 每個子行程各自開啟快照庫，不共用父行程的 SQLite 連線；CSV 寫回同一個資料夾的 BUS_INFO
+    global _reparse_store, _reparse_directory
+    _reparse_store = snapshot_store(working_directory) if has_store(working_directory) else None
+    _reparse_directory = working_directory
+
+
+def _reparse_one(job: tuple) -> tuple:
+    """
+    子行程：讀取一個快照並重新解析寫入 CSV，回傳 (routeid, direction, 站數)；失敗時站數為 None。
+    """
+    routeid, direction, html_path = job
+    try:
+        if html_path:
+            with open(html_path, "r", encoding="utf-8") as file:
+                content = file.read()
+        else:
+            content = _reparse_store.read(routeid, direction)
+
+        stops = parse_stops(content) if content else None
+        if stops is None:
+            return routeid, direction, None
+        save_stops_to_csv(stops, routeid, direction, _reparse_directory)
+        return routeid, direction, len(stops)
+    except Exception:
+        return routeid, direction, None
+
+
+def reparse_snapshots(working_directory: str = "data", workers: int = None, update_database: bool = True) -> dict:
+    """
+    不連網路，以多行程重新解析已存的快照（快照庫中每個路線方向的最新一筆，
+    以及快照庫沒有的 ebus_taipei_{rid}_{direction}.html），重建 data/BUS_INFO 的 CSV，
+    並可選擇更新 SQLite 資料表。
+
+    Args:
+        working_directory (str): 存放快照與資料庫的資料夾。
+        workers (int): 子行程數量，預設為 CPU 核心數。
+        update_database (bool): 是否將重建的 CSV 合併進 data_route_info_busstop。
+
+    Returns:
+        dict: pages（處理頁數）、parsed（成功）、failed（失敗）、elapsed（秒）、pages_per_second。
+    """
+    jobs = {}
+    if has_store(working_directory):
+        for routeid, direction, _ in snapshot_store(working_directory).latest_snapshots():
+            jobs[(routeid, direction)] = None
+    for html_path in glob.glob(os.path.join(working_directory, "ebus_taipei_*_*.html")):
+        routeid, _, direction = os.path.basename(html_path)[len("ebus_taipei_"):-len(".html")].rpartition("_")
+        if direction in ("go", "come") and (routeid, direction) not in jobs and os.path.getsize(html_path) > 0:
+            jobs[(routeid, direction)] = html_path
+
+    started = time.perf_counter()
+    parsed = failed = 0
+    with multiprocessing.Pool(workers, initializer=_init_reparse_worker, initargs=(working_directory,)) as pool:
+        tasks = [(routeid, direction, html_path) for (routeid, direction), html_path in sorted(jobs.items())]
+        for routeid, direction, count in pool.imap_unordered(_reparse_one, tasks, chunksize=8):
+            if count is None:
+                failed += 1
+                print(f"無法解析公車代碼 {routeid} 的快照，方向: {direction}")
+            else:
+                parsed += 1
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "pages": len(jobs),
+        "parsed": parsed,
+        "failed": failed,
+        "elapsed": elapsed,
+        "pages_per_second": len(jobs) / elapsed if elapsed > 0 else 0.0,
+    }
+    print(f"重新解析 {result['pages']} 頁（成功 {parsed}，失敗 {failed}），"
+          f"耗時 {elapsed:.1f} 秒，{result['pages_per_second']:.1f} 頁/秒。")
+
+    if update_database:
+        report = merge_bus_info_folder(os.path.join(working_directory, "BUS_INFO"), working_directory, workers=workers)
+        print(f"資料庫已更新：合併 {report.merged} 個 CSV，寫入 {report.rows} 筆站牌（{report.elapsed:.1f} 秒）。")
+        if report.duplicate_rows:
+            print(f"警告：{len(report.duplicate_files)} 個 CSV 有重複的站序，{report.duplicate_rows} 筆只保留第一筆。")
+    return result
 
 
 if __name__ == "__main__":
-    fetch_all_routes()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="抓取台北市公車所有路線的車站資料")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="使用 asyncio 同時抓取")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時運作的頁面數量")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒對 ebus 主機的最大請求數")
+    parser.add_argument("--queue-size", type=int, default=64, help="工作佇列的最大長度")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL / 3600, help="成功抓取後經過幾小時才重新抓取")
+    parser.add_argument("--full", action="store_true", help="忽略抓取紀錄，全部重抓")
+    parser.add_argument("--reparse", action="store_true", help="不連網路，重新解析已存的快照並重建 CSV 與資料庫")
+    parser.add_argument("--workers", type=int, default=None, help="重新解析時的子行程數量（預設為 CPU 核心數）")
+    parser.add_argument("--no-db", action="store_true", help="重新解析時不更新 SQLite 資料表")
+    args = parser.parse_args()
+
+    if args.reparse:
+        reparse_snapshots(workers=args.workers, update_database=not args.no_db)
+    elif args.use_async:
+        asyncio.run(fetch_all_routes_async(args.concurrency, args.rate, args.queue_size, args.ttl * 3600, args.full))
+    else:
+        fetch_all_routes(args.ttl * 3600, args.full)